@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+数值子表达式融合的性能对比: 逐个运算生成整列中间结果、按块调用原方法与 numexpr (已安装时)
+
+    python -m benchmarks.fusion
+"""
+import time
+
+import numpy as np
+import vaex
+
+from dataframe_formulas import Parser
+from dataframe_formulas.fusion import FusedExpression, numexpr
+from dataframe_formulas.plan import Plan
+
+FORMULAS = [
+    "=(a * 0.3 + b * 0.2 - c) / d ^ 2",
+    "=a * 0.31 + b * 0.22 + c * 0.17 + ABS(d - 0.5) * 0.3 - 1.5",
+    "=(a - b) / (ABS(c) + 1) > 0.2",
+    "=LN(ABS(a) + 1) * 0.4 + EXP(b / 10) - LOG10(ABS(c) + 2)",
+]
+
+
+def timeit(parser, formula, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parser.run(formula)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(parser, formula, mode):
+    Plan.fusion_class = FusedExpression if mode else None
+    FusedExpression.use_numexpr = mode == "numexpr"
+    parser.ast_cache.clear()
+    return timeit(parser, formula)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    modes = ["tiles"] + (["numexpr"] if numexpr is not None else [])
+    print("{:>10} {:>8} {:>12} {}".format("rows", "formula", "unfused(s)", " ".join("%12s" % m for m in modes)))
+    for rows in (1000000, 5000000):
+        df = vaex.from_arrays(**{k: rng.normal(0, 1, rows) for k in "abcd"})
+        parser = Parser(df=df, custom_var_map={})
+        for i, formula in enumerate(FORMULAS):
+            times = [run(parser, formula, m) for m in [None] + modes]
+            print("{:>10} {:>8} {}".format(rows, i, " ".join("%12.4f" % t for t in times)))
+    Plan.fusion_class, FusedExpression.use_numexpr = FusedExpression, numexpr is not None
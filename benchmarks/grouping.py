@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+条件聚合与分组聚合的性能对比: 逐元素判断条件与向量化的条件掩码, vaex groupby 后 join 回各行与按字典编码分组
+
+    python -m benchmarks.grouping
+"""
+import time
+
+import numpy as np
+import pyarrow as pa
+import vaex
+
+from dataframe_formulas import Parser
+from dataframe_formulas.functions import criteria_mask, parse_criteria
+from dataframe_formulas.functions.operators import LOGIC_OPERATORS
+
+CONDITIONS = ['>0.5', '<>org7', 'org1*']
+
+
+def legacy_mask(values, condition):
+    # 旧 xfilter 的逐元素判断
+    operator, condition = parse_criteria(condition)
+    if hasattr(condition, 'fullmatch'):
+        return np.vectorize(lambda v: isinstance(v, str) and bool(condition.fullmatch(v)), otypes=[bool])(values)
+    operator = LOGIC_OPERATORS[operator]
+    return np.vectorize(lambda v: type(v) is type(condition) and operator(v, condition), otypes=[bool])(values)
+
+
+def vaex_groupsum(df):
+    groups = df.groupby('org', agg={'total': vaex.agg.sum('amount')})
+    return df.join(groups, on='org', rsuffix='_group')['total'].to_numpy()
+
+
+def timeit(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print("{:>10} {:>22} {:>12} {:>12} {:>8}".format("rows", "case", "legacy(s)", "new(s)", "speedup"))
+    for rows in (1000000, 5000000):
+        orgs = np.array(['org%d' % i for i in range(1000)], object)[rng.integers(0, 1000, rows)]
+        amount = rng.random(rows)
+        for condition, values in zip(CONDITIONS, [amount, orgs, orgs]):
+            assert np.array_equal(legacy_mask(values, condition), criteria_mask(values, condition))
+            old = timeit(legacy_mask, values, condition, repeat=1)
+            new = timeit(criteria_mask, values, condition)
+            print("{:>10} {:>22} {:>12.4f} {:>12.4f} {:>8.1f}".format(rows, condition, old, new, old / new))
+        df = vaex.from_arrays(org=pa.array(orgs), amount=amount)
+        parser = Parser(df=df, custom_var_map={})
+        for formula in ('=COUNTIF(org, "org1*")', '=GROUPSUM(amount, org)'):
+            # 首次计算含字典编码, 之后复用 Parser 缓存的编码
+            first, new = timeit(parser.run, formula, repeat=1), timeit(parser.run, formula)
+            name = formula[1:formula.index('(')] + " first/cached"
+            print("{:>10} {:>22} {:>12.4f} {:>12.4f} {:>8.1f}".format(rows, name, first, new, first / new))
+        assert np.allclose(np.sort(vaex_groupsum(df)), np.sort(parser.run('=GROUPSUM(amount, org)')))
+        old, new = timeit(vaex_groupsum, df, repeat=1), timeit(parser.run, '=GROUPSUM(amount, org)')
+        print("{:>10} {:>22} {:>12.4f} {:>12.4f} {:>8.1f}".format(rows, "vaex groupby+join", old, new, old / new))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+归约方法性能对比: 逐行 SUM 与旧实现 xsum, 整列聚合读取整列后由 numpy 计算与 vaex 并行聚合
+
+    python -m benchmarks.reductions
+"""
+import time
+
+import numpy as np
+import vaex
+
+from dataframe_formulas.functions import REGISTRY, wrap_func
+from dataframe_formulas.functions import math as xmath
+
+LEGACY_SUM = wrap_func(xmath.xsum)
+AGGREGATORS = {'AVG': 'mean', 'MIN': 'min', 'MAX': 'max', 'COUNT': 'count'}
+
+
+def load_column(name, df, column):
+    return REGISTRY[name].column(df[column].to_numpy())
+
+
+def timeit(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print("{:>10} {:>12} {:>12} {:>12} {:>8}".format("rows", "function", "legacy(s)", "new(s)", "speedup"))
+    for rows in (1000000, 10000000):
+        columns = [rng.normal(0, 1, rows) for _ in range(6)]
+        args = columns + [1, 2.5]
+        assert np.array_equal(LEGACY_SUM(*args), REGISTRY["SUM"](*args))
+        old, new = timeit(LEGACY_SUM, *args), timeit(REGISTRY["SUM"], *args)
+        print("{:>10} {:>12} {:>12.4f} {:>12.4f} {:>8.1f}".format(rows, "SUM", old, new, old / new))
+    print("\n{:>10} {:>12} {:>8} {:>12} {:>12}".format("rows", "function", "column", "numpy(s)", "vaex(s)"))
+    for rows in (1000000, 10000000):
+        df = vaex.from_arrays(f=rng.normal(0, 1, rows),
+                              m=np.ma.array(rng.integers(0, 9, rows), mask=rng.random(rows) < 0.1))
+        # 过滤的数据集读取整列时需复制过滤后的行
+        df = df[df.f > -1]
+        for name, aggregator in AGGREGATORS.items():
+            for column in ("f", "m"):
+                # numpy 计算含读取整列, 求和顺序不同, 均值可能相差几个 ulp
+                assert np.isclose(load_column(name, df, column), getattr(df, aggregator)(column), rtol=1e-12)
+                old, new = timeit(load_column, name, df, column), timeit(getattr(df, aggregator), column)
+                print("{:>10} {:>12} {:>8} {:>12.4f} {:>12.4f}".format(rows, name, column, old, new))
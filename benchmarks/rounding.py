@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+取整方法性能对比: 整列 kernel 与逐元素 wrap_ufunc 的旧实现, 结果一致由 tests/test_rounding.py 核对
+
+    python -m benchmarks.rounding
+"""
+import functools
+import math
+import time
+
+import numpy as np
+
+from dataframe_formulas.functions import REGISTRY, Error, wrap_ufunc
+from dataframe_formulas.functions import math as xmath
+
+LEGACY = {
+    'ROUND': wrap_ufunc(xmath.xround),
+    'ROUNDDOWN': wrap_ufunc(functools.partial(xmath.xround, func=math.floor)),
+    'ROUNDUP': wrap_ufunc(functools.partial(xmath.xround, func=math.ceil)),
+    'CEILING': wrap_ufunc(xmath.xceiling),
+    'CEILING.MATH': wrap_ufunc(xmath.xceiling_math),
+    'FLOOR': wrap_ufunc(functools.partial(xmath.xceiling, ceil=math.floor, dfl=Error.errors['#DIV/0!'])),
+    'EVEN': wrap_ufunc(xmath.xeven),
+}
+
+
+def make_column(rng, rows):
+    # 含恰好为 .5 的值、-0.0 与 nan
+    column = rng.integers(-10**6, 10**6, rows) / 10.0**rng.integers(0, 5, rows)
+    column += rng.choice([0, 0.5, 0.05, 0.005, -0.005], rows)
+    column[::97], column[::89] = np.nan, -0.0
+    return column
+
+
+def make_cases(column, digits):
+    return [
+        ('ROUND', (column, 2)),
+        ('ROUND', (column, digits)),
+        ('ROUNDDOWN', (column, 1)),
+        ('ROUNDUP', (column, -1)),
+        ('CEILING', (column, 0.5)),
+        ('CEILING.MATH', (column, 2, 1)),
+        ('FLOOR', (column, 3)),
+        ('EVEN', (column, )),
+    ]
+
+
+def timeit(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print("{:>10} {:>14} {:>12} {:>12} {:>8}".format("rows", "function", "legacy(s)", "kernel(s)", "speedup"))
+    for rows in (10000, 100000):
+        column = make_column(rng, rows)
+        for name, args in make_cases(column, rng.integers(-2, 4, rows)):
+            old, new = timeit(LEGACY[name], *args, repeat=1), timeit(REGISTRY[name], *args)
+            print("{:>10} {:>14} {:>12.4f} {:>12.4f} {:>8.1f}".format(rows, name, old, new, old / new))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+文本方法性能对比: arrow 字符串 kernel 与逐元素 wrap_ufunc 的旧实现
+
+    python -m benchmarks.text_functions
+"""
+import time
+
+import numpy as np
+
+from dataframe_formulas.functions import text, wrap_func, wrap_ufunc
+
+LEGACY = {
+    'LEN': wrap_ufunc(str.__len__, **text._kw1),
+    'UPPER': wrap_ufunc(str.upper, **text._kw1),
+    'LOWER': wrap_ufunc(str.lower, **text._kw1),
+    'PROPER': wrap_ufunc(str.capitalize, **text._kw1),
+    'MID': wrap_ufunc(text.xmid, **text._kw0),
+    'LEFT': wrap_ufunc(text.xleft, **text._kw0),
+    'RIGHT': wrap_ufunc(text.xright, **text._kw0),
+    'REPLACE': wrap_ufunc(text.xreplace, **text._kw0),
+    'SUBSTITUTE': wrap_ufunc(text.xsubstitute, **text._kw0),
+    'FIND': wrap_ufunc(text.xfind, **text._kw0),
+    'CONCAT': wrap_func(text.xconcat),
+}
+
+
+def make_cases(column):
+    return [
+        ('LEN', (column, )),
+        ('UPPER', (column, )),
+        ('LOWER', (column, )),
+        ('PROPER', (column, )),
+        ('MID', (column, 2, 3)),
+        ('LEFT', (column, 3)),
+        ('RIGHT', (column, 2)),
+        ('REPLACE', (column, 1, 2, 'ZZ')),
+        ('SUBSTITUTE', (column, '_', '-')),
+        ('FIND', ('_', column)),
+        ('CONCAT', (column, '-', column)),
+    ]
+
+
+def timeit(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print("{:>10} {:>12} {:>12} {:>12} {:>8}".format("rows", "function", "legacy(s)", "arrow(s)", "speedup"))
+    for rows in (100000, 1000000):
+        labels = np.array(["org_{}_城市{}".format(i, i % 7) for i in range(1000)], object)
+        column = labels[rng.integers(0, len(labels), rows)]
+        for name, args in make_cases(column):
+            old, new = timeit(LEGACY[name], *args, repeat=1), timeit(text.FUNCTIONS[name], *args)
+            print("{:>10} {:>12} {:>12.4f} {:>12.4f} {:>8.1f}".format(rows, name, old, new, old / new))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+分词性能对比: 单次扫描分词器与逐个尝试 token 类并切片剩余字符串的旧实现
+
+    python -m benchmarks.tokenizer
+"""
+import time
+
+import numpy as np
+import vaex
+
+from dataframe_formulas import Parser
+from dataframe_formulas.exceptions import FormulaError, TokenError
+from dataframe_formulas.tokens.parenthesis import Parenthesis
+
+
+def legacy_tokens(parser, expression):
+    expr = parser._formula(expression).groupdict()['name']
+    builder = parser.ast_builder(df=parser.df, custom_var_map=parser.custom_var_map)
+    tokens, stack = [], []
+    Parenthesis('(').ast(tokens, stack, builder)
+    while expr:
+        for f in parser.filters:
+            try:
+                token = f(expr)
+                token.ast(tokens, stack, builder)
+                expr = expr[token.end_match:]
+                break
+            except TokenError:
+                pass
+        else:
+            raise FormulaError()
+    Parenthesis(')').ast(tokens, stack, builder)
+    return tokens[1:-1]
+
+
+def scanner_tokens(parser, expression):
+    return parser._parse(expression).tokens
+
+
+def make_formula(n_terms):
+    terms = ["IF(a{0} > {0}, b * 2.5, 'x{0}') & c".format(i % 10) if i % 3 == 0 else
+             "ROUND(a{} / (b + 1), 2) - -c".format(i % 10) for i in range(n_terms)]
+    return "=CONCAT(" + ", ".join(terms) + ")"
+
+
+def timeit(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    columns = {"a{}".format(i): np.arange(10) for i in range(10)}
+    columns.update(b=np.arange(10), c=np.arange(10))
+    parser = Parser(df=vaex.from_dict(columns), custom_var_map={})
+    print("{:>10} {:>10} {:>12} {:>12}".format("terms", "chars", "legacy(s)", "scanner(s)"))
+    for n_terms in (50, 200, 800, 1600):
+        formula = make_formula(n_terms)
+        old, new = legacy_tokens(parser, formula), scanner_tokens(parser, formula)
+        assert [(type(t), t.name) for t in old] == [(type(t), t.name) for t in new]
+        print("{:>10} {:>10} {:>12.4f} {:>12.4f}".format(
+            n_terms, len(formula), timeit(legacy_tokens, parser, formula), timeit(scanner_tokens, parser, formula)))
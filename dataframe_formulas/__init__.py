@@ -1 +1,5 @@
-from .parser import Parser
\ No newline at end of file
+from .cache import ColumnCache
+from .functions.udf import udf
+from .parser import Parser
+
+__all__ = ["ColumnCache", "Parser", "udf"]
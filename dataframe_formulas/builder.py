@@ -3,10 +3,11 @@
 import collections
 
 from schedula import NONE, Dispatcher, DispatchPipe, bypass
-from schedula.utils.utl import get_unused_node_id
 
 from . import functions
 from .exceptions import FormulaError, InvalidRangeError, RangeValueError
+from .optimizer import Optimizer
+from .plan import Plan
 from .tokens.function import Function
 from .tokens.operand import Column, CustomColumn, Operand
 from .tokens.operator import Operator
@@ -14,6 +15,10 @@ from .tokens.operator import Operator
 
 class AstBuilder(object):
     compile_class = DispatchPipe
+    # 直线型执行计划, 不支持的执行图回退到 compile_class; 为 None 时总是使用 schedula
+    plan_class = Plan
+    # 常量折叠与代数化简, 为 None 时不做优化
+    optimizer_class = Optimizer
 
     def __init__(self, dsp=None, nodes=None, match=None, df=None, custom_var_map=None):
         # 双向队列
@@ -29,6 +34,13 @@ class AstBuilder(object):
         self.nodes = nodes or {}
         # 缺少操作数
         self.missing_operands = set()
+        # 运算节点的入参 token
+        self.inputs = {}
+        # 编译后的执行计划
+        self._plan = None
+        # 节点编号计数, 避免重复扫描已使用的编号
+        self._counters = {}
+        self.optimizer = self.optimizer_class and self.optimizer_class(self)
 
     def __len__(self):
         return len(self._deque)
@@ -48,8 +60,19 @@ class AstBuilder(object):
             # dsp 添加入参
             token.update_input_tokens(*tokens)
             inputs = [self.get_node_id(i) for i in tokens]
+            if self.optimizer:
+                self.replace_arguments(token, tokens, inputs)
+            self.inputs[token] = tuple(tokens)
             token.set_expr(*tokens)
-            out, dmap, get_id = token.node_id, self.dsp.dmap, get_unused_node_id
+            res = self.optimizer and self.optimizer(token, tokens)
+            if res is not None:
+                # 折叠、化简的结果替代运算节点, 不再加入执行图
+                if res not in self.nodes:
+                    res.set_expr()
+                    self.missing_operands.add(res)
+                self._deque.append(res)
+                return
+            out, dmap, get_id = token.node_id, self.dsp.dmap, self.get_unused_node_id
             if out not in self.dsp.nodes:
                 func = token.compile()
                 kw = {
@@ -68,11 +91,28 @@ class AstBuilder(object):
                 self.dsp.add_function(**kw)
             else:
                 self.nodes[token] = n_id = get_id(dmap, out, 'c%d>{}')
-                self.dsp.add_function(None, bypass, [out], [n_id])
+                self.dsp.add_function(get_id(dmap, 'bypass'), bypass, [out], [n_id])
         elif isinstance(token, Operand):
             self.missing_operands.add(token)
         self._deque.append(token)
 
+    def replace_arguments(self, token, tokens, inputs):
+        # 优化器替换的入参 (如文本分组列替换为字典编码) 代替原入参加入执行图
+        for i, res in self.optimizer.arguments(token, tokens):
+            self.missing_operands.add(res)
+            tokens[i], inputs[i] = res, self.get_node_id(res)
+
+    def get_unused_node_id(self, graph, initial_guess, _format='{}<%d>'):
+        # 与 schedula get_unused_node_id 结果一致, 节点只增不减, 从上次的编号继续查找
+        if initial_guess not in graph.nodes:
+            return initial_guess
+        fmt = _format.format(initial_guess.replace('%', '%%'))
+        n = self._counters.get(fmt, 0)
+        while fmt % n in graph.nodes:
+            n += 1
+        self._counters[fmt] = n + 1
+        return fmt % n
+
     def get_node_id(self, token):
         if token in self.nodes:
             return self.nodes[token]
@@ -83,6 +123,9 @@ class AstBuilder(object):
             if isinstance(token, (Column, CustomColumn)):
                 token.set_df(self.df)
                 token.set_custom_var_map(self.custom_var_map)
+                # 列数据在运行时按需加载, 解析阶段只校验列是否存在
+                token.var_name()
+                token.attr['is_reference'] = True
             if not token.attr.get('is_reference', False):
                 kw['default_value'] = token.compile()
             node_id = self.dsp.add_data(data_id=token.node_id, **kw)
@@ -91,18 +134,61 @@ class AstBuilder(object):
         self.nodes[token] = node_id
         return node_id
 
+    @property
+    def references(self):
+        return {v: k for k, v in self.nodes.items() if isinstance(k, (Column, CustomColumn))}
+
+    def branch(self, match=None):
+        """
+        共享执行图与工作节点的新 builder, 多个公式合并为同一个执行图, 相同的子表达式只计算一次
+        """
+        builder = type(self)(dsp=self.dsp, match=match, df=self.df, custom_var_map=self.custom_var_map)
+        builder.nodes, builder.inputs, builder._counters = self.nodes, self.inputs, self._counters
+        return builder
+
+    def input_tokens(self, inputs, df=None):
+        # 计划入参对应的列 token
+        tokens, res = self.references, []
+        for k in inputs:
+            token = tokens[k]
+            if df is not None:
+                token.set_df(df)
+            res.append(token)
+        return res
+
+    def input_columns(self, inputs, df=None):
+        # 计划入参对应的数据集列名
+        return [token.var_name() for token in self.input_tokens(inputs, df)]
+
     def finish(self):
         for token in list(self.missing_operands):
             self.get_node_id(token)
 
-    def compile(self, references=None, context=None, **inputs):
+    def compile(self, references=None, context=None, outputs=None, **inputs):
+        """
+        params: outputs: 输出节点列表, 默认为公式结果节点, 多个输出时执行计划返回结果列表
+        """
+        cache = not references and not inputs and outputs is None
+        if self._plan is not None and cache:
+            return self._plan
+        plan = None
+        if self.plan_class is not None and not references and not inputs:
+            plan = self.plan_class.build(self.dsp, outputs or [self.get_node_id(self[-1])])
+        if plan is None:
+            plan = self._compile_dsp(references, outputs, **inputs)
+        if cache:
+            self._plan = plan
+        return plan
+
+    def _compile_dsp(self, references=None, outputs=None, **inputs):
+        # schedula 执行计划: 预先计算不依赖入参的节点, 提取输出所需的子图
         dsp, inp = self.dsp, inputs.copy()
         for k, ref in (references or {}).items():
             if k in dsp.data_nodes:
                 if isinstance(ref, Column):
                     inp[k] = ref
-        res, o = dsp(inp), self.get_node_id(self[-1])
-        dsp = dsp.get_sub_dsp_from_workflow([o], graph=dsp.dmap, reverse=True, blockers=res, wildcard=False)
+        res, o = dsp(inp), outputs or [self.get_node_id(self[-1])]
+        dsp = dsp.get_sub_dsp_from_workflow(o, graph=dsp.dmap, reverse=True, blockers=res, wildcard=False)
         dsp.nodes.update({k: v.copy() for k, v in dsp.nodes.items()})
 
         i = collections.OrderedDict()
@@ -117,4 +203,4 @@ class AstBuilder(object):
                 else:
                     i[k] = None
         dsp.raises = True
-        return self.compile_class(dsp, '=%s' % o, i, [o], wildcard=False, shrink=False)
+        return self.compile_class(dsp, '=%s' % ','.join(o), i, o, wildcard=False, shrink=False)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import json
+import os
+import threading
+import time
+import zlib
+
+import pyarrow as pa
+
+
+class LRUCache(object):
+    """
+    有界 LRU 缓存, 记录命中与未命中次数
+    """
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None, valid=None):
+        """
+        params: valid: 校验缓存值的函数, 校验失败的缓存值被丢弃并计为未命中
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+                if valid is not None and not valid(value):
+                    del self._data[key]
+                    raise KeyError(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "maxsize": self.maxsize, "currsize": len(self._data)}
+
+
+class ColumnCache(object):
+    """
+    衍生列的磁盘缓存: 每列保存为一个 arrow IPC 文件, 读取时内存映射不复制数据;
+    写入临时文件后改名, 读取时校验行数、文件大小与修改时间, 校验失败的文件被删除;
+    总大小超过 max_bytes 时按最近使用时间 (命中时更新访问时间) 淘汰
+    """
+    suffix = '.arrow'
+
+    def __init__(self, path, max_bytes=10 * 2 ** 30, verify=False):
+        """
+        params: path: 缓存目录
+        params: max_bytes: 缓存文件的总大小上限
+        params: verify: 读取时是否另外校验 crc32 (每次命中读取整个文件), 默认不校验, crc32 只在写入时记录
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.verify = verify
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + self.suffix)
+
+    def get(self, key, rows):
+        """
+        return: (数组, 类型), 未命中时为 None; 无缺失值的数值列为内存映射的 numpy 数组, 其它为 arrow 数组
+        """
+        path = self._file(key)
+        try:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            stat = os.stat(path)
+            if meta['rows'] != rows or stat.st_size != meta['size'] or stat.st_mtime_ns != meta['mtime']:
+                raise ValueError(path)
+            if self.verify and _crc32(path) != meta['crc32']:
+                raise ValueError(path)
+            arr = pa.ipc.open_file(pa.memory_map(path)).read_all().column(0).combine_chunks()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, KeyError, pa.ArrowException):
+            self.discard(key)
+            self.misses += 1
+            return None
+        if arr.null_count == 0:
+            try:
+                arr = arr.to_numpy(zero_copy_only=True)
+            except pa.ArrowException:
+                pass
+        os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        self.hits += 1
+        return arr, meta['type']
+
+    def put(self, key, arr, _type):
+        """
+        params: arr: 写入数据集的数组, numpy 或 arrow 数组
+        """
+        path = self._file(key)
+        tmp = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        table = pa.table({'value': arr if isinstance(arr, pa.Array) else pa.array(arr)})
+        try:
+            with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            stat = os.stat(tmp)
+            meta = {'rows': len(table), 'type': _type, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                    'crc32': _crc32(tmp)}
+            with open(tmp + '.json', 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp, path)
+            os.replace(tmp + '.json', path + '.json')
+        except OSError:
+            for p in (tmp, tmp + '.json'):
+                if os.path.exists(p):
+                    os.remove(p)
+            return
+        self.evict()
+
+    def discard(self, key):
+        path = self._file(key)
+        for p in (path, path + '.json'):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def evict(self):
+        # 按访问时间 (命中时更新, 修改时间用于校验) 从旧到新删除, 直到总大小不超过 max_bytes
+        with self._lock:
+            files = []
+            for name in os.listdir(self.path):
+                if name.endswith(self.suffix):
+                    try:
+                        stat = os.stat(os.path.join(self.path, name))
+                    except OSError:
+                        continue
+                    files.append((stat.st_atime, stat.st_size, name[:-len(self.suffix)]))
+            total = sum(size for _, size, _ in files)
+            for _, size, key in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                self.discard(key)
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            for name in os.listdir(self.path):
+                if name.endswith(self.suffix):
+                    self.discard(name[:-len(self.suffix)])
+            self.hits = self.misses = 0
+
+    def info(self):
+        size = sum(os.path.getsize(os.path.join(self.path, n))
+                   for n in os.listdir(self.path) if n.endswith(self.suffix))
+        return {"hits": self.hits, "misses": self.misses, "max_bytes": self.max_bytes, "currbytes": size}
+
+
+def _crc32(path, block=2 ** 22):
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(block), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
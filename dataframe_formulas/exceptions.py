@@ -34,3 +34,8 @@ class BroadcastError(Exception):
 
 class FoundError(Exception):
     ...
+
+
+class VirtualColumnError(BaseError):
+    def __init__(self, msg="公式无法编译为虚拟列"):
+        super(VirtualColumnError, self).__init__(msg=msg)
@@ -4,10 +4,13 @@ import collections
 import copy
 import functools
 import importlib
+import inspect
 import re
+import threading
 from collections.abc import Iterable
 
 import numpy as np
+import pandas as pd
 import schedula as sh
 
 from ..exceptions import (BaseError, BroadcastError, FoundError,
@@ -100,7 +103,10 @@ def wrap_impure_func(func):
     def wrapper(compiling, *args, **kwargs):
         return sh.NONE if compiling else func(*args, **kwargs)
 
-    return functools.update_wrapper(wrapper, func)
+    wrapper = functools.update_wrapper(wrapper, func)
+    # 非纯函数标记, 常量折叠时跳过
+    wrapper.is_impure = True
+    return wrapper
 
 
 # noinspection PyUnusedLocal
@@ -138,16 +144,118 @@ def parse_ranges(*args, **kw):
 
 SUBMODULES = ['.math', '.text', '.logic']
 FUNCTIONS = {}
+# 方法的结果类型: {方法名: 由入参 Type 推断结果 Type 的函数}, 未登记的方法结果类型未知
+SIGNATURES = {}
+# 按整列聚合的方法, 分块计算时需一次计算全部行
+AGGREGATES = set()
+# 只有一个入参时整列聚合、多个入参时逐行计算的归约方法, 见 wrap_reduction
+REDUCTIONS = set()
 FUNCTIONS['ARRAY'] = lambda *args: np.asarray(args, object).view(Array)
 FUNCTIONS['ARRAYROW'] = lambda *args: np.asarray(args, object).view(Array)
 
 
+# 静态类型: kind 为 bool、int、float、str, 无法确定时为 None; nullable 为结果是否可能含缺失值、错误值
+Type = collections.namedtuple('Type', 'kind nullable')
+UNKNOWN = Type(None, True)
+
+
+def numeric_kind(*kinds):
+    # 数值运算结果的类型, 布尔值按整数参与运算
+    if not kinds or any(k not in ('bool', 'int', 'float') for k in kinds):
+        return None
+    return 'float' if 'float' in kinds else 'int'
+
+
+def common_kind(*kinds):
+    # 多个分支合并后的类型, 数值分支按 numpy 规则提升
+    if len(set(kinds)) == 1:
+        return kinds[0]
+    return numeric_kind(*kinds)
+
+
+def returns(kind, nullable=True):
+    return lambda *types: Type(kind, nullable)
+
+
+def numeric(*types, nullable=None):
+    kind = numeric_kind(*(t.kind for t in types))
+    if nullable is None:
+        nullable = kind is None or any(t.nullable for t in types)
+    return Type(kind, nullable)
+
+
+def _may_hold_error(v):
+    # 类型数组不含错误值, 缺失值由掩码表示, 无需逐元素扫描
+    return not isinstance(v, np.ndarray) or v.dtype == object
+
+
 def get_error(*vals):
-    for v in flatten(vals, None):
+    for v in flatten(filter(_may_hold_error, vals), None):
         if isinstance(v, XlError):
             return v
 
 
+_is_error = np.frompyfunc(lambda v: isinstance(v, XlError), 1, 1)
+
+
+def error_mask(v):
+    """Returns the mask of error values in `v`, None when `v` is a typed array."""
+    v = np.asarray(v)
+    if v.dtype == object:
+        return _is_error(v).astype(bool)
+    return None
+
+
+def null_mask(v):
+    """
+    掩码数组的缺失值掩码, 非掩码数组或无缺失值时为 None
+    """
+    if np.ma.isMaskedArray(v):
+        mask = np.ma.getmaskarray(v)
+        if mask.any():
+            return mask
+    return None
+
+
+def strip_nulls(v):
+    # 拆分为数据与缺失值掩码
+    if np.ma.isMaskedArray(v):
+        return np.ma.getdata(v), null_mask(v)
+    return v, None
+
+
+def split_nulls(args):
+    """
+    入参拆分为数据与按 OR 合并的缺失值掩码, 无缺失值时掩码为 None
+    """
+    args, masks = zip(*map(strip_nulls, args)) if args else ((), ())
+    masks = [m for m in masks if m is not None]
+    return args, functools.reduce(np.logical_or, masks) if masks else None
+
+
+def with_nulls(res, mask):
+    """
+    缺失值掩码按 OR 合并到结果, 结果为标量或形状不一致 (如错误值) 时原样返回
+    """
+    if mask is None or not isinstance(res, np.ndarray) or not res.ndim:
+        return res
+    try:
+        mask = np.broadcast_to(mask, res.shape)
+    except ValueError:
+        return res
+    res, m = strip_nulls(res)
+    return np.ma.array(res, mask=mask if m is None else mask | m)
+
+
+def fill_nulls(v, value=None):
+    # 缺失值替换为 value, 供逐元素计算识别
+    v, mask = strip_nulls(v)
+    if mask is not None:
+        v = v.astype(object)
+        v[mask] = value
+    return v
+
+
 def raise_errors(*args):
     v = get_error(*args)
     if v:
@@ -222,57 +330,111 @@ def _get_single_args(*args):
 
 
 _re_condition = re.compile('(?<!~)[?*]')
+# 字典编码的列: 各行的编码 (缺失值为 -1) 与编码对应的类别, 条件聚合只判断各类别, 分组聚合按编码分组
+Groups = collections.namedtuple('Groups', 'codes categories')
 
 
-def _xfilter(accumulator, test_range, condition, operating_range):
+def parse_criteria(condition):
+    """
+    条件解析为比较运算符与比较值: 文本条件可带比较运算符前缀 (如 ">5"、"<>a"), 数值文本转换为数值;
+    含通配符 (?、*, ~ 转义) 的等值条件比较值为正则表达式
+    """
     from .operators import LOGIC_OPERATORS
-    operator, operating_range = '=', np.asarray(operating_range)
-    if isinstance(condition, str):
-        for k in LOGIC_OPERATORS:
-            if condition.startswith(k) and condition != k:
-                operator, condition = k, condition[len(k):]
+    operator = '='
+    if not isinstance(condition, str):
+        return operator, condition
+    for k in LOGIC_OPERATORS:
+        if condition.startswith(k) and condition != k:
+            operator, condition = k, condition[len(k):]
+            break
+    if operator == '=':
+        it = _re_condition.findall(condition)
+        if it:
+            _ = lambda v: re.escape(v.replace('~?', '?').replace('~*', '*'))
+            return operator, re.compile(''.join(
+                sum(zip(map(_, _re_condition.split(condition)),
+                        tuple(map(lambda v: '.%s' % v, it)) + ('', )), ())))
+        elif any(v in condition for v in ('~?', '~*')):
+            condition = condition.replace('~?', '?').replace('~*', '*')
+    from ..exceptions import TokenError
+    from ..tokens.operand import Error, Number
+    for token in (Number, Error):
+        try:
+            token = token(condition)
+            if token.end_match == len(condition):
+                condition = token.compile()
                 break
-        if operator == '=':
-            it = _re_condition.findall(condition)
-            if it:
-                _ = lambda v: re.escape(v.replace('~?', '?').replace('~*', '*'))
-                match = re.compile(''.join(
-                    sum(zip(map(_, _re_condition.split(condition)),
-                            tuple(map(lambda v: '.%s' % v, it)) + ('', )), ()))).match
-                f = lambda v: isinstance(v, str) and bool(match(v))
-                b = np.vectorize(f, otypes=[bool])(test_range['raw'])
-                try:
-                    return accumulator(operating_range[b])
-                except FoundError as ex:
-                    return ex.err
-            elif any(v in condition for v in ('~?', '~*')):
-                condition = condition.replace('~?', '?').replace('~*', '*')
-        from ..exceptions import TokenError
-        from ..tokens.operand import Error, Number
-        for token in (Number, Error):
-            try:
-                token = token(condition)
-                if token.end_match == len(condition):
-                    condition = token.compile()
-                    break
-            except TokenError:
-                pass
+        except TokenError:
+            pass
+    return operator, _text2num(condition)
+
+
+def _criteria_type(v):
+    # 条件比较的类型: 0 数值 (含缺失值、错误值), 1 文本, 2 布尔值
+    if isinstance(v, (bool, np.bool_)):
+        return 2
+    return _get_type_id(v)
 
-        condition = _text2num(condition)
 
-    type_id, operator = _get_type_id(condition), LOGIC_OPERATORS[operator]
+_criteria_types = np.frompyfunc(_criteria_type, 1, 1)
 
-    def check(value):
-        return _get_type_id(value) == type_id and operator(value, condition)
 
-    if is_number(condition):
-        if 'num' not in test_range:
-            test_range['num'] = text2num(test_range['raw'])
-        b = np.vectorize(check, otypes=[bool])(test_range['num'])
+def criteria_mask(values, condition):
+    """
+    values 中满足条件的位置, 条件见 parse_criteria; 只比较同类型的值, 数值条件比较数值与可转换为数值的文本,
+    通配符匹配整个文本; 缺失值、错误值与 ColumnIsin 一致只满足 <>
+    values 为 Groups 时只判断各类别, 再按编码映射回各行
+    """
+    from .operators import LOGIC_OPERATORS
+    if isinstance(values, Groups):
+        res = np.append(criteria_mask(values.categories, condition), criteria_mask(np.array([None]), condition))
+        return res[values.codes]
+    operator, condition = parse_criteria(condition)
+    data, mask = strip_nulls(values)
+    data = np.asarray(data)
+    shape, data = data.shape, data.ravel()
+    kind = data.dtype.kind
+    if kind == 'O':
+        # 只含一种类型 (忽略缺失值) 时不逐元素判断类型
+        kind = {'string': 'U', 'boolean': 'b', 'integer': 'i', 'floating': 'f', 'mixed-integer-float': 'f',
+                'empty': 'f'}.get(pd.api.types.infer_dtype(data, skipna=True), 'O')
+    if kind == 'O':
+        types = _criteria_types(data).astype(np.int8)
     else:
-        b = np.vectorize(check, otypes=[bool])(test_range['raw'])
+        types = np.full(data.shape, {'U': 1, 'S': 1, 'b': 2}.get(kind, 0), np.int8)
+    missing = pd.isna(data) if data.dtype.kind in 'Of' else np.zeros(data.shape, bool)
+    if mask is not None:
+        missing |= mask.ravel()
+    types[missing] = -1
+    res = np.zeros(data.shape, bool)
+    if isinstance(condition, re.Pattern):
+        # 每个不同的文本只匹配一次
+        text = types == 1
+        codes, uniques = pd.factorize(data[text])
+        res[text] = np.array([bool(condition.fullmatch(v)) for v in uniques], bool)[codes]
+        return res.reshape(shape)
+    kind = _criteria_type(condition)
+    if kind == 0:
+        text = types == 1
+        if text.any():
+            # 文本可转换为数值时按数值比较
+            data, numbers = data.astype(object), text2num(data[text])
+            data[text] = numbers
+            types[np.flatnonzero(text)[_criteria_types(numbers).astype(np.int8) == 0]] = 0
+        if data.dtype == object:
+            data = pd.to_numeric(np.where(types == 0, data, None), errors='coerce')
+        condition = np.nan if condition is None else condition
+    selected = types == kind
+    if selected.any():
+        res[selected] = LOGIC_OPERATORS[operator](data[selected], condition)
+    res[missing] = operator == '<>'
+    return res.reshape(shape)
+
+
+def _xfilter(accumulator, test_range, condition, operating_range):
+    b = criteria_mask(test_range, condition)
     try:
-        return accumulator(operating_range[b])
+        return accumulator(np.asarray(operating_range)[b])
     except FoundError as ex:
         return ex.err
 
@@ -282,9 +444,7 @@ _xfilter = np.vectorize(_xfilter, otypes=[object], excluded={0, 1, 3})
 
 def xfilter(accumulator, test_range, condition, operating_range=None):
     operating_range = test_range if operating_range is None else operating_range
-    # noinspection PyTypeChecker
-    test_range = {'raw': replace_empty(test_range, '')}
-    res = _xfilter(accumulator, test_range, condition, operating_range)
+    res = _xfilter(accumulator, replace_empty(test_range, ''), condition, operating_range)
     return res.view(Array)
 
 
@@ -325,8 +485,13 @@ def wrap_ufunc(func,
                ranges=False,
                return_func=lambda res, *args: res,
                check_nan=True,
+               nulls='propagate',
                **kw):
-    """Helps call a numpy universal function (ufunc)."""
+    """Helps call a numpy universal function (ufunc).
+
+    nulls: 'propagate' 时掩码数组的缺失值不参与计算, 结果对应行为缺失值;
+    'pass' 时缺失值以 None 传入 func.
+    """
     def safe_eval(*vals):
         try:
             r = check_error(*vals) or convert_noshp(func(*input_parser(*vals)))
@@ -342,6 +507,10 @@ def wrap_ufunc(func,
 
     # noinspection PyUnusedLocal
     def wrapper(*args, **kwargs):
+        if nulls == 'propagate':
+            args, mask = split_nulls(args)
+        else:
+            args, mask = tuple(map(fill_nulls, args)), None
         try:
             args = tuple(args_parser(*args))
             with np.errstate(divide='ignore', invalid='ignore'):
@@ -350,7 +519,7 @@ def wrap_ufunc(func,
                 res = res.view(otype)
             except AttributeError:
                 res = np.asarray([[res]], object).view(otype)
-            return return_func(res, *args)
+            return with_nulls(return_func(res, *args), mask)
         except ValueError as ex:
             try:
                 np.broadcast(*args)
@@ -361,9 +530,169 @@ def wrap_ufunc(func,
     return wrap_func(functools.update_wrapper(wrapper, func), ranges=ranges)
 
 
+def is_numeric(v):
+    if isinstance(v, np.ndarray):
+        return v.dtype.kind in 'biuf'
+    return isinstance(v, (bool, int, float, np.number, np.bool_))
+
+
+def int_power(x, y):
+    """
+    整数的非负整数次幂, 不回绕: 结果超出 int64 时为 float64, 与逐元素计算一致,
+    不超出 uint64 的元素为浮点数, 超出的元素为 nan
+    """
+    x, y = np.asarray(x, np.int64), np.asarray(y, np.int64)
+    res = np.power(x, y)
+    base = np.abs(x).max(initial=0)
+    if base <= 1 or y.max(initial=0) * np.log2(base) < 62:
+        return res[()]
+    with np.errstate(over='ignore', invalid='ignore'):
+        value = np.float_power(x, y)
+    big = ~(np.abs(value) < 2.0 ** 63)
+    if not big.any():
+        return res[()]
+    res = np.where(big, value, res)
+    res[~((value >= -2.0 ** 63) & (value < 2.0 ** 64))] = np.nan
+    return res[()]
+
+
+def to_typed(v):
+    """Converts a result of the per-element path to a typed array when possible."""
+    if isinstance(v, np.ndarray):
+        if v.ndim and v.size == 1:
+            return v.ravel()[0]
+        v, mask = strip_nulls(v)
+        v = v.view(np.ndarray)
+        if v.dtype == object and v.size:
+            kind = pd.api.types.infer_dtype(v.ravel(), skipna=False)
+            if kind in ('integer', 'floating', 'mixed-integer-float', 'boolean'):
+                try:
+                    v = v.astype({'integer': np.int64, 'boolean': bool}.get(kind, np.float64))
+                except (OverflowError, TypeError):
+                    pass
+        if mask is not None:
+            v = np.ma.array(v, mask=mask)
+    return v
+
+
+def wrap_kernel(kernel, func, check=is_numeric, nulls='propagate'):
+    """Applies `kernel` once on whole typed arrays, otherwise calls the per-element `func`.
+
+    nulls: 'propagate' 时按 OR 合并入参的缺失值掩码, 'pass' 时掩码数组直接传入 kernel.
+    """
+    def wrapper(*args, **kwargs):
+        mask = None
+        if nulls == 'propagate':
+            args, mask = split_nulls(args)
+        vals = tuple(map(to_typed, args))
+        if any(np.ndim(v) for v in vals) and all(map(check, vals)):
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                return with_nulls(kernel(*vals, **kwargs), mask)
+        return with_nulls(func(*args, **kwargs), mask)
+
+    return functools.update_wrapper(wrapper, func)
+
+
+def wrap_reduction(row, column, aggregator=None):
+    """
+    归约方法: 一个入参时由 column 整列聚合为标量, 计算结果广播到各行; 多个入参时由 row 逐行计算
+    params: aggregator: 整列聚合对应的 vaex 聚合方法名, vaex 数据集的数值列由 Parser 按该方法并行聚合
+    """
+    def wrapper(*args):
+        return column(args[0]) if len(args) == 1 else row(*args)
+
+    wrapper = functools.update_wrapper(wrapper, row)
+    wrapper.column, wrapper.aggregator = column, aggregator
+    return wrapper
+
+
+def is_aggregate(name, n_args):
+    # 方法调用是否按整列聚合
+    name = name.upper()
+    return name in AGGREGATES or name in REDUCTIONS and n_args == 1
+
+
+class FunctionRegistry(object):
+    """
+    方法注册表: 首次查找时导入 SUBMODULES 并合并各模块的 FUNCTIONS、SIGNATURES, 之后复用,
+    支持运行时注册方法, 按方法缓存必填入参个数
+    """
+    def __init__(self, submodules):
+        self.submodules = submodules
+        self._functions = None
+        self._signatures = None
+        self._required = {}
+        self._lock = threading.RLock()
+
+    def load(self):
+        with self._lock:
+            if self._functions is None:
+                functions, signatures = {}, {}
+                for name in self.submodules:
+                    module = importlib.import_module(name, __name__)
+                    functions.update(module.FUNCTIONS)
+                    signatures.update(module.SIGNATURES)
+                functions.update(FUNCTIONS)
+                signatures.update(SIGNATURES)
+                self._functions, self._signatures = functions, signatures
+        return self
+
+    @property
+    def functions(self):
+        return self.load()._functions
+
+    @property
+    def signatures(self):
+        return self.load()._signatures
+
+    def __getitem__(self, name):
+        return self.functions.get(name.upper(), not_implemented)
+
+    def __contains__(self, name):
+        return name.upper() in self.functions
+
+    def register(self, name, function, signature=None):
+        """
+        注册方法, 同名方法被替换
+        params: function: 方法, 或 {'function': 方法, ...} 形式的执行图节点参数
+        params: signature: 由入参 Type 推断结果 Type 的函数
+        """
+        name = name.upper()
+        with self._lock:
+            self.functions[name] = function
+            if signature is None:
+                self.signatures.pop(name, None)
+            else:
+                self.signatures[name] = signature
+            self._required.pop(name, None)
+
+    def signature(self, name):
+        return self.signatures.get(name.upper())
+
+    def required(self, name):
+        """
+        方法的必填入参个数, 无法获取方法签名时返回 None
+        """
+        name = name.upper()
+        if name not in self._required:
+            func = self[name]
+            if isinstance(func, dict):
+                func = func['function']
+            try:
+                parameters = inspect.signature(func).parameters.values()
+                self._required[name] = sum(p.default is inspect.Parameter.empty and
+                                           p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in parameters)
+            except (TypeError, ValueError):
+                self._required[name] = None
+        return self._required[name]
+
+
+REGISTRY = FunctionRegistry(SUBMODULES)
+
+
 def get_functions():
-    functions = collections.defaultdict(lambda: not_implemented)
-    for name in SUBMODULES:
-        functions.update(importlib.import_module(name, __name__).FUNCTIONS)
-    functions.update(FUNCTIONS)
-    return functions
+    return collections.defaultdict(lambda: not_implemented, REGISTRY.functions)
+
+
+def get_signatures():
+    return REGISTRY.signatures
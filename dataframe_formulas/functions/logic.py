@@ -4,16 +4,59 @@ import functools
 
 import numpy as np
 
-from . import (Error, flatten, get_error, raise_errors, value_return,
-               wrap_func, wrap_ufunc)
+from . import (Error, Type, XlError, common_kind, error_mask, flatten,
+               get_error, is_numeric, raise_errors, returns, strip_nulls,
+               value_return, with_nulls, wrap_func, wrap_kernel, wrap_ufunc)
 
 FUNCTIONS = {}
+SIGNATURES = {}
 
 
 def xif(condition, x=1, y=0):
     return x if condition else y
 
 
+_is_text = np.frompyfunc(lambda v: isinstance(v, str) and not isinstance(v, XlError), 1, 1)
+
+
+def _condition(condition):
+    # 条件的真值掩码, 以及错误值、文本值掩码(类型数组无错误值)
+    if not isinstance(condition, np.ndarray):
+        condition = np.asarray(condition, object if isinstance(condition, str) else None)
+    if condition.dtype.kind in 'OU':
+        condition = condition.astype(object)
+        return condition.astype(bool), error_mask(condition), _is_text(condition).astype(bool)
+    return condition.astype(bool), None, None
+
+
+def _branches(*values):
+    # 数值分支按 numpy 规则提升类型, 含文本的分支统一为 object, 避免转换为定长字符串
+    if all(map(is_numeric, values)):
+        return values
+    return [np.asarray(v, object) for v in values]
+
+
+def _false_if_none(mask):
+    return False if mask is None else mask
+
+
+def xif_array(condition, x=1, y=0):
+    # 条件为缺失值或选中的分支为缺失值时, 结果为缺失值
+    (condition, cmask), (x, xmask), (y, ymask) = map(strip_nulls, (condition, x, y))
+    if not np.ndim(condition):
+        if isinstance(condition, XlError):
+            return np.full(np.broadcast(x, y).shape, condition, object)
+        condition = np.full(np.broadcast(x, y).shape, bool(condition))
+    b, err, _ = _condition(condition)
+    res = np.where(b, *_branches(x, y))
+    if err is not None and err.any():
+        res = res.astype(object)
+        res[err] = np.broadcast_to(condition, res.shape)[err]
+    if cmask is not None or xmask is not None or ymask is not None:
+        res = with_nulls(res, np.where(b, _false_if_none(xmask), _false_if_none(ymask)) | _false_if_none(cmask))
+    return res
+
+
 def solve_cycle(*args):
     return not args[0]
 
@@ -32,6 +75,31 @@ def xifs(*cond_vals):
     return Error.errors['#N/A']
 
 
+def xifs_array(*cond_vals):
+    if len(cond_vals) % 2:
+        cond_vals += 0,
+    conditions, choices = [], []
+    # 尚未满足条件的行遇到缺失值条件或选中缺失值分支时, 结果为缺失值
+    decided = mask = np.False_
+    cond_vals = [strip_nulls(v) for v in cond_vals]
+    values = _branches(*(v for v, _ in cond_vals[1::2]))
+    for (condition, cmask), v, (_, vmask) in zip(cond_vals[::2], values, cond_vals[1::2]):
+        b, err, text = _condition(condition)
+        cmask, vmask = _false_if_none(cmask), _false_if_none(vmask)
+        mask = mask | ~decided & (cmask | b & vmask)
+        decided = decided | b | cmask
+        if err is not None:
+            # 条件为错误值时返回该错误, 为文本时返回 #VALUE!
+            conditions.extend((err, text))
+            choices.extend((np.asarray(condition, object), Error.errors['#VALUE!']))
+        conditions.append(b)
+        choices.append(v)
+    shape = np.broadcast(*conditions, *choices).shape
+    res = np.select([np.broadcast_to(c, shape) for c in conditions], [np.broadcast_to(c, shape) for c in choices],
+                    default=Error.errors['#N/A'])
+    return with_nulls(res, mask if np.any(mask) else None)
+
+
 def xand(logical, *logicals, func=np.logical_and.reduce):
     check, arr = lambda x: not raise_errors(x) and not isinstance(x, str), []
     for a in (logical, ) + logicals:
@@ -68,7 +136,41 @@ FUNCTIONS['NULL'] = wrap_func(_null)
 FUNCTIONS['NAN'] = wrap_func(_nan)
 FUNCTIONS['IF'] = {
     'function':
-    wrap_ufunc(xif, input_parser=lambda *a: a, return_func=value_return, check_error=lambda cond, *a: get_error(cond)),
+    wrap_kernel(xif_array,
+                wrap_ufunc(xif,
+                           input_parser=lambda *a: a,
+                           return_func=value_return,
+                           check_error=lambda cond, *a: get_error(cond)),
+                check=lambda v: True,
+                nulls='pass'),
     'solve_cycle':
     solve_cycle
 }
+FUNCTIONS['IFS'] = wrap_kernel(xifs_array,
+                               wrap_ufunc(xifs, input_parser=lambda *a: a, return_func=value_return,
+                                          check_error=lambda *a: None),
+                               check=lambda v: True,
+                               nulls='pass')
+
+
+def _if(condition, x=Type('int', False), y=Type('int', False)):
+    return Type(common_kind(x.kind, y.kind), condition.nullable or x.nullable or y.nullable)
+
+
+def _ifs(*cond_vals):
+    # 条件均不满足时结果为 #N/A, 数值与布尔值分支的结果为含 nan 的浮点数
+    kind = common_kind(*(t.kind for t in cond_vals[1::2]))
+    return Type('float' if kind in ('bool', 'int') else kind, True)
+
+
+SIGNATURES.update({
+    'AND': returns('bool'),
+    'OR': returns('bool'),
+    'NOT': lambda x: Type('bool', x.nullable or x.kind not in ('bool', 'int', 'float')),
+    'TRUE': returns('bool', False),
+    'FALSE': returns('bool', False),
+    'NULL': returns(None),
+    'NAN': returns('float'),
+    'IF': _if,
+    'IFS': _ifs,
+})
@@ -5,10 +5,14 @@ import math
 from decimal import ROUND_HALF_UP, Decimal
 
 import numpy as np
+import pandas as pd
 
-from . import Error, wrap_func, wrap_ufunc
+from . import (AGGREGATES, REDUCTIONS, Error, Groups, Type, criteria_mask,
+               int_power, is_numeric, numeric, returns, strip_nulls, wrap_func,
+               wrap_kernel, wrap_reduction, wrap_ufunc)
 
 FUNCTIONS = {}
+SIGNATURES = {}
 
 
 def xceiling(num, sig=1, ceil=math.ceil, dfl=0):
@@ -72,7 +76,7 @@ def xsum(*args):
     if _series:
         r_series = _series[0]
         for i in _series[1:]:
-            r_series += i
+            r_series = r_series + i
         rst = r_series
     if _args:
         r_n = sum(_args)
@@ -108,7 +112,346 @@ def xavg(v):
 
 
 def xisnan(v):
-    return np.isnan(v)
+    # 缺失值掩码直接读取
+    v, mask = strip_nulls(v)
+    res = np.isnan(v)
+    return res if mask is None else res | mask
+
+
+_WIDE = (np.dtype(bool), np.dtype(np.int64), np.dtype(np.float64))
+
+
+def is_wide(v):
+    # 逐元素计算以 numpy 标量运算, 较窄的数组类型与常量运算时类型提升不同, 只整列计算 64 位数值与布尔数组
+    if isinstance(v, np.ndarray):
+        return v.dtype in _WIDE
+    return is_numeric(v)
+
+
+def _typed_result(res):
+    # 与逐元素计算的结果一致: 非有限值为 nan, 数值转换为 64 位类型
+    kind = res.dtype.kind
+    if kind == 'f':
+        res = res.astype(np.float64, copy=False)
+        res[~np.isfinite(res)] = np.nan
+    elif kind in 'iu':
+        res = res.astype(np.int64, copy=False)
+    return res
+
+
+def _with_nan(res, bad):
+    # bad 对应的结果为 nan, 逐元素计算的整数结果含 nan 时为 object 数组
+    if not np.any(bad):
+        return res
+    if res.dtype.kind != 'f':
+        res = res.astype(object)
+    res[np.broadcast_to(bad, res.shape)] = np.nan
+    return res
+
+
+def _power(number, power):
+    # 与 xpower 一致: 0 的 0 次幂、0 的负数次幂及整数的负数次幂为 nan, 整数乘方溢出时与 '^' 一致
+    number, power = np.asarray(number), np.asarray(power)
+    bad = (number == 0) & (power <= 0)
+    func = np.power
+    if np.result_type(number, power).kind in 'biu':
+        bad |= power < 0
+        func = int_power
+    if not bad.any():
+        return _typed_result(np.asarray(func(number, power)))
+    return _with_nan(_typed_result(np.asarray(func(number, np.where(bad, 1, power)))), bad)
+
+
+def _half_up(x):
+    # 与 Decimal 的 ROUND_HALF_UP 一致, 按浮点数的精确值判断, x - floor(x) 没有舍入误差
+    res = np.floor(x)
+    return res + (x - res >= 0.5)
+
+
+def _round_kernel(func):
+    """
+    xround 的整列计算: 按 10 的 int(d) 次幂放大后对绝对值取整, 再按原符号还原
+    """
+    def kernel(x, d):
+        x = np.asarray(x)
+        if x.dtype == bool:
+            x = x.astype(np.int64)
+        if np.ndim(d):
+            # 各行位数不同时按位数分组计算
+            x, d = np.broadcast_arrays(x, d)
+            n, res = np.trunc(d), np.full(x.shape, np.nan)
+            for i in np.unique(n[np.isfinite(n)]):
+                rows = n == i
+                res[rows] = kernel(x[rows], i)
+            return res
+        try:
+            scale = 10**int(d)
+            if isinstance(scale, int) and scale > np.iinfo(np.int64).max:
+                scale = float(scale)
+        except (ValueError, OverflowError):
+            return np.full(x.shape, np.nan)
+        v = func(np.abs(x * scale)) / scale
+        return _typed_result(np.where(x < 0, -v, v))
+
+    return kernel
+
+
+def _multiple(q, sig, bad, zero=np.False_, dfl=0):
+    """
+    取整的商乘以倍数, 与逐元素计算一致: 倍数为整数时结果为整数, bad 对应的结果为 nan, 倍数为 0 时为 dfl
+    """
+    sig = np.asarray(sig)
+    integer = sig.dtype.kind in 'biu'
+    bad = ~zero & (bad | ~(np.abs(q) < (2.0**63 if integer else np.inf)))
+    if dfl != dfl:
+        bad = bad | zero
+    # math.ceil 的结果为整数, 没有 -0.0
+    q = np.where(bad | zero, 0, q) + 0.0
+    return _with_nan(_typed_result((q.astype(np.int64) if integer else q) * sig), bad)
+
+
+def _ceiling_kernel(num, sig=1, ceil=np.ceil, dfl=0):
+    num, sig = np.asarray(num), np.asarray(sig)
+    zero = sig == 0
+    q = ceil(num / np.where(zero, 1, sig))
+    return _multiple(q, sig, (sig < 0) & (num > 0), zero, dfl)
+
+
+def _ceiling_math(num, sig=None, mode=0):
+    num = np.asarray(num)
+    if sig is None:
+        # 与 xceiling_math 一致, 未指定倍数时按绝对值取整
+        x, sig, zero = np.abs(num), 1, np.False_
+    else:
+        sig = np.abs(sig)
+        zero = sig == 0
+        x = num / np.where(zero, 1, sig)
+    q = np.where((np.asarray(mode) != 0) & (num < 0), -np.ceil(np.abs(x)), np.ceil(x))
+    return _multiple(q, sig, np.False_, zero)
+
+
+def _even(x):
+    x = np.asarray(x)
+    v = np.ceil(np.abs(x) / 2.)
+    bad = ~(np.abs(v) < 2.0**62)
+    v = np.where(bad, 0, v).astype(np.int64) * 2
+    return _with_nan(np.where(x < 0, -v, v), bad)
+
+
+def _math_kernel(ufunc):
+    return lambda x: _typed_result(ufunc(x))
+
+
+def _present(v):
+    # 非缺失值的位置, 错误值 (nan、None) 按缺失值计
+    data, mask = strip_nulls(v)
+    res = pd.notna(data)
+    return res if mask is None else res & ~mask
+
+
+def _numbers(v, skip_text=False):
+    """
+    整列聚合的数值: 去掉缺失值、错误值, 布尔值按整数计算;
+    含文本等非数值时返回 None, skip_text 时去掉非数值 (与 SUMIF 一致忽略求和区域的文本)
+    """
+    data, present = np.ravel(strip_nulls(v)[0]), np.ravel(_present(v))
+    if not present.all():
+        data = data[present]
+    if data.dtype == object:
+        if skip_text:
+            data = data[np.fromiter(map(is_numeric, data), bool, len(data))]
+        kind = pd.api.types.infer_dtype(data, skipna=False)
+        if kind not in ('integer', 'floating', 'mixed-integer-float', 'boolean', 'empty'):
+            return None
+        data = data.astype({'integer': np.int64, 'boolean': bool}.get(kind, np.float64))
+    if data.dtype.kind not in 'biuf':
+        return np.empty(0, np.int64) if skip_text else None
+    return data.astype(np.int64) if data.dtype == bool else data
+
+
+def _column_reduce(func):
+    # 非数值列为 #VALUE!, 没有数值时为 nan
+    def column(v):
+        data = _numbers(v)
+        if data is None:
+            return Error.errors['#VALUE!']
+        return func(data) if data.size else np.nan
+
+    return column
+
+
+def _column_sum(*args):
+    # 各入参全部数值之和, 没有数值时为 0, 含非数值时为 #VALUE!
+    data = [_numbers(a) for a in args]
+    if any(d is None for d in data):
+        return Error.errors['#VALUE!']
+    return sum(d.sum() for d in data)
+
+
+def _count(v):
+    return np.int64(np.count_nonzero(_present(v)))
+
+
+def _reduce(ufunc, args, dtype=None):
+    """
+    入参依次按 ufunc 归约到一个新的结果数组, 与堆叠后 ufunc.reduce 的逐行结果一致,
+    不复制堆叠全部入参, 也不修改入参
+    """
+    res = np.empty(np.broadcast_shapes(*map(np.shape, args)), dtype or np.result_type(*args))
+    res[...] = args[0]
+    for a in args[1:]:
+        ufunc(res, a, out=res)
+    return res
+
+
+def _numeric_type(args):
+    # 逐行归约的结果类型, 布尔值按整数计算
+    dtype = np.result_type(*args)
+    return np.dtype(np.int64) if dtype == bool else dtype
+
+
+def _row_sum(*args):
+    # 与 xsum 一致: 数组依次相加后加上常量之和, 布尔数组相加为逻辑或
+    res = _reduce(np.add, [a for a in args if np.ndim(a)])
+    scalars = [a for a in args if not np.ndim(a)]
+    if not scalars:
+        return res
+    value = sum(scalars)
+    return np.add(res, value, out=res) if np.result_type(res, value) == res.dtype else res + value
+
+
+def _row_reduce(ufunc):
+    return lambda *args: _reduce(ufunc, args, _numeric_type(args))
+
+
+def _row_avg(*args):
+    return _reduce(np.add, args, _numeric_type(args)) / len(args)
+
+
+def _row_median(*args):
+    # 中位数需各行全部入参, 广播后堆叠为 (入参个数, 行数) 的数组
+    return np.median(np.stack(np.broadcast_arrays(*args)).astype(_numeric_type(args)), axis=0)
+
+
+def _row_count(*args):
+    # 各行非缺失值的个数, 缺失值不传播到结果
+    return _reduce(np.add, [_present(a) for a in args], np.int64)
+
+
+def _select(values, mask):
+    # values 中 mask 选中的行, 标量广播到各行
+    data, missing = strip_nulls(values)
+    data = np.broadcast_to(data, mask.shape)[mask]
+    return data if missing is None else np.ma.array(data, mask=np.broadcast_to(missing, mask.shape)[mask])
+
+
+def _criteria_reduce(func):
+    """
+    条件聚合: 条件为常量时整列聚合为标量; 条件为数组时逐行取条件,
+    每个不同的条件只计算一次, 结果按行映射回各行, 条件为缺失值的行为 nan
+    params: func: 由聚合的值与满足条件的位置计算结果
+    """
+    def wrapper(test_range, condition, operating_range=None):
+        values = test_range if operating_range is None else operating_range
+        if not np.ndim(condition):
+            return func(values, criteria_mask(test_range, condition))
+        data, mask = strip_nulls(condition)
+        codes, uniques = pd.factorize(np.ravel(data))
+        if mask is not None:
+            codes[np.ravel(mask)] = -1
+        res = [func(values, criteria_mask(test_range, c)) for c in uniques]
+        return np.asarray(res + [np.nan] if (codes < 0).any() else res)[codes]
+
+    return wrapper
+
+
+def _countif(values, mask):
+    return np.int64(np.count_nonzero(mask))
+
+
+def _sumif(values, mask):
+    return _numbers(_select(values, mask), True).sum()
+
+
+def _averageif(values, mask):
+    data = _numbers(_select(values, mask), True)
+    return data.mean() if data.size else Error.errors['#DIV/0!']
+
+
+def _group_codes(keys, size):
+    """
+    各行的分组编号 (分组列含缺失值的行为 -1) 与分组个数, 多个分组列按组合分组, 常量分组列不分组
+    """
+    codes, n = np.zeros(size, np.int64), 1
+    for key in keys:
+        if isinstance(key, Groups):
+            c, m = key.codes, len(key.categories)
+        elif np.ndim(key):
+            data, mask = strip_nulls(key)
+            c, uniques = pd.factorize(np.ravel(data))
+            if mask is not None:
+                c[np.ravel(mask)] = -1
+            m = len(uniques)
+        else:
+            continue
+        valid = (codes >= 0) & (c >= 0)
+        combined = codes[valid] * m + c[valid]
+        codes = np.full(size, -1, np.int64)
+        codes[valid], uniques = pd.factorize(combined) if n > 1 else (combined, range(m))
+        n = len(uniques)
+    return codes, n
+
+
+def _group_reduce(func, numbers=True):
+    """
+    分组聚合: 按分组列分组计算一次, 结果按分组编号映射回各行;
+    跳过缺失值与错误值, 分组列为缺失值或分组内没有值的行为缺失值, 非数值为 #VALUE!
+    params: func: 由各值的分组编号、值与分组个数计算各分组的结果, 返回结果与没有值的分组
+    """
+    def wrapper(values, *keys):
+        size = max([np.size(k.codes if isinstance(k, Groups) else k) for k in keys] + [np.size(values)])
+        codes, n = _group_codes(keys, size)
+        valid = codes >= 0
+        present = valid & np.broadcast_to(np.ravel(_present(values)), (size, ))
+        data = np.broadcast_to(np.ravel(strip_nulls(values)[0]), (size, ))[present]
+        if numbers:
+            data = _numbers(data)
+            if data is None:
+                return Error.errors['#VALUE!']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            res, empty = func(codes[present], data, max(n, 1))
+        index = np.where(valid, codes, 0)
+        missing = ~valid if empty is None else ~valid | empty[index]
+        return np.ma.array(res[index], mask=missing) if missing.any() else res[index]
+
+    return wrapper
+
+
+def _group_sum(codes, data, n):
+    if data.dtype.kind == 'f':
+        return np.bincount(codes, data, n), None
+    res = np.zeros(n, data.dtype)
+    np.add.at(res, codes, data)
+    return res, None
+
+
+def _group_count(codes, data, n):
+    return np.bincount(codes, minlength=n), None
+
+
+def _group_avg(codes, data, n):
+    counts = np.bincount(codes, minlength=n)
+    return np.bincount(codes, data, n) / counts, counts == 0
+
+
+def _group_extreme(ufunc):
+    def func(codes, data, n):
+        info = np.finfo if data.dtype.kind == 'f' else np.iinfo
+        res = np.full(n, info(data.dtype).max if ufunc is np.minimum else info(data.dtype).min, data.dtype)
+        ufunc.at(res, codes, data)
+        return res, np.bincount(codes, minlength=n) == 0
+
+    return func
 
 
 FUNCTIONS['ABS'] = wrap_ufunc(np.abs)
@@ -126,6 +469,106 @@ FUNCTIONS['POWER'] = wrap_ufunc(xpower)
 FUNCTIONS['ROUND'] = wrap_ufunc(xround)
 FUNCTIONS['ROUNDDOWN'] = wrap_ufunc(functools.partial(xround, func=math.floor))
 FUNCTIONS['ROUNDUP'] = wrap_ufunc(functools.partial(xround, func=math.ceil))
-FUNCTIONS['SUM'] = wrap_func(xsum)
-FUNCTIONS['AVG'] = wrap_func(xavg)
+FUNCTIONS['SUM'] = wrap_kernel(_row_sum, wrap_func(xsum))
+FUNCTIONS['AVG'] = wrap_reduction(
+    wrap_kernel(_row_avg, wrap_ufunc(lambda *a: sum(a) / len(a))), _column_reduce(np.mean), 'mean')
+FUNCTIONS['MIN'] = wrap_reduction(
+    wrap_kernel(_row_reduce(np.minimum), wrap_ufunc(lambda *a: min(a))), _column_reduce(np.min), 'min')
+FUNCTIONS['MAX'] = wrap_reduction(
+    wrap_kernel(_row_reduce(np.maximum), wrap_ufunc(lambda *a: max(a))), _column_reduce(np.max), 'max')
+FUNCTIONS['MEDIAN'] = wrap_reduction(
+    wrap_kernel(_row_median, wrap_ufunc(lambda *a: np.median(a))), _column_reduce(np.median))
+FUNCTIONS['COUNT'] = wrap_reduction(_row_count, _count, 'count')
+REDUCTIONS.update(('AVG', 'MIN', 'MAX', 'MEDIAN', 'COUNT'))
+# SUM 一个入参时仍逐行计算 (与原有公式一致), 整列求和为 COLSUM
+FUNCTIONS['COLSUM'] = wrap_reduction(_column_sum, _column_sum, 'sum')
+AGGREGATES.add('COLSUM')
+FUNCTIONS.update({
+    'COUNTIF': wrap_func(_criteria_reduce(_countif)),
+    'SUMIF': wrap_func(_criteria_reduce(_sumif)),
+    'AVERAGEIF': wrap_func(_criteria_reduce(_averageif)),
+    'GROUPSUM': wrap_func(_group_reduce(_group_sum)),
+    'GROUPAVG': wrap_func(_group_reduce(_group_avg)),
+    'GROUPMIN': wrap_func(_group_reduce(_group_extreme(np.minimum))),
+    'GROUPMAX': wrap_func(_group_reduce(_group_extreme(np.maximum))),
+    'GROUPCOUNT': wrap_func(_group_reduce(_group_count, numbers=False)),
+})
+# 可按字典编码计算的入参位置: 条件聚合的条件区域 (有求和区域时), 分组聚合的分组列
+FUNCTIONS['COUNTIF'].group_args = lambda n: (0, )
+FUNCTIONS['SUMIF'].group_args = FUNCTIONS['AVERAGEIF'].group_args = lambda n: (0, ) if n == 3 else ()
+for k in ('GROUPSUM', 'GROUPAVG', 'GROUPMIN', 'GROUPMAX', 'GROUPCOUNT'):
+    FUNCTIONS[k].group_args = lambda n: range(1, n)
+AGGREGATES.update(('COUNTIF', 'SUMIF', 'AVERAGEIF', 'GROUPSUM', 'GROUPAVG', 'GROUPMIN', 'GROUPMAX', 'GROUPCOUNT'))
 FUNCTIONS['ISNAN'] = wrap_func(xisnan)
+FUNCTIONS.update({
+    k: wrap_kernel(v, FUNCTIONS[k], check=is_wide)
+    for k, v in {
+        'ABS': _math_kernel(np.abs),
+        'EXP': _math_kernel(np.exp),
+        'LOG10': _math_kernel(np.log10),
+        'LN': _math_kernel(np.log),
+        'POWER': _power,
+        'ROUND': _round_kernel(_half_up),
+        'ROUNDDOWN': _round_kernel(np.floor),
+        'ROUNDUP': _round_kernel(np.ceil),
+        'CEILING': _ceiling_kernel,
+        'CEILING.MATH': _ceiling_math,
+        'FLOOR': functools.partial(_ceiling_kernel, ceil=np.floor, dfl=Error.errors['#DIV/0!']),
+        'EVEN': _even,
+    }.items()
+})
+
+_float = returns('float')
+
+
+def _ceiling(num, sig=None, *args):
+    # 倍数为浮点数时结果为浮点数, 否则为整数
+    kind = numeric(*filter(None, (num, sig))).kind
+    return Type(kind and ('float' if sig and sig.kind == 'float' else 'int'), True)
+
+
+def _round(x, d):
+    res = numeric(x, d)
+    return Type(res.kind and 'float', res.nullable)
+
+
+def _sum(*types):
+    # 布尔数组相加仍为布尔数组
+    if all(t.kind == 'bool' for t in types):
+        return Type('bool', any(t.nullable for t in types))
+    return numeric(*types)
+
+
+SIGNATURES.update({
+    'ABS': lambda x: x if x.kind == 'bool' else numeric(x),
+    'CEILING': _ceiling,
+    'CEILING.MATH': _ceiling,
+    'DEGREES': _float,
+    'EVEN': lambda x: Type(numeric(x).kind and 'int', True),
+    'EXP': _float,
+    'FLOOR': _ceiling,
+    'INT': lambda x: Type(numeric(x).kind and 'int', numeric(x).nullable),
+    'LOG10': _float,
+    'LOG': _float,
+    'LN': _float,
+    'POWER': lambda x, y: Type(numeric(x, y).kind, True),
+    'ROUND': _round,
+    'ROUNDDOWN': _round,
+    'ROUNDUP': _round,
+    'SUM': _sum,
+    'AVG': _float,
+    'MIN': lambda *types: Type(numeric(*types).kind, True),
+    'MAX': lambda *types: Type(numeric(*types).kind, True),
+    'MEDIAN': _float,
+    'COUNT': returns('int', False),
+    'COLSUM': lambda *types: Type(numeric(*types).kind, True),
+    'COUNTIF': lambda x, c: Type('int', c.nullable),
+    'SUMIF': lambda x, c, y=None: Type(numeric(y or x).kind, True),
+    'AVERAGEIF': _float,
+    'GROUPSUM': lambda x, *keys: Type(numeric(x).kind, True),
+    'GROUPAVG': _float,
+    'GROUPMIN': lambda x, *keys: Type(numeric(x).kind, True),
+    'GROUPMAX': lambda x, *keys: Type(numeric(x).kind, True),
+    'GROUPCOUNT': returns('int', True),
+    'ISNAN': lambda x: Type('bool', numeric(x).kind is None),
+})
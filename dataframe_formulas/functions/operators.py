@@ -3,14 +3,61 @@
 import collections
 import functools
 
-from . import (Error, not_implemented, replace_empty, value_return, wrap_func,
-               wrap_ufunc)
-from .text import _str
+import numpy as np
+
+from . import (Error, int_power, not_implemented, replace_empty, value_return,
+               wrap_func, wrap_kernel, wrap_ufunc)
+from .text import _str, is_text
 
 OPERATORS = collections.defaultdict(lambda: not_implemented)
 
 numeric_wrap = functools.partial(wrap_ufunc, return_func=value_return)
 
+
+def _number(x):
+    # 布尔值按 0/1 参与算术运算
+    if np.asarray(x).dtype.kind == 'b':
+        return np.asarray(x, np.int64) if isinstance(x, np.ndarray) else int(x)
+    return x
+
+
+def _finite(res):
+    # 非有限值与 convert_nan 一致, 统一为 nan
+    if isinstance(res, np.ndarray) and res.dtype.kind == 'f':
+        res[~np.isfinite(res)] = np.nan
+    return res
+
+
+def xpower(x, y):
+    x, y = _number(x), _number(y)
+    if np.result_type(x, y).kind in 'iu':
+        if np.any(np.asarray(y) < 0):
+            return _finite(np.float_power(x, y))
+        return int_power(x, y)
+    return _finite(np.power(x, y))
+
+
+def _text(x):
+    if isinstance(x, np.ndarray):
+        return x.astype(str).astype(object) if x.dtype != object else x
+    return _str(x)
+
+
+def is_concat_arg(v):
+    return is_text(v) or isinstance(v, np.ndarray) and v.dtype.kind in 'iu' or type(v) is int
+
+
+KERNELS = {
+    '+': lambda x, y: _finite(np.add(_number(x), _number(y))),
+    '-': lambda x, y: _finite(np.subtract(_number(x), _number(y))),
+    'U-': lambda x: np.negative(_number(x)),
+    '*': lambda x, y: _finite(np.multiply(_number(x), _number(y))),
+    '/': lambda x, y: _finite(np.true_divide(_number(x), _number(y))),
+    '^': xpower,
+    '%': lambda x: _finite(np.true_divide(_number(x), 100.0)),
+    'U+': lambda x: np.array(x),
+}
+
 OPERATORS.update({
     k: numeric_wrap(v)
     for k, v in {
@@ -24,6 +71,7 @@ OPERATORS.update({
     }.items()
 })
 OPERATORS['U+'] = wrap_ufunc(lambda x: x, input_parser=lambda *a: a, return_func=value_return)
+OPERATORS.update({k: wrap_kernel(KERNELS[k], OPERATORS[k]) for k in KERNELS})
 
 LOGIC_OPERATORS = collections.OrderedDict([
     ('>=', lambda x, y: x >= y),
@@ -38,6 +86,7 @@ OPERATORS['&'] = wrap_ufunc(lambda x, y: x + y,
                             input_parser=lambda *a: map(_str, a),
                             args_parser=lambda *a: (replace_empty(v, '') for v in a),
                             return_func=value_return)
+OPERATORS['&'] = wrap_kernel(lambda x, y: np.add(_text(x), _text(y)), OPERATORS['&'], check=is_concat_arg)
 OPERATORS.update({
     k: wrap_func(v, ranges=True)
     for k, v in {
@@ -4,11 +4,15 @@ import functools
 import re
 
 import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
-from . import (Error, XlError, replace_empty, value_return, wrap_func,
-               wrap_ufunc)
+from . import (Error, XlError, replace_empty, returns, value_return,
+               wrap_func, wrap_ufunc)
 
 FUNCTIONS = {}
+SIGNATURES = {}
 
 
 def _str(text):
@@ -19,6 +23,14 @@ def _str(text):
     return str(text)
 
 
+def is_text(v):
+    if isinstance(v, np.ndarray):
+        if v.dtype == object:
+            return v.size > 0 and pd.api.types.infer_dtype(v.ravel(), skipna=False) == 'string'
+        return v.dtype.kind == 'U'
+    return isinstance(v, str) and not isinstance(v, XlError)
+
+
 def xfind(find_text, within_text, start_num=1):
     i = int(start_num or 0) - 1
     res = i >= 0 and _str(within_text).find(_str(find_text), i) + 1 or 0
@@ -86,7 +98,7 @@ def xconcat(*args):
         else:
             arg = str(arg)
 
-        rst += arg
+        rst = rst + arg
     return rst
 
 
@@ -102,16 +114,181 @@ def xisnull(sr):
     return sr is None
 
 
-FUNCTIONS['CONCAT'] = wrap_func(xconcat)
-FUNCTIONS['LEN'] = wrap_ufunc(str.__len__, **_kw1)
-FUNCTIONS['UPPER'] = wrap_ufunc(str.upper, **_kw1)
-FUNCTIONS['LOWER'] = wrap_ufunc(str.lower, **_kw1)
-FUNCTIONS['PROPER'] = wrap_ufunc(str.capitalize, **_kw1)
-FUNCTIONS['MID'] = wrap_ufunc(xmid, **_kw0)
-FUNCTIONS['LEFT'] = wrap_ufunc(xleft, **_kw0)
-FUNCTIONS['RIGHT'] = wrap_ufunc(xright, **_kw0)
-FUNCTIONS['REPLACE'] = wrap_ufunc(xreplace, **_kw0)
-FUNCTIONS['SUBSTITUTE'] = wrap_ufunc(xsubstitute, **_kw0)
+def arrow_text(v):
+    """
+    文本列转换为 arrow 字符串数组, 缺失值与逐元素计算一致转换为 'None';
+    不是只含字符串的 object 数组 (含错误值、数值等) 时返回 None
+    """
+    if not isinstance(v, np.ndarray) or np.ma.isMaskedArray(v) or v.dtype != object or v.ndim != 1:
+        return None
+    types = set(map(type, v))
+    if not types <= {str, type(None)}:
+        return None
+    arr = pa.array(v, pa.string())
+    return pc.fill_null(arr, 'None') if arr.null_count else arr
+
+
+def _to_numpy(arr):
+    return arr.to_numpy(zero_copy_only=False)
+
+
+def wrap_text_kernel(kernel, func, text=0):
+    """
+    第 text 个参数为文本列、其它参数为标量时整列调用 arrow 字符串 kernel, 否则逐元素调用 func;
+    kernel 返回 None 或参数无法转换时逐元素调用, 与逐元素计算的错误值一致
+    """
+    def wrapper(*args):
+        arr = arrow_text(args[text]) if len(args) > text else None
+        scalars = args[:text] + args[text + 1:]
+        if arr is not None and not any(np.ndim(v) or isinstance(v, XlError) for v in scalars):
+            try:
+                res = kernel(arr, *scalars)
+            except (ValueError, TypeError, OverflowError):
+                res = None
+            if res is not None:
+                return res
+        return func(*args)
+
+    return functools.update_wrapper(wrapper, func)
+
+
+@functools.lru_cache(None)
+def _case_exceptions(name):
+    # arrow 与 python 大小写转换结果不同的字符 (ß、ǅ 等), 只比较基本多文种平面
+    chars = [chr(i) for i in range(128, 0x10000) if not 0xd800 <= i < 0xe000]
+    kernel, func = {'upper': (pc.utf8_upper, str.upper), 'lower': (pc.utf8_lower, str.lower),
+                    'capitalize': (pc.utf8_capitalize, str.capitalize)}[name]
+    res = kernel(pa.array(chars)).to_pylist()
+    return '[%s]' % ''.join(re.escape(c) for c, r in zip(chars, res) if r != func(c))
+
+
+def _case_kernel(name, kernel):
+    def wrapper(arr):
+        if not pc.all(pc.string_is_ascii(arr)).as_py() and \
+                pc.any(pc.match_substring_regex(arr, _case_exceptions(name))).as_py():
+            return None
+        return _to_numpy(kernel(arr))
+
+    return wrapper
+
+
+def _slice(arr, start, stop=None):
+    return _to_numpy(pc.utf8_slice_codeunits(arr, start, stop))
+
+
+def _left(arr, num_chars):
+    i = int(num_chars or 0)
+    return _slice(arr, 0, i) if i >= 0 else None
+
+
+def _right(arr, num_chars):
+    i = int(num_chars or 0)
+    return _slice(arr, -i if i else 0, None if i else 0) if i >= 0 else None
+
+
+def _mid(arr, start_num, num_chars):
+    i = j = int(start_num or 0) - 1
+    j += int(num_chars or 0)
+    return _slice(arr, i, j) if 0 <= i <= j else None
+
+
+def _replace(arr, start_num, num_chars, new_text):
+    i = j = int(start_num or 0) - 1
+    j += int(num_chars or 0)
+    if 0 <= i <= j:
+        return _to_numpy(pc.utf8_replace_slice(arr, i, j, _str(new_text)))
+
+
+_re_special = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+def _substitute(arr, old_text, new_text, i=1, n=None):
+    # 逐元素计算按正则替换, 只有不含正则元字符的文本可直接替换子串
+    if type(i) is not int or i != 1 or n is not None and (type(n) is not int or n < 0):
+        return None
+    if not isinstance(old_text, str) or not isinstance(new_text, str) or not old_text or \
+            _re_special.search(old_text) or '\\' in new_text:
+        return None
+    # re.sub 的 count=0 为全部替换
+    res = _to_numpy(pc.replace_substring(arr, old_text, new_text, max_replacements=n or None))
+    found = pc.match_substring(arr, old_text).to_numpy(zero_copy_only=False)
+    if not found.all():
+        res[~found] = Error.errors['#VALUE!']
+    return res
+
+
+def _find(arr, find_text, start_num=1):
+    i, find_text = int(start_num or 0) - 1, _str(find_text)
+    if i < 0 or not find_text:
+        return None
+    arr = pc.utf8_slice_codeunits(arr, i)
+    res = pc.find_substring(arr, find_text).to_numpy().astype(np.int64)
+    found = res >= 0
+    if not pc.all(pc.string_is_ascii(arr)).as_py():
+        # find_substring 返回字节位置, 非 ascii 文本按匹配前的字符数计算位置
+        prefix = pc.list_element(pc.split_pattern(arr, find_text, max_splits=1), 0)
+        res = pc.utf8_length(prefix).to_numpy().astype(np.int64)
+    res = res + i + 1
+    if not found.all():
+        res = res.astype(object)
+        res[~found] = Error.errors['#VALUE!']
+    return res
+
+
+def _concat_arg(v):
+    if not isinstance(v, np.ndarray):
+        return None if isinstance(v, XlError) else str(v)
+    elif np.ma.isMaskedArray(v):
+        return None
+    elif v.dtype == object:
+        # 与逐元素计算一致, 文本列含缺失值时整体为 #VALUE!, 交由逐元素计算
+        return arrow_text(v) if None not in v else None
+    elif v.dtype.kind in 'biuf' and v.ndim == 1:
+        return pa.array(v.astype(str))
+    return None
+
+
+def concat_kernel(func):
+    def wrapper(*args):
+        parts = [_concat_arg(v) for v in args]
+        sizes = {len(v) for v in parts if isinstance(v, pa.Array)}
+        if sizes and len(sizes) == 1 and all(v is not None for v in parts):
+            return _to_numpy(pc.binary_join_element_wise(*parts, ''))
+        return func(*args)
+
+    return functools.update_wrapper(wrapper, func)
+
+
+FUNCTIONS['CONCAT'] = concat_kernel(wrap_func(xconcat))
+FUNCTIONS['LEN'] = wrap_text_kernel(lambda arr: pc.utf8_length(arr).to_numpy().astype(np.int64),
+                                    wrap_ufunc(str.__len__, **_kw1))
+FUNCTIONS['UPPER'] = wrap_text_kernel(_case_kernel('upper', pc.utf8_upper), wrap_ufunc(str.upper, **_kw1))
+FUNCTIONS['LOWER'] = wrap_text_kernel(_case_kernel('lower', pc.utf8_lower), wrap_ufunc(str.lower, **_kw1))
+FUNCTIONS['PROPER'] = wrap_text_kernel(_case_kernel('capitalize', pc.utf8_capitalize),
+                                       wrap_ufunc(str.capitalize, **_kw1))
+FUNCTIONS['MID'] = wrap_text_kernel(_mid, wrap_ufunc(xmid, **_kw0))
+FUNCTIONS['LEFT'] = wrap_text_kernel(_left, wrap_ufunc(xleft, **_kw0))
+FUNCTIONS['RIGHT'] = wrap_text_kernel(_right, wrap_ufunc(xright, **_kw0))
+FUNCTIONS['REPLACE'] = wrap_text_kernel(_replace, wrap_ufunc(xreplace, **_kw0))
+FUNCTIONS['SUBSTITUTE'] = wrap_text_kernel(_substitute, wrap_ufunc(xsubstitute, **_kw0))
+FUNCTIONS['FIND'] = wrap_text_kernel(_find, wrap_ufunc(xfind, **_kw0), text=1)
 FUNCTIONS['TEXT'] = wrap_ufunc(xtext, **_kw0)
 FUNCTIONS['VALUE'] = wrap_ufunc(xvalue, **_kw0)
-FUNCTIONS['ISNULL'] = wrap_ufunc(xisnull, **_kw0)
+FUNCTIONS['ISNULL'] = wrap_ufunc(xisnull, nulls='pass', **_kw0)
+
+SIGNATURES.update({
+    'CONCAT': returns('str', False),
+    'LEN': returns('int', False),
+    'UPPER': returns('str', False),
+    'LOWER': returns('str', False),
+    'PROPER': returns('str', False),
+    'MID': returns('str'),
+    'LEFT': returns('str'),
+    'RIGHT': returns('str'),
+    'REPLACE': returns('str'),
+    'SUBSTITUTE': returns('str'),
+    'FIND': returns('int'),
+    'TEXT': returns('str'),
+    'VALUE': returns('float'),
+    'ISNULL': returns('bool', False),
+})
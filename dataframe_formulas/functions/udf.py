@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import functools
+
+import numpy as np
+
+from . import (REGISTRY, Type, is_numeric, to_typed, value_return,
+               wrap_func, wrap_ufunc)
+
+
+def _is_text(v):
+    # 文本 kernel 在首次调用时才导入
+    from .text import is_text
+    return is_text(v)
+
+
+# 整列 kernel 对入参类型的要求, 不满足时逐元素调用
+CHECKS = {
+    'bool': is_numeric,
+    'int': is_numeric,
+    'float': is_numeric,
+    'str': _is_text,
+    None: lambda v: True,
+}
+
+_is_missing = np.frompyfunc(lambda v: v is None or isinstance(v, float) and v != v, 1, 1)
+
+
+def missing_mask(*args):
+    """
+    入参的缺失值掩码 (掩码数组、nan、None), 按广播规则合并
+    """
+    mask = False
+    for v in args:
+        m = np.ma.getmaskarray(v) if np.ma.isMaskedArray(v) else False
+        v = np.asarray(np.ma.getdata(v))
+        if v.dtype.kind == 'f':
+            m = m | np.isnan(v)
+        elif v.dtype == object:
+            m = m | _is_missing(v).astype(bool)
+        mask = mask | m
+    return mask
+
+
+def udf(name=None, vectorized=False, inputs=None, returns=None, nullable=True, pure=True, nulls='propagate'):
+    """
+    注册自定义方法的装饰器, 公式中按方法名调用, 返回原方法
+    params: name: 方法名, 默认为函数名, 不区分大小写
+    params: vectorized: True 时方法为整列 kernel, 入参为整列的类型数组;
+        入参不满足 inputs 要求时逐元素调用, 此时入参为标量
+    params: inputs: 入参类型 bool、int、float、str 的列表, None 为任意类型, 默认均为数值
+    params: returns: 结果类型 bool、int、float、str, 用于静态类型推断
+    params: nullable: 有效入参的结果是否可能含缺失值
+    params: pure: False 时为非纯函数, 不做常量折叠
+    params: nulls: 'propagate' 时入参含缺失值的行结果为缺失值, 'pass' 时缺失值直接传入方法
+    """
+    if nulls not in ('propagate', 'pass'):
+        raise ValueError("nulls 只支持 'propagate'、'pass'")
+
+    def decorator(func):
+        scalar = wrap_ufunc(func, input_parser=lambda *a: a, return_func=value_return, check_nan=False, nulls=nulls)
+        checks = [CHECKS[k] for k in inputs] if inputs is not None else None
+
+        def is_array_args(vals):
+            if not vectorized or not any(np.ndim(v) for v in vals):
+                return False
+            if checks is None:
+                return all(map(is_numeric, vals))
+            return len(vals) <= len(checks) and all(c(v) for c, v in zip(checks, vals))
+
+        def wrapper(*args):
+            vals = tuple(map(to_typed, args))
+            if is_array_args(vals):
+                with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                    res = func(*vals)
+            else:
+                res = scalar(*args)
+            if nulls == 'propagate' and isinstance(res, np.ndarray) and res.ndim:
+                mask = missing_mask(*args)
+                if np.any(mask):
+                    try:
+                        res = np.ma.array(res, mask=np.broadcast_to(mask, res.shape))
+                    except ValueError:
+                        pass
+            return res
+
+        wrapper = wrap_func(functools.update_wrapper(wrapper, func))
+        if not pure:
+            wrapper.is_impure = True
+
+        def signature(*types):
+            return Type(returns, nullable or nulls == 'propagate' and any(t.nullable for t in types))
+
+        REGISTRY.register(name or func.__name__, wrapper, signature)
+        return func
+
+    return decorator
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import collections
+
+import numpy as np
+
+from .functions import REGISTRY, is_numeric, split_nulls, with_nulls
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# 可融合的运算符与方法: 逐元素计算, 入参为数值时结果为数值或布尔值
+FUSED_OPERATORS = ('+', '-', 'U-', '*', '/', '^', '%', '=', '<>', '<', '>', '<=', '>=')
+FUSED_FUNCTIONS = ('ABS', 'EXP', 'LN', 'LOG10', 'POWER')
+COMPARISONS = {'=': '==', '<>': '!=', '<': '<', '>': '>', '<=': '<=', '>=': '>='}
+# numexpr 与 numpy 结果逐位一致的运算; 超越函数、乘方的实现不同, 按块调用原方法
+NUMEXPR = {'+': '({} + {})', '-': '({} - {})', 'U-': '(-{})', '*': '({} * {})', '/': '({} / {})',
+           '%': '({} / 100.0)', 'ABS': 'abs({})'}
+NUMEXPR.update({k: '({} %s {})' % v for k, v in COMPARISONS.items()})
+
+Node = collections.namedtuple('Node', 'name function args')
+
+
+def fusable():
+    # 方法对象到名称, 运行时注册替换的方法不融合
+    from .functions.operators import OPERATORS
+    res = {OPERATORS[k]: k for k in FUSED_OPERATORS}
+    res.update({REGISTRY[k]: k for k in FUSED_FUNCTIONS})
+    return res
+
+
+def fuse(order, keep, fused_class):
+    """
+    合并指令中的数值子树: 结果只被一个可融合运算使用且不是输出的指令并入使用它的运算
+    params: order: (方法, 入参槽位, 结果槽位) 列表, 按依赖顺序
+    params: keep: 输出槽位
+    return: 合并后的指令列表, 融合的子树为一条 fused_class 指令, 入参为子树外的槽位
+    """
+    names = fusable()
+    uses = collections.Counter(s for _, args, _ in order for s in args)
+    producer = {out: i for i, (_, _, out) in enumerate(order)}
+    inner = set()
+    for function, args, _ in order:
+        if function in names:
+            for s in args:
+                i = producer.get(s)
+                if i is not None and order[i][0] in names and uses[s] == 1 and s not in keep:
+                    inner.add(i)
+
+    def tree(i, leaves):
+        function, args, _ = order[i]
+        nodes = [tree(producer[s], leaves) if producer.get(s) in inner else leaves.setdefault(s, len(leaves))
+                 for s in args]
+        return Node(names[function], function, nodes)
+
+    res = []
+    for i, (function, args, out) in enumerate(order):
+        if i in inner:
+            continue
+        if function in names and any(producer.get(s) in inner for s in args):
+            leaves = {}
+            root = tree(i, leaves)
+            res.append((fused_class(root, len(leaves)), list(leaves), out))
+        else:
+            res.append((function, args, out))
+    return res
+
+
+def _is_float(v):
+    if isinstance(v, np.ndarray):
+        return v.dtype == np.float64
+    return isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, bool)
+
+
+class FusedExpression(object):
+    """
+    融合的数值子表达式, 不为每个运算生成整列的中间结果:
+    入参均为 float64 且只含逐位一致的运算时由 numexpr 整体计算 (已安装时),
+    否则按 tile_size 行分块调用原方法, 中间结果留在缓存中;
+    入参含文本、错误值或行数不超过 tile_size 时按原方法逐个计算
+    """
+    tile_size = 2 ** 14
+    use_numexpr = numexpr is not None
+
+    def __init__(self, root, n_args):
+        self.root = root
+        self.n_args = n_args
+        self.expression, self.loose = self._numexpr(root, True) or (None, None)
+
+    def _numexpr(self, node, root=False):
+        """
+        numexpr 表达式与结果是否需要转换非有限值
+        numpy 的算术运算将非有限的结果转换为 nan, numexpr 保留 inf:
+        inf 经 + - * % ABS 及被除数仍为非有限值, 只有除数、比较的操作数需先转换
+        """
+        if isinstance(node, int):
+            return 'x%d' % node, False
+        if node.name not in NUMEXPR or node.name in COMPARISONS and not root:
+            return None
+        args = []
+        for i, child in enumerate(node.args):
+            res = self._numexpr(child)
+            if res is None:
+                return None
+            expr, loose = res
+            if loose and (node.name in COMPARISONS or node.name == '/' and i == 1):
+                expr = 'where(abs({0}) < inf, {0}, nan)'.format(expr)
+                loose = False
+            args.append((expr, loose))
+        expr = NUMEXPR[node.name].format(*(e for e, _ in args))
+        # U- 不转换非有限值, 只继承操作数
+        loose = node.name != 'U-' and node.name not in COMPARISONS or any(loose for _, loose in args)
+        return expr, loose
+
+    def _call(self, node, values):
+        if isinstance(node, int):
+            return values[node]
+        return node.function(*[self._call(a, values) for a in node.args])
+
+    def __call__(self, *args):
+        data, mask = split_nulls(args)
+        vectors = [v for v in data if np.ndim(v)]
+        size = len(vectors[0]) if vectors else 0
+        if size <= self.tile_size or not all(map(is_numeric, data)) or \
+                any(v.shape != (size, ) for v in vectors):
+            return self._call(self.root, args)
+        if self.use_numexpr and self.expression is not None and all(map(_is_float, data)):
+            res = self._evaluate(data)
+        else:
+            res = self._tiles(data, size)
+        if res is None:
+            return self._call(self.root, args)
+        return with_nulls(res, mask)
+
+    def _evaluate(self, data):
+        local_dict = {'x%d' % i: v if np.ndim(v) else float(v) for i, v in enumerate(data)}
+        local_dict.update(inf=np.inf, nan=np.nan)
+        # 默认的 aggressive 优化把除以常量改为乘以倒数, 末位与 numpy 不一致
+        res = numexpr.evaluate(self.expression, local_dict=local_dict, optimization='none')
+        if self.loose and res.dtype.kind == 'f':
+            res[~np.isfinite(res)] = np.nan
+        return res
+
+    def _tiles(self, data, size):
+        # 各块结果类型须一致 (如整数乘方含负指数时为浮点数), 否则返回 None 整列计算
+        bounds = list(range(0, size, self.tile_size)) + [size]
+        if bounds[-1] - bounds[-2] < 2:
+            # 单行的数组按标量计算, 并入前一块
+            del bounds[-2]
+        out = None
+        for start, stop in zip(bounds, bounds[1:]):
+            res = self._call(self.root, [v[start:stop] if np.ndim(v) else v for v in data])
+            if not isinstance(res, np.ndarray) or res.shape != (stop - start, ) or \
+                    res.dtype.kind not in 'biuf' or out is not None and res.dtype != out.dtype:
+                return None
+            if out is None:
+                out = np.empty(size, res.dtype)
+            out[start:stop] = res
+        return out
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from .functions import REGISTRY, UNKNOWN, Type, numeric, numeric_kind
+from .tokens.function import Function
+from .tokens.operand import (Column, ColumnAggregate, ColumnIsin, Constant,
+                             CustomColumn, Number, String)
+from .tokens.operator import Operator
+
+CONSTANTS = (Number, String, Constant)
+COMPARISONS = ('=', '<>', '<', '>', '<=', '>=')
+# 读取缺失值掩码本身的方法, 结果不随入参含缺失值
+NULL_AWARE = ('ISNULL', 'ISNAN', 'COUNT', 'COUNTIF')
+# 整数结果在参数为某些值时含错误值 (nan) 或为浮点数: {名称: (参数位置, 参数为常量时结果仍为整数的条件)}
+INT_ERRORS = {
+    '^': (1, lambda v: v >= 0),
+    'POWER': (1, lambda v: v > 0),
+    'FLOOR': (1, lambda v: v > 0),
+    'CEILING': (1, lambda v: v >= 0),
+}
+
+
+def _has_missing(df, name):
+    # 只根据列的存储判断是否含缺失值, 不扫描数据, 无法确定时视为含缺失值
+    column = df.columns.get(name)
+    if isinstance(column, np.ndarray):
+        return np.ma.isMaskedArray(column)
+    null_count = getattr(column, 'null_count', None)
+    return null_count is None or null_count > 0
+
+
+def column_type(df, name):
+    """
+    数据集列的静态类型, 浮点列可能含 nan, 文本列可能含 None
+    """
+    data_type = df.data_type(name)
+    if data_type.is_string:
+        return Type('str', True)
+    elif data_type == bool:
+        return Type('bool', _has_missing(df, name))
+    elif data_type.is_integer:
+        return Type('int', _has_missing(df, name))
+    elif data_type.is_float:
+        return Type('float', True)
+    return UNKNOWN
+
+
+class TypeInference(object):
+    """
+    执行图的静态类型推断, 不执行计算:
+    由数据集列类型、常量类型及方法的结果类型 (functions.SIGNATURES) 推断每个节点的 Type
+    """
+    def __init__(self, builder):
+        self.builder = builder
+        self.types = {}
+
+    def __call__(self, token=None):
+        """
+        params: token: 默认为公式结果节点
+        """
+        if token is None:
+            token = self.builder[-1]
+        if token not in self.types:
+            self.types[token] = self.infer(token)
+        return self.types[token]
+
+    def infer(self, token):
+        if isinstance(token, CONSTANTS):
+            kind = {bool: 'bool', int: 'int', float: 'float', str: 'str'}.get(type(token.compile()))
+            return Type(kind, kind is None)
+        elif isinstance(token, ColumnIsin):
+            return Type('bool', False)
+        elif isinstance(token, ColumnAggregate):
+            signature = REGISTRY.signature(token.function_name)
+            return signature(self(token.column)) if signature else UNKNOWN
+        elif isinstance(token, (Column, CustomColumn)):
+            df = token.df if token.df is not None else self.builder.df
+            return column_type(df, token.var_name()) if df is not None else UNKNOWN
+        elif token not in self.builder.inputs:
+            return UNKNOWN
+        types = [self(t) for t in self.builder.inputs[token]]
+        if isinstance(token, Operator):
+            res = self.operator(token, types)
+        elif isinstance(token, Function):
+            signature = REGISTRY.signature(token.name)
+            try:
+                res = signature(*types) if signature else UNKNOWN
+            except TypeError:
+                # 入参个数与方法不符, 执行时报错
+                return UNKNOWN
+        else:
+            return UNKNOWN
+        if res.kind == 'int' and not self._int_safe(token):
+            res = Type('float', True)
+        # 数值入参的缺失值以掩码传递到结果
+        if not res.nullable and token.name.upper() not in NULL_AWARE and \
+                any(t.nullable and numeric_kind(t.kind) for t in types):
+            res = res._replace(nullable=True)
+        return res
+
+    def _int_safe(self, token):
+        # 整数结果是否不含错误值: 决定错误的参数为满足条件的数值常量或省略
+        name = token.name.upper()
+        if name not in INT_ERRORS:
+            return True
+        position, safe = INT_ERRORS[name]
+        tokens = self.builder.inputs[token]
+        if len(tokens) <= position:
+            return True
+        if not isinstance(tokens[position], CONSTANTS):
+            return False
+        value = tokens[position].compile()
+        return isinstance(value, (int, float)) and safe(value)
+
+    def operator(self, token, types):
+        name, kinds = token.name, [t.kind for t in types]
+        nullable = any(t.nullable for t in types)
+        if name == '&':
+            return Type('str', False)
+        elif name in COMPARISONS:
+            return Type('bool', False)
+        elif name in ('+', '-', '*', 'u-'):
+            return numeric(*types)
+        elif name == 'u+':
+            return types[0]
+        elif name == '%':
+            return Type(numeric_kind(*kinds) and 'float', nullable)
+        elif name == '/':
+            # 除数为非零常量时不会产生 nan
+            divisor = self.builder.inputs[token][1]
+            nullable |= not (isinstance(divisor, CONSTANTS) and divisor.compile())
+            return Type(numeric_kind(*kinds) and 'float', nullable)
+        elif name == '^':
+            # 整数的负数次幂、溢出时为浮点数, 由 _int_safe 按指数判断
+            return Type(numeric_kind(*kinds), True)
+        return UNKNOWN
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import schedula as sh
+
+from .functions import COMPILING
+from .inference import CONSTANTS, TypeInference
+from .tokens.function import Function
+from .tokens.operand import (Column, ColumnAggregate, ColumnGroups, ColumnIsin,
+                             Constant, CustomColumn)
+from .tokens.operator import Operator
+
+
+def _scalar(value):
+    # 运算结果为 bool、int、float、str 标量时返回该值, 否则返回 sh.NONE
+    if isinstance(value, np.ndarray):
+        if value.ndim:
+            return sh.NONE
+        value = value.tolist()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if type(value) not in (bool, int, float, str):
+        return sh.NONE
+    if isinstance(value, float) and not np.isfinite(value):
+        return sh.NONE
+    return value
+
+
+class Optimizer(object):
+    """
+    常量折叠与代数化简, 由 AstBuilder 在运算节点加入执行图前调用:
+    操作数均为常量的纯运算、方法在解析阶段求值, 常量条件的 IF 只保留选中的分支,
+    *1、+0、-0、/1、^1、&'' 等恒等运算直接返回操作数,
+    文本列与字符串常量的 =、<> 及同一列的 OR(=...)、AND(<>...) 替换为 ColumnIsin,
+    只有一个列入参的整列聚合方法替换为 ColumnAggregate.
+    条件聚合的条件区域、分组聚合的分组列为文本列时, 入参替换为 ColumnGroups (见 arguments).
+    返回替代运算节点的 token, 无需替换时返回 None
+    """
+    def __init__(self, builder):
+        self.builder = builder
+        self.types = TypeInference(builder)
+    # 恒等运算: {运算符: (右侧单位元, 左侧单位元)}
+    identities = {
+        '*': (1, 1),
+        '+': (0, 0),
+        '-': (0, None),
+        '/': (1, None),
+        '^': (1, None),
+        '&': ('', ''),
+    }
+
+    def __call__(self, token, tokens):
+        if isinstance(token, Function) and token.name.upper() == 'IF':
+            res = self.prune_if(tokens)
+            if res is not None:
+                return res
+        res = None
+        if isinstance(token, Function) and token.name.upper() in ('OR', 'AND'):
+            res = self.merge_isin(token.name.upper() == 'AND', tokens)
+        elif isinstance(token, Operator) and token.name in ('=', '<>') and len(tokens) == 2:
+            res = self.isin(token.name == '<>', *tokens)
+        elif isinstance(token, Function) and len(tokens) == 1:
+            res = self.aggregate(token, tokens[0])
+        if res is not None:
+            return res
+        if all(isinstance(t, CONSTANTS) for t in tokens):
+            return self.fold(token, tokens)
+        if isinstance(token, Operator) and len(tokens) == 2:
+            return self.simplify(token, *tokens)
+        return None
+
+    @staticmethod
+    def is_pure(token):
+        func = token.compile()
+        if isinstance(func, dict):
+            if COMPILING in func.get('extra_inputs', {}):
+                return False
+            func = func['function']
+        return not getattr(func, 'is_impure', False)
+
+    def fold(self, token, tokens):
+        if isinstance(token, Operator) and token.name in ' ,:' or not self.is_pure(token):
+            return None
+        func = token.compile()
+        if isinstance(func, dict):
+            func = func['function']
+        try:
+            value = _scalar(func(*(t.compile() for t in tokens)))
+        except Exception:
+            # 求值失败时保留运算节点, 由执行阶段处理
+            return None
+        if value is sh.NONE:
+            return None
+        return Constant(value)
+
+    def kind(self, token):
+        return self.types(token).kind
+
+    def prune_if(self, tokens):
+        condition = tokens[0]
+        if not isinstance(condition, CONSTANTS) or self.kind(condition) not in ('bool', 'int', 'float'):
+            return None
+        branches = list(tokens[1:]) + [Constant(1), Constant(0)][len(tokens) - 1:]
+        x, y = branches[:2]
+        # 分支类型一致时才裁剪, 否则结果类型由两个分支共同决定
+        if self.kind(x) is None or self.kind(x) != self.kind(y):
+            return None
+        return x if condition.compile() else y
+
+    def isin(self, negate, x, y):
+        if isinstance(x, CONSTANTS):
+            x, y = y, x
+        if not isinstance(x, (Column, CustomColumn)) or isinstance(x, ColumnIsin) or not isinstance(y, CONSTANTS):
+            return None
+        if self.kind(x) != 'str' or not isinstance(y.compile(), str):
+            return None
+        return ColumnIsin(x, [y.compile()], negate)
+
+    def aggregate(self, token, x):
+        # 只替换 wrap_reduction 的方法, 运行时注册替换的方法按注册的方法计算
+        func = token.compile()
+        if getattr(func, 'column', None) is None or not isinstance(x, (Column, CustomColumn)) or \
+                isinstance(x, (ColumnIsin, ColumnAggregate)):
+            return None
+        return ColumnAggregate(x, token.name.upper(), func)
+
+    def arguments(self, token, tokens):
+        """
+        替换运算节点的入参, 由 AstBuilder 在入参加入执行图后调用
+        return: (入参位置, 替代的 token) 列表
+        """
+        positions = isinstance(token, Function) and getattr(token.compile(), 'group_args', None)
+        if not positions:
+            return []
+        res = []
+        for i in positions(len(tokens)):
+            x = tokens[i]
+            if not isinstance(x, (Column, CustomColumn)) or isinstance(x, (ColumnIsin, ColumnAggregate, ColumnGroups)):
+                continue
+            if self.kind(x) == 'str':
+                res.append((i, ColumnGroups(x)))
+        return res
+
+    def merge_isin(self, negate, tokens):
+        # OR(列=a, 列=b) 为 ISIN(列, a, b), AND(列<>a, 列<>b) 为 NOT(ISIN(列, a, b))
+        if not tokens or not all(isinstance(t, ColumnIsin) and t.negate == negate for t in tokens):
+            return None
+        if len({t.column.get_expr for t in tokens}) != 1:
+            return None
+        return ColumnIsin(tokens[0].column, sum((t.values for t in tokens), ()), negate)
+
+    def simplify(self, token, x, y):
+        name = token.name
+        if name not in self.identities:
+            return None
+        right, left = self.identities[name]
+        if self._is_identity(name, y, right, x):
+            return x
+        if left is not None and self._is_identity(name, x, left, y):
+            return y
+        return None
+
+    def _is_identity(self, name, token, unit, other):
+        if not isinstance(token, CONSTANTS):
+            return False
+        value, kind = token.compile(), self.kind(other)
+        if type(value) is not type(unit) and not (type(value) is float and type(unit) is int) or value != unit:
+            return False
+        if isinstance(unit, str):
+            # & 将数据集列的缺失值转换为文本, 只化简运算结果
+            return kind == 'str' and not isinstance(other, (Column, CustomColumn))
+        if kind == 'float':
+            return True
+        # 整数与整数单位元运算结果仍为整数, 除法结果为浮点数
+        return kind == 'int' and type(value) is int and name != '/'
@@ -1,30 +1,58 @@
 # -*- coding: utf-8 -*-
 
+import collections
+import concurrent.futures
 import datetime
+import hashlib
+import logging
+import os
 import random
 import string
 import time
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import regex
 import schedula
 import vaex
 
 from .builder import AstBuilder
-from .exceptions import BaseError, FormulaError, TokenError
-from .functions import Array, get_functions
+from .cache import LRUCache
+from .exceptions import BaseError, FormulaError, TokenError, VirtualColumnError
+from .functions import (REGISTRY, Array, Groups, fill_nulls, is_aggregate,
+                        strip_nulls)
+from .inference import TypeInference
+from .resolver import DependencyResolver
+from .scanner import Scanner
 from .tokens.function import Function
-from .tokens.operand import Column, CustomColumn, Error, Number, String
+from .tokens.operand import (Column, ColumnAggregate, ColumnGroups, ColumnIsin,
+                             CustomColumn, Error, Number, String, has_column)
 from .tokens.operator import OperatorToken, Separator
 from .tokens.parenthesis import Parenthesis
+from .virtual import VirtualCompiler
+
+logger = logging.getLogger(__name__)
+
+
+ParseResult = collections.namedtuple(
+    'ParseResult', 'tokens builder format_formula formula_columns formula_custom_columns schema')
+# 衍生列的计算记录: 引用的数据集列 (含经衍生变量传递引用的列)、衍生变量, 计算时的行数, 是否含整列聚合方法
+DerivedColumn = collections.namedtuple(
+    'DerivedColumn', 'formula dtype formula_columns formula_custom_columns rows aggregate virtual')
 
 
 class Parser(object):
     formula_check = regex.compile(r"""
         (?P<value>^=\s*(?P<name>\S.*)$)
         """, regex.IGNORECASE | regex.X | regex.DOTALL)
+    # 公式文本规范化: 去除字符串常量以外的空白, 仅保留分隔变量名、方法名的空白
+    normalize_re = regex.compile(r"""("(?>""|[^"])*"|'(?>''|[^'])*')|(?<=[\w\.])(\s+)(?=[\w\.\(\[])|\s+""")
     ast_builder = AstBuilder
+    # 解析结果缓存的大小; 缓存以规范化公式、衍生变量定义为键, 并校验引用列的类型,
+    # 缓存的执行图引用数据集, 每个解析器一个缓存, 解析器释放或更换数据集时数据集可被回收
+    ast_cache_size = 512
     # 错误、字符串、数字、列名、运算符、逗号、方法、括号
     filters = [
         Error,
@@ -37,10 +65,14 @@ class Parser(object):
         Function,
         Parenthesis,
     ]
+    scanner = Scanner(filters)
+    # 多进程计算的最少行数, 行数较少时进程启动与结果传输的开销大于计算
+    parallel_min_rows = 100000
 
-    def __init__(self, df=vaex.dataframe.DataFrameLocal(), custom_var_map=None):
+    def __init__(self, df=vaex.dataframe.DataFrameLocal(), custom_var_map=None, column_cache=None):
         """
         params: df: 数据集
+        params: column_cache: 衍生列的磁盘缓存 cache.ColumnCache, 默认不缓存
         params: custom_var_map: 变量映射关系 {column_alias: {
             "var": new_column,
             # 前端展示名称
@@ -58,12 +90,22 @@ class Parser(object):
         self.custom_var_map = {i["alias"]: i for i in custom_var_map.values()}
         self.formula_columns = []
         self.formula_custom_columns = []
+        # 文本列的字典编码缓存 {列名: (数据集, 列, (编码, 类别))}
+        self._encodings = {}
+        # 新增、编辑的衍生列 {列名: DerivedColumn}, 供 update 增量计算
+        self.derived_columns = {}
+        self.column_cache = column_cache
+        # 与磁盘缓存一致的衍生列 {列名: 缓存键}, 作为引用该列的公式的数据来源标识
+        self._column_keys = {}
+        self.ast_cache = LRUCache(maxsize=self.ast_cache_size)
 
     def set_df(self, df):
+        if df is not self.df:
+            self.ast_cache.clear()
         self.df = df
 
     def open_file(self, df_path):
-        self.df = vaex.open(df_path)
+        self.set_df(vaex.open(df_path))
 
     def is_formula(self, value):
         return bool(self._formula(value)) or False
@@ -71,7 +113,8 @@ class Parser(object):
     def _formula(self, value):
         return self.formula_check.match(value)
 
-    def _set_format_formula(self, tokens):
+    def _format_formula(self, tokens):
+        # 格式化公式, 衍生变量展开为其格式化公式; 不修改解析器状态, 由 ast 赋值给 format_formula
         __format_formula = ["="]
         for t in tokens:
             if isinstance(t, String):
@@ -84,11 +127,53 @@ class Parser(object):
                 __format_formula.append(self.custom_var_map["策略衍生_" + t.name]["format_formula"].strip("="))
             else:
                 __format_formula.append(t.name)
-        self.format_formula = "".join(__format_formula)
+        return "".join(__format_formula)
+
+    def _custom_var_key(self):
+        return tuple(sorted((k, v.get("var"), v.get("format_formula")) for k, v in self.custom_var_map.items()))
+
+    def _schema(self, names):
+        return tuple((n, str(self.df.data_type(n)) if has_column(self.df, n) else None) for n in names)
+
+    def _cache_key(self, expression):
+        expression = self.normalize_re.sub(lambda m: m.group(1) or (m.group(2) and ' ') or '', expression.strip())
+        return expression, self._custom_var_key()
 
     def ast(self, expression, context=None):
+        self.formula = expression
+        parsed = self._cached_parse(expression, context)
+        self.format_formula = parsed.format_formula
+        self.formula_custom_columns.extend(parsed.formula_custom_columns)
+        columns = parsed.formula_columns
+        if parsed.formula_custom_columns:
+            columns, _ = self.resolver().expand(columns, parsed.formula_custom_columns)
+        self.formula_columns = list(set(self.formula_columns).union(columns))
+        return parsed.tokens, parsed.builder
+
+    def resolver(self, formulas=None):
+        """
+        params: formulas: 衍生变量公式 {策略衍生_name: formula}, 默认取 custom_var_map 中的 format_formula
+        """
+        if formulas is None:
+            formulas = {k: v["format_formula"] for k, v in self.custom_var_map.items()}
+        return DependencyResolver(formulas, self._references)
+
+    def _references(self, expression):
+        # 衍生变量公式直接引用的数据集列及衍生变量
+        parsed = self._cached_parse(expression)
+        return parsed.formula_columns, parsed.formula_custom_columns
+
+    def _cached_parse(self, expression, context=None):
+        if context is not None:
+            return self._parse(expression, context)
+        key = self._cache_key(expression)
+        parsed = self.ast_cache.get(key, valid=lambda p: p.schema == self._schema(n for n, _ in p.schema))
+        if parsed is None:
+            parsed = self.ast_cache[key] = self._parse(expression)
+        return parsed
+
+    def _parse(self, expression, context=None, builder=None):
         try:
-            self.formula = expression
             match = self._formula(expression).groupdict()
             # match = self._formula(expression.replace('\n', '').replace('    ',
             #                                                            '').replace(' ', '').replace('"',
@@ -97,28 +182,27 @@ class Parser(object):
             # self.format_formula = "=" + match['name']
         except (AttributeError, KeyError):
             raise FormulaError
-        builder = self.ast_builder(match=match, df=self.df, custom_var_map=self.custom_var_map)
+        if builder is None:
+            builder = self.ast_builder(match=match, df=self.df, custom_var_map=self.custom_var_map)
+        else:
+            builder.match = match
         filters, tokens, stack = self.filters, [], []
+        formula_columns, formula_custom_columns = [], []
         Parenthesis('(').ast(tokens, stack, builder)
-        while expr:
-            for f in filters:
+        pos, scanner = 0, self.scanner
+        while pos < len(expr):
+            for f in filters[scanner.first(expr, pos):]:
                 try:
-                    token = f(expr, context)
+                    token = f(expr, context, pos)
                     token.ast(tokens, stack, builder)
-                    expr = expr[token.end_match:]
+                    pos = token.end_match
                     if isinstance(token, Column):
                         if token.name.startswith("策略衍生_"):
-                            self.formula_custom_columns.append(token.name)
-                            subp = Parser(df=self.df, custom_var_map=self.custom_var_map)
-                            subp.ast(self.custom_var_map[token.name]["format_formula"])
-                            self.formula_columns.extend(subp.formula_columns)
+                            formula_custom_columns.append(token.name)
                         else:
-                            self.formula_columns.append(token.name)
+                            formula_columns.append(token.name)
                     elif isinstance(token, CustomColumn):
-                        subp = Parser(df=self.df, custom_var_map=self.custom_var_map)
-                        subp.ast(self.custom_var_map["策略衍生_" + token.name]["format_formula"])
-                        self.formula_columns.extend(subp.formula_columns)
-                        self.formula_custom_columns.append("策略衍生_" + token.name)
+                        formula_custom_columns.append("策略衍生_" + token.name)
                     break
                 except TokenError:
                     pass
@@ -126,7 +210,7 @@ class Parser(object):
                 raise FormulaError()
         Parenthesis(')').ast(tokens, stack, builder)
         tokens = tokens[1:-1]
-        self._set_format_formula(tokens)
+        format_formula = self._format_formula(tokens)
         while stack:
             if isinstance(stack[-1], Parenthesis):
                 raise FormulaError()
@@ -134,33 +218,211 @@ class Parser(object):
         if len(builder) != 1:
             raise FormulaError()
         builder.finish()
-        self.formula_columns = list(set(self.formula_columns))
-        return tokens, builder
+        return ParseResult(tokens, builder, format_formula, list(set(formula_columns)), formula_custom_columns,
+                           self._schema(sorted(t.var_name() for t in builder.references.values())))
+
+    def cache_info(self):
+        return self.ast_cache.info()
 
-    def run(self, expression):
+    def run(self, expression, chunk_size=None, out=None, workers=None, partition_size=None):
+        """
+        params: chunk_size: 分块计算的行数, 默认一次计算全部行; 公式含整列聚合方法时一次计算全部行
+        params: out: 预分配的输出缓冲, 长度与数据集行数一致, 可为 np.memmap 将结果直接写入磁盘
+        params: workers: 进程数, 大于 1 时按行分区多进程计算, 不满足并行条件时串行计算
+        params: partition_size: 每个分区的行数, 默认按进程数均分
+        """
         if len(self.df) == 0:
             raise BaseError("未发现数据集, 请配置")
         try:
             _, builder = self.ast(expression)
-            f = builder.compile()
-            rst = f()
-            if not isinstance(rst, np.ndarray):
-                rst = np.array([rst])
-            elif isinstance(rst, Array):
-                rst = np.array(rst.tolist())
+        except ValueError:
+            raise BaseError("公式运算错误")
+        if workers and workers > 1:
+            path = self._parallel_source(builder)
+            if path is not None:
+                return self._run_parallel(path, expression, workers, partition_size, chunk_size, out)
+        types = [TypeInference(builder)()]
+        return self._evaluate(builder, chunk_size=chunk_size, out=None if out is None else [out], types=types)[0]
+
+    def infer_type(self, expression):
+        """
+        不执行计算, 由数据集列类型、常量及方法推断公式结果的类型
+        return: Type(kind, nullable), kind 为 bool、int、float、str, 无法确定时为 None
+        """
+        _, builder = self.ast(expression)
+        return TypeInference(builder)()
+
+    def _parallel_source(self, builder):
+        """
+        可并行计算时返回引用列所在的内存映射文件路径, 否则返回 None 串行计算:
+        数据集行数少于 parallel_min_rows、含整列聚合方法、引用列不全是同一个文件中未修改的列
+        (排序、打乱、切片、过滤、重命名或替换列后行与文件不一致, 各进程重新打开文件会读取错误的行)
+        """
+        size = len(self.df)
+        if size < self.parallel_min_rows or self.df.filtered:
+            return None
+        if _has_aggregate(builder.inputs.items()):
+            return None
+        columns = set(builder.input_columns(builder.references, self.df))
+        if any(c in self.df.virtual_columns for c in columns):
+            return None
+        paths = {getattr(_column_origin(self.df.dataset, c), 'path', None) for c in columns}
+        if len(paths) != 1 or None in paths or self.df.dataset.row_count != size:
+            return None
+        return paths.pop()
+
+    def _run_parallel(self, path, expression, workers, partition_size=None, chunk_size=None, out=None):
+        # 按行分区提交到进程池, 各进程重新打开内存映射文件只读取所在分区, 结果按分区顺序写入输出缓冲
+        size = len(self.df)
+        partitions = _ranges(size, partition_size or -(-size // workers))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_run_partition, path, self.custom_var_map, expression, start, stop, chunk_size)
+                for start, stop in partitions
+            ]
+            own = out is None
+            for (start, _), future in zip(partitions, futures):
+                out = self._write_chunk(out, future.result(), start, size, own)
+        return out
+
+    def _evaluate(self, builder, outputs=None, chunk_size=None, out=None, types=None):
+        """
+        按行分块执行编译的计划, 每块结果写入输出缓冲
+        params: outputs: 输出节点列表, 默认为公式结果节点
+        params: out: 与输出节点一一对应的预分配输出缓冲
+        params: types: 与输出节点一一对应的推断类型, 类型确定且无缺失值的 object 结果转换为类型数组
+        return: 计算结果列表
+        """
+        size = len(self.df)
+        if not chunk_size or _has_aggregate(builder.inputs.items()):
+            chunk_size = size
+        try:
+            f = builder.compile(outputs=outputs)
+            n = len(f.outputs)
+            own = [True] * n if out is None else [b is None for b in out]
+            out = list(out) if out is not None else [None] * n
+            types = types or [None] * n
+            for start, stop, inputs in self._iter_chunks(builder.input_tokens(f.inputs, self.df), chunk_size):
+                rst = f(*inputs)
+                for i, r in enumerate(rst if n > 1 else [rst]):
+                    r = self._typed(self._as_column(r, stop - start), types[i])
+                    if out[i] is None and stop - start == size:
+                        out[i] = r
+                    else:
+                        out[i] = self._write_chunk(out[i], r, start, size, own[i])
         except ValueError:
             raise BaseError("公式运算错误")
         except schedula.DispatcherError:
             raise BaseError("公式运算错误")
-        if len(rst) < len(self.df):
+        return out
+
+    def _iter_chunks(self, tokens, chunk_size):
+        """
+        按行分块读取计划入参的数据集列, 内存映射的数据集每次只加载一块;
+        文本列的成员判断、分组按字典编码计算, 整列聚合在分块前计算一次
+        """
+        size = len(self.df)
+        columns = [t.var_name() for t in tokens if not isinstance(t, (ColumnIsin, ColumnAggregate, ColumnGroups))]
+        aggregates = {t: self._aggregate(t) for t in tokens if isinstance(t, ColumnAggregate)}
+        for start, stop in _ranges(size, chunk_size) if chunk_size < size else [(0, size)]:
+            if stop - start == size:
+                values = iter([self.df[c].to_numpy() for c in columns])
+            else:
+                values = iter(self.df.evaluate(columns, start, stop, array_type='numpy') if columns else [])
+            yield start, stop, [self._isin(t, start, stop) if isinstance(t, ColumnIsin) else
+                                self._groups(t, start, stop) if isinstance(t, ColumnGroups) else
+                                aggregates[t] if t in aggregates else next(values) for t in tokens]
+
+    def _aggregate(self, token):
+        # 数值列与 COUNT 由 vaex 的聚合方法并行计算, 与整列聚合的方法一致: 跳过缺失值与 nan, 布尔值按整数计算
+        name, aggregator = token.var_name(), token.function.aggregator
+        data_type = self.df.data_type(name)
+        if aggregator is None or aggregator != 'count' and not (data_type.is_numeric or data_type == bool):
+            return token.compile()
+        if aggregator in ('min', 'max') and not self.df.count(name):
+            return np.nan
+        res = np.asarray(getattr(self.df, aggregator)(name))[()]
+        return res.astype(np.int64)[()] if res.dtype == bool else res
+
+    def _isin(self, token, start, stop):
+        codes, categories = self._encoding(token.var_name())
+        return token.lookup(categories)[codes[start:stop]]
+
+    def _groups(self, token, start, stop):
+        codes, categories = self._encoding(token.var_name())
+        return Groups(codes[start:stop], categories)
+
+    def _encoding(self, name):
+        """
+        文本列的字典编码, 按列缓存到 Parser 生命周期结束, 数据集或列被替换时重新编码
+        return: 各行的编码 (缺失值为 -1), 编码对应的类别
+        """
+        column = self.df.columns.get(name, self.df.virtual_columns.get(name))
+        cached = self._encodings.get(name)
+        if cached is not None and cached[0] is self.df and cached[1] is column:
+            return cached[2]
+        values = self.df[name].values
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        if isinstance(values, pa.Array):
+            encoded = pc.dictionary_encode(values)
+            res = pc.fill_null(encoded.indices, -1).to_numpy(), encoded.dictionary.to_numpy(zero_copy_only=False)
+        else:
+            res = pd.factorize(np.asarray(values))
+        self._encodings[name] = self.df, column, res
+        return res
+
+    @staticmethod
+    def _write_chunk(buffer, chunk, start, size, own=True):
+        """
+        首块结果确定缓冲类型, 后续块类型不一致时按 numpy 规则提升; 含缺失值掩码的结果写入掩码数组
+        params: own: 缓冲是否由计算过程分配, 调用方提供的缓冲不改变类型, 非掩码数组只写入数据
+        """
+        if buffer is None:
+            buffer = np.empty(size, chunk.dtype)
+        elif own and np.result_type(buffer, chunk) != buffer.dtype:
+            buffer = buffer.astype(np.result_type(buffer, chunk))
+        if np.ma.isMaskedArray(chunk) and not np.ma.isMaskedArray(buffer):
+            if own:
+                buffer = np.ma.array(buffer, mask=np.zeros(size, bool))
+            else:
+                chunk = np.ma.getdata(chunk)
+        buffer[start:start + len(chunk)] = chunk
+        return buffer
+
+    @staticmethod
+    def _as_column(rst, size):
+        # 计算结果转换为数组, 常量与整列聚合的标量结果广播到数据集行数
+        if not isinstance(rst, np.ndarray) or not rst.ndim:
+            rst = np.array([rst])
+        elif isinstance(rst, Array):
+            rst = np.array(rst.tolist())
+        if len(rst) < size:
             if len(rst) == 1:
-                rst = np.full(len(self.df), rst[0])
+                rst = np.full(size, rst[0])
             else:
-                rst = rst.resize(range(len(self.df)))
+                rst = rst.resize(range(size))
         return rst
 
-    def test(self, expression):
+    @staticmethod
+    def _typed(rst, _type):
+        dtype = {'bool': bool, 'int': np.int64, 'float': np.float64}.get(_type and _type.kind)
+        if dtype is None or _type.nullable or rst.dtype != object or np.ma.isMaskedArray(rst):
+            return rst
         try:
+            return rst.astype(dtype)
+        except (TypeError, ValueError):
+            return rst
+
+    def test(self, expression, run=True):
+        """
+        params: run: 为 False 时不执行计算, 只返回推断的结果类型
+        """
+        try:
+            if not run:
+                _type = self.infer_type(expression)
+                nullable = "是" if _type.nullable else "否"
+                return "运算成功", "类型: {}, 可能含空值: {}".format(_type.kind or "未知", nullable)
             self.df = self.df.head(10)
             arr = self.run(expression)
             sr = pd.Series(arr)
@@ -192,131 +454,335 @@ class Parser(object):
             random.seed(time.time())
 
             new_column = _prefix + ''.join(random.sample(words, 10))
-            if new_column not in self.df.columns:
+            if not has_column(self.df, new_column):
                 break
         return new_column
 
-    def add_column(self, formula, dtype=None, prefix="custom", column_name=None, force=False):
-        if column_name:
-            if force:
-                new_column = column_name
-            else:
-                if column_name not in self.df.columns:
-                    new_column = column_name
-                else:
-                    new_column = self._new_var_name(prefix)
-        else:
-            new_column = self._new_var_name(prefix)
-        arr = self.run(formula)
-        sr = pd.Series(arr, name=new_column)
-        if dtype:
+    def add_column(self, formula, dtype=None, prefix="custom", column_name=None, force=False, virtual=False,
+                   **kwargs):
+        """
+        params: virtual: 是否编译为 vaex 虚拟列惰性计算, 无法编译时回退到常规计算
+        params: kwargs: 分块、多进程计算的参数 chunk_size、workers、partition_size, 见 run
+        """
+        new_column = self._column_name(column_name, prefix, force)
+        return self._set_column(formula, new_column, dtype=dtype, virtual=virtual, **kwargs)
+
+    def _column_name(self, column_name=None, prefix="custom", force=False):
+        if column_name and (force or not has_column(self.df, column_name)):
+            return column_name
+        return self._new_var_name(prefix)
+
+    def add_columns(self, formulas, dtype=None, prefix="custom", force=False, virtual=False, chunk_size=2 ** 20):
+        """
+        批量新增衍生列, 全部公式合并到同一个执行图, 每个数据集列只加载一次, 相同的子表达式只计算一次
+        同一批次的公式读取的是新增前的数据集, 不能引用同批次新增的列
+        params: formulas: 公式列表, 或 {column_name: formula}
+        params: chunk_size: 分块计算的行数, 公式含整列聚合方法时一次计算全部行
+        return: [column_info, ...], df
+        """
+        items, names = formulas.items() if isinstance(formulas, dict) else [(None, f) for f in formulas], set()
+        columns = []
+        for column_name, formula in items:
+            new_column = self._column_name(column_name, prefix, force)
+            while new_column in names:
+                new_column = self._new_var_name(prefix)
+            names.add(new_column)
+            columns.append((formula, new_column))
+        return self._set_columns(columns, dtype=dtype, virtual=virtual, chunk_size=chunk_size)
+
+    def edit_column(self, formula, column_name, column_alias=None, dtype=None, virtual=False, **kwargs):
+        return self._set_column(formula, column_name, dtype=dtype, virtual=virtual, **kwargs)
+
+    def virtual_expression(self, expression):
+        _, builder = self.ast(expression)
+        compiler = VirtualCompiler(builder, self.df)
+        return compiler.compile(), compiler.columns
+
+    def _set_column(self, formula, column_name, dtype=None, virtual=False, **kwargs):
+        _type = None
+        if virtual:
             try:
-                sr = sr[column_name].astype(dtype)
-            except Exception:
-                raise BaseError("衍生列不支持转换为{}类型".format(dtype))
-        else:
-            sr = sr.infer_objects()
-        # if sr.isna().values.any():
-        #     raise BaseError("逻辑生成的变量存在空值, 不可进行当前操作")
-        _dtype = sr.dtype
-        ndf = vaex.from_dict({new_column: sr.tolist()})
-        if _dtype == "object":
-            _type = "str"
-            if new_column in self.df.get_column_names():
-                self.df[new_column] = ndf[new_column].values
-                self.df[new_column] = self.df[new_column].astype("string")
-            else:
-                self.df.add_column(new_column, ndf[new_column].values, dtype="string")
-        elif _dtype == "float64":
-            _type = "float"
-            if new_column in self.df.get_column_names():
-                self.df[new_column] = ndf[new_column].values
-                self.df[new_column] = self.df[new_column].astype("float64")
-            else:
-                self.df.add_column(new_column, ndf[new_column].values, dtype="float64")
-        elif _dtype == "int64":
-            _type = "int"
-            if new_column in self.df.get_column_names():
-                self.df[new_column] = ndf[new_column].values
-                self.df[new_column] = self.df[new_column].astype("int64")
-            else:
-                self.df.add_column(new_column, ndf[new_column].values, dtype="int64")
-        else:
-            _type = "str"
-            if new_column in self.df.get_column_names():
-                self.df[new_column] = ndf[new_column].values
-                self.df[new_column] = self.df[new_column].astype("string")
+                _type = self._set_virtual_column(formula, column_name, dtype)
+            except VirtualColumnError as e:
+                logger.warning("公式%s回退到常规计算: %s", formula, e.msg)
+        if _type is None:
+            # 命中缓存时不计算, 由 ast 记录公式、格式化公式与引用列
+            self.ast(formula)
+            key = self._column_cache_key(formula, dtype)
+            _type = self._load_cached_column(key, column_name)
+            if _type is None:
+                _type = self._set_array_column(self.run(formula, **kwargs), column_name, dtype, key)
+        self._record_derived(column_name, formula, dtype, self._cached_parse(formula))
+        return self._column_info(column_name, _type), self.df
+
+    def _column_cache_key(self, formula, dtype=None):
+        """
+        衍生列的磁盘缓存键: 规范化的公式文本、dtype、行数, 及引用列 (含衍生变量的列) 的名称、类型、来源;
+        只由传入的公式计算, 不读取解析器的 format_formula 等状态;
+        未配置缓存、数据集已过滤或引用列不全来自文件或已缓存的衍生列时返回 None
+        """
+        if self.column_cache is None or self.df.filtered:
+            return None
+        try:
+            builder = self._cached_parse(formula).builder
+            columns = sorted(set(builder.input_columns(builder.references, self.df)))
+        except (ValueError, BaseError):
+            return None
+        sources = [self._column_source(c) for c in columns]
+        if None in sources:
+            return None
+        references = [(c, str(self.df.data_type(c)), source) for c, source in zip(columns, sources)]
+        payload = (self._cache_key(formula)[0], dtype, len(self.df), references)
+        return hashlib.sha256(repr(payload).encode('utf-8')).hexdigest()
+
+    def _column_source(self, name):
+        """
+        列的来源标识: 已缓存衍生列的缓存键, 或所在文件的路径、大小、修改时间;
+        列经过排序、打乱、切片、过滤或被替换, 行与来源不一致时返回 None
+        """
+        if self.df.dataset.row_count != len(self.df) or name in self.df.virtual_columns:
+            return None
+        origin = _column_origin(self.df.dataset, name)
+        if origin is None:
+            return None
+        if name in self._column_keys:
+            return self._column_keys[name]
+        path = getattr(origin, 'path', None)
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            return None
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+    def _load_cached_column(self, key, column_name):
+        # 命中缓存时把内存映射的列挂载到数据集, 返回列类型
+        cached = self.column_cache.get(key, len(self.df)) if key else None
+        if cached is None:
+            return None
+        arr, _type = cached
+        if column_name in self.df.get_column_names(hidden=True):
+            self.df.drop(column_name, inplace=True)
+        self.df.add_column(column_name, arr)
+        self._column_keys[column_name] = key
+        return _type
+
+    def _record_derived(self, column_name, formula, dtype, parsed):
+        columns = parsed.formula_columns
+        if parsed.formula_custom_columns:
+            columns, _ = self.resolver().expand(columns, parsed.formula_custom_columns)
+        aggregate = _has_aggregate((t, parsed.builder.inputs.get(t, ())) for t in parsed.tokens)
+        self.derived_columns[column_name] = DerivedColumn(
+            formula, dtype, frozenset(columns), frozenset(parsed.formula_custom_columns), len(self.df), aggregate,
+            column_name in self.df.virtual_columns)
+
+    def _derived_reads(self, derived):
+        # 衍生列读取的数据集列名, 衍生变量转换为对应的列名
+        custom = (self.custom_var_map[k]["var"] for k in derived.formula_custom_columns if k in self.custom_var_map)
+        return derived.formula_columns.union(custom)
+
+    def _derived_order(self):
+        """
+        衍生列按依赖的拓扑顺序排列, 被引用的衍生列在前
+        """
+        order, visiting = [], set()
+
+        def visit(name):
+            if name in order or name in visiting:
+                return
+            visiting.add(name)
+            for dep in sorted(self._derived_reads(self.derived_columns[name]) & self.derived_columns.keys()):
+                if dep != name:
+                    visit(dep)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self.derived_columns:
+            visit(name)
+        return order
+
+    def update(self, df=None, changed_columns=(), appended_rows=None, **kwargs):
+        """
+        数据集追加行或源列更新后, 按依赖的拓扑顺序只重新计算受影响的衍生列:
+        引用了变更列 (含经衍生变量传递引用) 或被整列重算的衍生列时整列重算, 含整列聚合方法的公式整列重算,
+        其余公式只计算追加的行; 虚拟列惰性计算, 只在新数据集中缺失或引用的列变更时重新添加
+        (vaex 覆盖列时已有虚拟列仍引用原来的列)
+        params: df: 追加行或更新列后的数据集, 默认为当前数据集
+        params: changed_columns: 值有变化的数据集列
+        params: appended_rows: 追加在末尾的行数, 默认为各衍生列上次计算之后新增的行数
+        params: kwargs: 分块、多进程计算的参数, 见 run
+        return: [column_info, ...], df
+        """
+        old = self.df
+        if df is not None:
+            self.df = df
+        size, changed, infos = len(self.df), set(changed_columns), []
+        for name in self._derived_order():
+            derived = self.derived_columns[name]
+            start = derived.rows if appended_rows is None else size - appended_rows
+            source = self.df if has_column(self.df, name) else old
+            full = derived.aggregate and start != size or bool(changed & self._derived_reads(derived)) or \
+                not 0 <= start <= min(size, len(source)) or not has_column(source, name)
+            if not full and (start == size or derived.virtual and name in self.df.virtual_columns):
+                continue
+            parsed = self._cached_parse(derived.formula)
+            self.formula, self.format_formula = derived.formula, parsed.format_formula
+            if derived.virtual:
+                _type = self._set_virtual_column(derived.formula, name, derived.dtype)
+            elif full:
+                _type = self._set_array_column(self.run(derived.formula, **kwargs), name, derived.dtype)
             else:
-                self.df.add_column(new_column, ndf[new_column].values, dtype="string")
-        sample_data_rows = self.df.head(50).dropna(column_names=[new_column])
+                _type = self._set_array_column(self._append_rows(name, derived, source, start, **kwargs), name,
+                                               derived.dtype)
+            if full:
+                changed.add(name)
+            self.derived_columns[name] = derived._replace(rows=size)
+            infos.append(self._column_info(name, _type))
+        return infos, self.df
+
+    def _append_rows(self, name, derived, source, start, **kwargs):
+        # 只计算 [start, 行数) 的新增行, 与已有的前 start 行合并
+        size = len(self.df)
+        part = Parser(df=self.df[start:], custom_var_map=self.custom_var_map).run(derived.formula, **kwargs)
+        buffer = None
+        if start:
+            buffer = self._write_chunk(None, source.evaluate(name, 0, start, array_type='numpy'), 0, size)
+        return self._write_chunk(buffer, part, start, size)
+
+    def _column_info(self, column_name, _type):
+        sample_data_rows = self.df.head(50).dropna(column_names=[column_name])
         new_column_dict = {
-            "var": new_column,
+            "var": column_name,
             # 格式化后的自定义生成公式
             "format_formula": self.format_formula,
             # 原始自定义生成公式
             "formula": self.formula,
             "type": _type,
-            "sample_data": sample_data_rows.unique(new_column),
+            "sample_data": sample_data_rows.unique(column_name),
+            # 是否为虚拟列
+            "virtual": column_name in self.df.virtual_columns,
         }
-        return new_column_dict, self.df
+        return new_column_dict
+
+    def _set_columns(self, columns, dtype=None, virtual=False, chunk_size=None):
+        infos, pending = {}, []
+        for formula, column_name in columns:
+            if virtual:
+                try:
+                    _type = self._set_virtual_column(formula, column_name, dtype)
+                    infos[column_name] = self._column_info(column_name, _type)
+                    continue
+                except VirtualColumnError as e:
+                    logger.warning("公式%s回退到常规计算: %s", formula, e.msg)
+            pending.append((formula, column_name))
+        keys = {}
+        for formula, column_name in list(pending):
+            keys[column_name] = self._column_cache_key(formula, dtype)
+            _type = self._load_cached_column(keys[column_name], column_name)
+            if _type is not None:
+                self.formula, self.format_formula = formula, self._cached_parse(formula).format_formula
+                infos[column_name] = self._column_info(column_name, _type)
+                pending.remove((formula, column_name))
+        results = self._run_many([formula for formula, _ in pending], chunk_size) if pending else []
+        for (formula, column_name), (parsed, rst) in zip(pending, results):
+            self.formula, self.format_formula = formula, parsed.format_formula
+            _type = self._set_array_column(rst, column_name, dtype, keys[column_name])
+            infos[column_name] = self._column_info(column_name, _type)
+        for formula, column_name in columns:
+            self._record_derived(column_name, formula, dtype, self._cached_parse(formula))
+        return [infos[column_name] for _, column_name in columns], self.df
+
+    def _run_many(self, expressions, chunk_size=None):
+        """
+        多个公式合并为同一个执行图分块计算
+        return: [(ParseResult, 计算结果), ...]
+        """
+        if len(self.df) == 0:
+            raise BaseError("未发现数据集, 请配置")
+        builder = self.ast_builder(df=self.df, custom_var_map=self.custom_var_map)
+        parsed = [self._parse(e, builder=builder.branch()) for e in expressions]
+        outputs = [p.builder.get_node_id(p.builder[-1]) for p in parsed]
+        infer = TypeInference(builder)
+        types = [infer(p.builder[-1]) for p in parsed]
+        return list(zip(parsed, self._evaluate(builder, outputs, chunk_size, types=types)))
 
-    def edit_column(self, formula, column_name, column_alias=None, dtype=None):
-        arr = self.run(formula)
-        sr = pd.Series(arr, name=column_name)
+    def _set_virtual_column(self, formula, column_name, dtype=None):
+        expression, columns = self.virtual_expression(formula)
+        if column_name in columns:
+            raise VirtualColumnError("虚拟列{}不支持引用自身".format(column_name))
+        if dtype:
+            expression = 'astype({}, "{}")'.format(expression, dtype)
+        if column_name in self.df.get_column_names(hidden=True):
+            self.df.drop(column_name, inplace=True)
+        self._column_keys.pop(column_name, None)
+        try:
+            self.df.add_virtual_column(column_name, expression)
+            data_type = self.df.data_type(column_name)
+            self.df.evaluate(column_name, 0, min(len(self.df), 1))
+        except Exception as e:
+            # vaex 无法计算的表达式同样回退到常规计算
+            if column_name in self.df.virtual_columns:
+                self.df.drop(column_name, inplace=True)
+            raise VirtualColumnError("虚拟列表达式{}计算出错: {}".format(expression, e)) from e
+        if data_type.is_float:
+            return "float"
+        elif data_type.is_integer:
+            return "int"
+        return "str"
+
+    def _set_array_column(self, arr, column_name, dtype=None, cache_key=None):
+        """
+        params: cache_key: 磁盘缓存键, 为 None 时不写入缓存
+        """
+        arr, _type = self._column_array(arr, dtype)
+        self._column_keys.pop(column_name, None)
+        if cache_key is not None:
+            self.column_cache.put(cache_key, arr, _type)
+            self._column_keys[column_name] = cache_key
+        if column_name in self.df.virtual_columns:
+            self.df.drop(column_name, inplace=True)
+        # 数组直接挂载到数据集, 文本为 arrow 字符串数组
+        self.df.add_column(column_name, arr)
+        return _type
+
+    @staticmethod
+    def _column_array(arr, dtype=None):
+        """
+        计算结果转换为写入数据集的数组: 浮点、整数为 numpy 数组, 文本为 arrow 字符串数组,
+        含缺失值掩码的数值结果为带 null 的 arrow 数组; 类型推断与 pandas infer_objects 一致
+        return: 数组, 类型 float、int、str
+        """
+        if dtype in ("str", "string"):
+            return _to_string(fill_nulls(arr)), "str"
+        arr, mask = strip_nulls(arr)
+        # 布尔值的类型为文本
+        boolean = arr.dtype.kind == 'b'
+        if arr.dtype == object:
+            arr = pd.Series(arr, copy=False).infer_objects().to_numpy()
+        if mask is not None and arr.dtype.kind not in 'biuf':
+            # 非数值结果的缺失值为 None
+            arr = fill_nulls(np.ma.array(arr, mask=mask))
+            mask = None
         if dtype:
             try:
-                sr = sr[column_name].astype(dtype)
+                arr = arr.astype(dtype)
             except Exception:
                 raise BaseError("衍生列不支持转换为{}类型".format(dtype))
-        else:
-            sr = sr.infer_objects()
-        # if sr.isna().values.any():
-        #     raise BaseError("逻辑生成的变量存在空值, 不可进行当前操作")
-        _dtype = sr.dtype
-        ndf = vaex.from_dict({column_name: sr.tolist()})
-        if _dtype == "object":
+            boolean = arr.dtype.kind == 'b'
+        if boolean or arr.dtype.kind == 'b' or arr.dtype == object and pd.api.types.infer_dtype(arr) == 'boolean':
             _type = "str"
-            binning_type = "scatter"
-            if column_name in self.df.get_column_names():
-                self.df[column_name] = ndf[column_name].values
-                self.df[column_name] = self.df[column_name].astype("string")
-            else:
-                self.df.add_column(column_name, ndf[column_name].values, dtype="string")
-        elif _dtype == "float64":
+        elif arr.dtype == np.float64:
             _type = "float"
-            binning_type = "continuous"
-            if column_name in self.df.get_column_names():
-                self.df[column_name] = ndf[column_name].values
-                self.df[column_name] = self.df[column_name].astype("float64")
-            else:
-                self.df.add_column(column_name, ndf[column_name].values, dtype="float64")
-        elif _dtype == "int64":
+        elif arr.dtype == np.int64:
             _type = "int"
-            binning_type = "continuous"
-            if column_name in self.df.get_column_names():
-                self.df[column_name] = ndf[column_name].values
-                self.df[column_name] = self.df[column_name].astype("int64")
-            else:
-                self.df.add_column(column_name, ndf[column_name].values, dtype="int64")
+        elif arr.dtype.kind == 'f':
+            arr, _type = arr.astype(np.float64), "float"
+        elif arr.dtype.kind in 'iu':
+            arr, _type = arr.astype(np.int64), "int"
         else:
-            _type = "str"
-            binning_type = "scatter"
-            if column_name in self.df.get_column_names():
-                self.df[column_name] = ndf[column_name].values
-                self.df[column_name] = self.df[column_name].astype("string")
-            else:
-                self.df.add_column(column_name, ndf[column_name].values, dtype="string")
-        sample_data_rows = self.df.head(50).dropna(column_names=[column_name])
-        new_column_dict = {
-            "var": column_name,
-            # 格式化后的自定义生成公式
-            "format_formula": self.format_formula,
-            # 原始自定义生成公式
-            "formula": self.formula,
-            "type": _type,
-            "sample_data": sample_data_rows.unique(column_name),
-        }
-        return new_column_dict, self.df
+            return _to_string(arr), "str"
+        return (arr if mask is None else pa.array(arr, mask=mask)), _type
 
     def replace_custom(self, expression, column_map, context=None):
         """
@@ -324,76 +790,94 @@ class Parser(object):
         :params column_map origin_var: target_var
         """
         result_formula_element = ["="]
-        try:
-            self.formula = expression
-            match = self._formula(expression.replace('\n', '').replace('    ',
-                                                                       '').replace(' ', '').replace('"',
-                                                                                                    "'")).groupdict()
-            expr = match['name']
-            self.format_formula = "=" + match['name']
-        except (AttributeError, KeyError):
+        self.formula = expression
+        expression = expression.replace('\n', '').replace('    ', '').replace(' ', '').replace('"', "'")
+        if not self._formula(expression):
             raise FormulaError
-        builder = self.ast_builder(match=match, df=self.df, custom_var_map=self.custom_var_map)
-        filters, tokens, stack = self.filters, [], []
-        Parenthesis('(').ast(tokens, stack, builder)
-        while expr:
-            for f in filters:
-                try:
-                    token = f(expr, context)
-                    token.ast(tokens, stack, builder)
-                    expr = expr[token.end_match:]
-                    if isinstance(token, Column):
-                        if token.name not in column_map:
-                            raise BaseError("变量映射不存在{}".format(token.name))
-                        result_formula_element.append(column_map[token.name])
-                    elif isinstance(token, CustomColumn):
-                        if token.name not in column_map:
-                            raise BaseError("变量映射不存在{}".format("策略衍生_" + token.name))
-                        result_formula_element.append(column_map["策略衍生_" + token.name])
-                    elif isinstance(token, Function):
-                        result_formula_element.append(token.name + "(")
-                    elif isinstance(token, String):
-                        result_formula_element.append("'{}'".format(token.name))
-                    else:
-                        result_formula_element.append(token.name)
-                    break
-                except TokenError:
-                    pass
+        tokens = self._cached_parse(expression, context).tokens
+        self.format_formula = expression
+        for i, token in enumerate(tokens):
+            if isinstance(token, Column):
+                if token.name not in column_map:
+                    raise BaseError("变量映射不存在{}".format(token.name))
+                result_formula_element.append(column_map[token.name])
+            elif isinstance(token, CustomColumn):
+                if token.name not in column_map:
+                    raise BaseError("变量映射不存在{}".format("策略衍生_" + token.name))
+                result_formula_element.append(column_map["策略衍生_" + token.name])
+            elif isinstance(token, String):
+                result_formula_element.append("'{}'".format(token.name))
+            elif isinstance(token, Parenthesis) and i and isinstance(tokens[i - 1], Function):
+                # 方法的左括号已随方法名输出
+                continue
+            elif isinstance(token, Function):
+                result_formula_element.append(token.name + "(")
             else:
-                raise FormulaError()
-        Parenthesis(')').ast(tokens, stack, builder)
-        while stack:
-            if isinstance(stack[-1], Parenthesis):
-                raise FormulaError()
-            builder.append(stack.pop())
-        if len(builder) != 1:
-            raise FormulaError()
-        builder.finish()
+                result_formula_element.append(token.name)
         return "".join(result_formula_element)
 
 
-def get_func_list():
-    funcs = list(get_functions().keys())
-    return sorted(funcs)
+def _has_aggregate(calls):
+    # (token, 入参) 中是否有整列聚合的方法调用
+    return any(isinstance(t, Function) and is_aggregate(t.name, len(args)) for t, args in calls)
+
+
+def _ranges(size, chunk_size):
+    # 按行分块的区间; 单行的数组按标量计算, 结果类型可能不同, 避免出现单行的块
+    chunk_size = max(chunk_size, 2)
+    starts = list(range(0, size, chunk_size))
+    if len(starts) > 1 and size - starts[-1] == 1:
+        starts.pop()
+    return list(zip(starts, starts[1:] + [size]))
 
 
-def _get_formula_contain_vars(df, custom_var_map, formula_columns, dataset_map):
-    vars = []
-    custom_vars = []
-    for i in formula_columns:
-        if i.startswith("策略衍生_"):
-            custom_vars.append(i)
-            parser = Parser(df=df, custom_var_map=custom_var_map)
-            parser.ast(dataset_map[i]["formula"])
-            _vars, _custom_vars = _get_formula_contain_vars(df, custom_var_map, parser.formula_columns, dataset_map)
-            vars.extend(_vars)
-            custom_vars.extend(_custom_vars)
+def _column_origin(dataset, name):
+    """
+    列未经 take/切片/过滤/重命名/替换, 行顺序与来源一致时返回所在的底层数据集 (文件或内存数组), 否则返回 None
+    """
+    while name in dataset:
+        if getattr(dataset, 'path', None) or isinstance(dataset, vaex.dataset.DatasetArrays):
+            return dataset
+        if isinstance(dataset, vaex.dataset.DatasetMerged):
+            dataset = dataset.left if name in dataset.left else dataset.right
+        elif isinstance(dataset, (vaex.dataset.DatasetDropped, vaex.dataset.DatasetCached)):
+            dataset = dataset.original
+        elif isinstance(dataset, vaex.dataset.DatasetRenamed) and name not in dataset.reverse:
+            dataset = dataset.original
         else:
-            vars.append(i)
-    return vars, custom_vars
+            return None
+    return None
+
+
+def _to_string(arr):
+    # 非文本值转换为字符串, None 为缺失值
+    if isinstance(arr, pa.Array):
+        return arr
+    if arr.dtype.kind != 'U' and (arr.dtype != object or pd.api.types.infer_dtype(arr, skipna=False) != 'string'):
+        arr = _str_or_none(arr)
+    return pa.array(arr, type=pa.string())
+
+
+_str_or_none = np.frompyfunc(lambda v: v if v is None or isinstance(v, str) else str(v), 1, 1)
+
+
+def _run_partition(path, custom_var_map, expression, start, stop, chunk_size=None):
+    # 进程池任务: 重新打开内存映射文件, 只计算 [start, stop) 行
+    parser = Parser(df=vaex.open(path)[start:stop], custom_var_map=custom_var_map)
+    return parser.run(expression, chunk_size)
+
+
+def get_func_list():
+    funcs = list(REGISTRY.functions)
+    return sorted(funcs)
 
 
 # 获取公式预测变量列表和衍生变量列表
 def get_formula_contain_vars(df, custom_var_map, formula_columns, dataset_map):
-    vars, custom_vars = _get_formula_contain_vars(df, custom_var_map, formula_columns, dataset_map)
-    return list(set(vars)), list(set(custom_vars))
+    parser = Parser(df=df, custom_var_map=custom_var_map)
+    formulas = {k: v["format_formula"] for k, v in parser.custom_var_map.items()}
+    formulas.update({k: v["formula"] for k, v in dataset_map.items() if k.startswith("策略衍生_")})
+    vars, custom_vars = parser.resolver(formulas).expand(
+        [i for i in formula_columns if not i.startswith("策略衍生_")],
+        [i for i in formula_columns if i.startswith("策略衍生_")])
+    return list(vars), list(custom_vars)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import collections
+
+from schedula import bypass
+
+from .exceptions import BaseError
+from .fusion import FusedExpression, fuse
+
+Instruction = collections.namedtuple('Instruction', 'function args out free')
+
+
+class Plan(object):
+    """
+    直线型执行计划: 执行图按依赖顺序展开为指令列表, 以寄存器保存中间结果, 调用时不经过 schedula 调度;
+    中间结果在最后一次使用后释放, 常量预先写入寄存器
+    调用方式与 DispatchPipe 一致: plan(*inputs), 一个输出时返回结果, 多个输出时返回结果列表
+    """
+    # 需要 schedula 调度的方法节点属性
+    unsupported = {'extra_inputs', 'input_domain', 'filters'}
+    # 数值子树合并为一条指令整体计算, 为 None 时不合并
+    fusion_class = FusedExpression
+
+    def __init__(self, inputs, outputs, registers, input_slots, output_slots, instructions):
+        self.inputs = inputs
+        self.outputs = outputs
+        self.registers = registers
+        self.input_slots = input_slots
+        self.output_slots = output_slots
+        self.instructions = instructions
+
+    @classmethod
+    def build(cls, dsp, outputs):
+        """
+        由执行图构建计划, 含 schedula 才支持的节点 (额外入参、入参校验、多输出、多个来源的数据节点) 时返回 None
+        params: outputs: 输出节点列表
+        """
+        slots, registers, references, order, aliases = {}, [], [], [], {}
+        pred, nodes, defaults = dsp.dmap.pred, dsp.nodes, dsp.default_values
+        # 非递归的后序遍历, 长公式的执行图可能很深
+        stack = [(o, False) for o in reversed(outputs)]
+        while stack:
+            node, ready = stack.pop()
+            if node in slots:
+                continue
+            if not pred[node]:
+                if node in defaults:
+                    slots[node] = len(registers)
+                    registers.append(defaults[node]['value'])
+                else:
+                    slots[node] = None
+                    references.append(node)
+                continue
+            if len(pred[node]) != 1:
+                return None
+            fid = next(iter(pred[node]))
+            func = nodes[fid]
+            if func.get('type') != 'function' or func['outputs'] != [node] or set(func) & cls.unsupported:
+                return None
+            if not ready:
+                stack.append((node, True))
+                stack.extend((i, False) for i in reversed(func['inputs']) if i not in slots)
+                continue
+            if func['function'] is bypass:
+                # 入参可能是尚未分配槽位的引用, 槽位在引用分配后确定
+                slots[node] = None
+                aliases[node] = func['inputs'][0]
+            else:
+                slots[node] = len(registers)
+                registers.append(None)
+                order.append((func['function'], func['inputs'], node))
+        inputs = sorted(references)
+        for k in inputs:
+            slots[k] = len(registers)
+            registers.append(None)
+        for node, source in aliases.items():
+            slots[node] = slots[source]
+        for i, (function, args, node) in enumerate(order):
+            order[i] = function, [slots[a] for a in args], slots[node]
+        keep = set(slots[o] for o in outputs)
+        if cls.fusion_class is not None:
+            order = fuse(order, keep, cls.fusion_class)
+        return cls(inputs, list(outputs), registers, [slots[k] for k in inputs], [slots[o] for o in outputs],
+                   cls._instructions(order, keep))
+
+    @staticmethod
+    def _instructions(order, keep):
+        # 每条指令执行后释放不再使用的中间结果与入参
+        last = {}
+        for i, (_, args, _) in enumerate(order):
+            for a in args:
+                last[a] = i
+        free = collections.defaultdict(list)
+        for slot, i in last.items():
+            if slot not in keep:
+                free[i].append(slot)
+        return [Instruction(f, args, out, free[i]) for i, (f, args, out) in enumerate(order)]
+
+    def __call__(self, *args):
+        registers = self.registers[:]
+        for slot, value in zip(self.input_slots, args):
+            registers[slot] = value
+        try:
+            for function, slots, out, free in self.instructions:
+                registers[out] = function(*[registers[i] for i in slots])
+                for i in free:
+                    registers[i] = None
+        except Exception as ex:
+            raise BaseError("公式运算错误") from ex
+        if len(self.output_slots) == 1:
+            return registers[self.output_slots[0]]
+        return [registers[i] for i in self.output_slots]
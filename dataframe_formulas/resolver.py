@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import collections
+
+from .cache import LRUCache
+from .exceptions import FormulaError
+
+Dependency = collections.namedtuple('Dependency', 'columns custom_columns')
+
+
+class DependencyResolver(object):
+    """
+    衍生变量依赖解析, 同一版本的衍生变量定义下每个衍生变量只解析一次
+    缓存衍生变量传递引用的数据集列及衍生变量闭包, 循环引用时抛出 FormulaError
+    """
+    # 衍生变量定义版本: {衍生变量: Dependency}
+    cache = LRUCache(maxsize=64)
+
+    def __init__(self, formulas, parse):
+        """
+        params: formulas: 衍生变量公式 {策略衍生_name: formula}
+        params: parse: 解析公式的函数, 返回直接引用的 (数据集列, 衍生变量)
+        """
+        self.formulas = formulas
+        self.parse = parse
+        version = tuple(sorted(formulas.items()))
+        self.deps = self.cache.get(version)
+        if self.deps is None:
+            self.deps = self.cache[version] = {}
+        # 解析中的衍生变量, 用于检测循环引用
+        self._stack = []
+
+    def resolve(self, name):
+        if name in self.deps:
+            return self.deps[name]
+        if name in self._stack:
+            cycle = self._stack[self._stack.index(name):] + [name]
+            raise FormulaError("衍生变量存在循环引用: {}".format(" -> ".join(cycle)))
+        if name not in self.formulas:
+            raise FormulaError("衍生变量{}在字典中不存在".format(name))
+        self._stack.append(name)
+        try:
+            columns, custom_columns = self.expand(*self.parse(self.formulas[name]))
+        finally:
+            self._stack.pop()
+        dep = self.deps[name] = Dependency(frozenset(columns), frozenset(custom_columns))
+        return dep
+
+    def expand(self, columns, custom_columns):
+        """
+        返回直接引用展开后的 (数据集列, 衍生变量) 集合
+        """
+        columns, custom_columns = set(columns), set(custom_columns)
+        for n in list(custom_columns):
+            dep = self.resolve(n)
+            columns.update(dep.columns)
+            custom_columns.update(dep.custom_columns)
+        return columns, custom_columns
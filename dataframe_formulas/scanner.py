@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+import regex
+
+_flags = ((regex.IGNORECASE, 'i'), (regex.DOTALL, 's'), (regex.VERBOSE, 'x'), (regex.MULTILINE, 'm'))
+
+
+class Scanner(object):
+    """
+    单次扫描分词器: 将各 token 类的正则合并为一个按顺序选择的命名分组正则,
+    按位置推进匹配, 不再逐个尝试 token 类, 也不切片剩余字符串
+    """
+    def __init__(self, filters):
+        self.filters = filters
+        alternatives = []
+        for i, f in enumerate(filters):
+            flags = ''.join(c for flag, c in _flags if f._re.flags & flag)
+            alternatives.append('(?%s:(?P<_%d>%s))' % (flags or '-i', i, f._re.pattern))
+        self._re = regex.compile('|'.join(alternatives))
+        self._names = ['_%d' % i for i in range(len(filters))]
+
+    def first(self, expr, pos=0):
+        """
+        返回在 pos 处首个可匹配的 token 类序号, 均不匹配时返回 len(filters)
+        """
+        m = self._re.match(expr, pos)
+        if m is None:
+            return len(self.filters)
+        return next(i for i, name in enumerate(self._names) if m.start(name) >= 0)
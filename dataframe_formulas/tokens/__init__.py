@@ -6,13 +6,13 @@ from ..exceptions import TokenError
 class Token(object):
     _re = None
 
-    def __init__(self, s, context=None):
+    def __init__(self, s, context=None, pos=0):
         self.source, self.attr = s, {}
         self.df = None
         self.custom_var_map = None
-        m = self.match(s)
+        m = self.match(s, pos)
         self.end_match = m and m.end(0)
-        if self.end_match:
+        if m and self.end_match > pos:
             if m.groupdict().get("raise"):
                 raise TokenError()
             self.attr.update(self.process(m, context))
@@ -58,5 +58,5 @@ class Token(object):
     def process(self, match, context=None):
         return {k: v for k, v in match.groupdict().items() if v is not None}
 
-    def match(self, s):
-        return self._re.match(s)
+    def match(self, s, pos=0):
+        return self._re.match(s, pos)
@@ -13,6 +13,10 @@ class XlError(sh.Token):
     pass
 
 
+def has_column(df, name):
+    return name in df.columns or name in df.virtual_columns
+
+
 class Operand(Token):
     def ast(self, tokens, stack, builder):
         if tokens and isinstance(tokens[-1], Operand):
@@ -23,13 +27,14 @@ class Operand(Token):
 
 
 class String(Operand):
-    _re = regex.compile(r"""^\s*"(?P<name>(?>""|[^"])*)"\s*|^\s*'(?P<name>(?>''|[^'])*)'\s*""")
+    _re = regex.compile(r"""\G\s*"(?P<name>(?>""|[^"])*)"\s*|\G\s*'(?P<name>(?>''|[^'])*)'\s*""")
 
     def compile(self):
         return self.name.replace('""', '"').replace("''", "'")
 
     def set_expr(self, *tokens):
-        self.attr['expr'] = '"%s"' % self.name
+        # 单双引号的字符串常量规范化为同一节点
+        self.attr['expr'] = '"%s"' % self.compile().replace('"', '""')
 
 
 class Empty(Operand):
@@ -41,9 +46,30 @@ class Empty(Operand):
         return 0
 
 
+class Constant(Operand):
+    """
+    常量折叠的结果
+    """
+    def __init__(self, value):
+        self.source, self.attr = None, {'name': str(value)}
+        self.df = None
+        self.custom_var_map = None
+        self.value = value
+
+    def compile(self):
+        return self.value
+
+    def set_expr(self, *tokens):
+        # 与 Number、String 的规范化表达式一致, 相同取值共用节点
+        if isinstance(self.value, str):
+            self.attr['expr'] = '"%s"' % self.value.replace('"', '""')
+        else:
+            self.attr['expr'] = repr(self.value)
+
+
 _re_error = regex.compile(
     r'''
-    ^\s*(?>
+    \G\s*(?>
         (?>
             '(\[(?>[^\[\]]+)\])?
             (?>(?>''|[^\?!*\/\[\]':"])+)?'
@@ -76,15 +102,19 @@ class Error(Operand):
 
 class Number(Operand):
     _re = regex.compile(
-        r'^\s*(?P<name>[0-9]+(?>\.[0-9]+)?(?>E[+-][0-9]+)?|'
+        r'\G\s*(?P<name>[0-9]+(?>\.[0-9]+)?(?>E[+-][0-9]+)?|'
         r'TRUE(?!\(\))|FALSE(?!\(\)))(?!([a-z]|[0-9]|\.|\s*\:))\s*', regex.IGNORECASE)
 
     def compile(self):
         return eval(self.name.capitalize())
 
+    def set_expr(self, *tokens):
+        # 常量按取值规范化, 如 1.0 与 1.00、true 与 TRUE 为同一节点
+        self.attr['expr'] = repr(self.compile())
+
 
 class Column(Operand):
-    _re = regex.compile(r'^(?P<name>[\u4E00-\u9FA5A-Za-z0-9_]+)(?P<raise>[\(\.]?)',
+    _re = regex.compile(r'\G(?P<name>[\u4E00-\u9FA5A-Za-z0-9_]+)(?P<raise>[\(\.]?)',
                         regex.IGNORECASE | regex.X | regex.DOTALL)
 
     def process(self, match, context=None):
@@ -96,7 +126,7 @@ class Column(Operand):
         else:
             return '{} <{}>'.format(self.name, Column.__name__)
 
-    def compile(self):
+    def var_name(self):
         if self.df is None:
             raise FormulaError("数据集不存在")
         if self.name.startswith("策略衍生_"):
@@ -105,17 +135,19 @@ class Column(Operand):
                 raise FormulaError("衍生变量定义字典custom_var_map不存在")
             if self.name not in self.custom_var_map:
                 raise FormulaError("衍生变量{}在字典中不存在".format(self.name))
-            if self.custom_var_map[self.name]["var"] not in self.df.columns:
+            if not has_column(self.df, self.custom_var_map[self.name]["var"]):
                 raise FormulaError("变量名{}不存在".format(self.name))
-            return self.df[self.custom_var_map[self.name]["var"]].to_numpy()
-        if self.name not in self.df.columns:
+            return self.custom_var_map[self.name]["var"]
+        if not has_column(self.df, self.name):
             raise FormulaError("变量名{}不存在".format(self.name))
-        arr = self.df[self.name].to_numpy()
-        return arr
+        return self.name
+
+    def compile(self):
+        return self.df[self.var_name()].to_numpy()
 
 
 class CustomColumn(Operand):
-    _re = regex.compile(r'^\[(?P<name>[\u4E00-\u9FA5A-Za-z0-9_]+)\](?P<raise>[\(\.]?)',
+    _re = regex.compile(r'\G\[(?P<name>[\u4E00-\u9FA5A-Za-z0-9_]+)\](?P<raise>[\(\.]?)',
                         regex.IGNORECASE | regex.X | regex.DOTALL)
 
     def process(self, match, context=None):
@@ -127,7 +159,7 @@ class CustomColumn(Operand):
         else:
             return '{} <{}>'.format(self.name, Column.__name__)
 
-    def compile(self):
+    def var_name(self):
         # raise FormulaError("公式暂不支持引用衍生变量")
         if self.df is None:
             raise FormulaError("数据集不存在")
@@ -135,6 +167,110 @@ class CustomColumn(Operand):
             raise FormulaError("衍生变量定义字典custom_var_map不存在")
         if "策略衍生_" + self.name not in self.custom_var_map:
             raise FormulaError("衍生变量{}在字典中不存在".format(self.name))
-        if self.custom_var_map["策略衍生_" + self.name]["var"] not in self.df.columns:
+        if not has_column(self.df, self.custom_var_map["策略衍生_" + self.name]["var"]):
             raise FormulaError("变量名{}不存在".format(self.name))
-        return self.df[self.custom_var_map["策略衍生_" + self.name]["var"]].to_numpy()
+        return self.custom_var_map["策略衍生_" + self.name]["var"]
+
+    def compile(self):
+        return self.df[self.var_name()].to_numpy()
+
+
+class ColumnIsin(Column):
+    """
+    文本列是否等于一组字符串常量, 由 Optimizer 替换文本列与字符串常量的 =、<> 及其 OR、AND 组合,
+    计算时按列的字典编码比较编码再映射回各行, 见 Parser._isin
+    """
+    def __init__(self, column, values, negate=False):
+        self.source, self.attr = None, {'name': column.name}
+        self.df, self.custom_var_map = column.df, column.custom_var_map
+        self.column = column
+        self.values = tuple(sorted(set(values)))
+        self.negate = negate
+
+    def set_df(self, df):
+        self.df = df
+        self.column.set_df(df)
+
+    def set_custom_var_map(self, custom_var_map):
+        self.custom_var_map = custom_var_map
+        self.column.set_custom_var_map(custom_var_map)
+
+    def var_name(self):
+        return self.column.var_name()
+
+    def set_expr(self, *tokens):
+        values = ', '.join('"%s"' % v.replace('"', '""') for v in self.values)
+        expr = 'ISIN(%s, %s)' % (self.column.get_expr, values)
+        self.attr['expr'] = 'NOT(%s)' % expr if self.negate else expr
+
+    def lookup(self, categories):
+        # 每个编码的比较结果, 末尾为缺失值 (编码 -1) 的结果, 与逐行比较一致: = 为 False, <> 为 True
+        res = np.append(np.isin(categories, self.values), False)
+        return ~res if self.negate else res
+
+    def compile(self):
+        arr, res = super(ColumnIsin, self).compile(), False
+        for v in self.values:
+            res = res | (arr == v)
+        return ~res if self.negate else res
+
+
+class ColumnAggregate(Column):
+    """
+    数据集列的整列聚合, 由 Optimizer 替换只有一个列入参的 AVG、MIN、MAX、MEDIAN、COUNT、COLSUM,
+    计算时对整列聚合一次, 标量结果广播到各行, 见 Parser._aggregate
+    """
+    def __init__(self, column, name, function):
+        self.source, self.attr = None, {'name': column.name}
+        self.df, self.custom_var_map = column.df, column.custom_var_map
+        self.column = column
+        self.function_name = name
+        self.function = function
+
+    def set_df(self, df):
+        self.df = df
+        self.column.set_df(df)
+
+    def set_custom_var_map(self, custom_var_map):
+        self.custom_var_map = custom_var_map
+        self.column.set_custom_var_map(custom_var_map)
+
+    def var_name(self):
+        return self.column.var_name()
+
+    def set_expr(self, *tokens):
+        self.attr['expr'] = '%s(%s)' % (self.function_name, self.column.get_expr)
+
+    def compile(self):
+        return self.function.column(self.column.compile())
+
+
+class ColumnGroups(Column):
+    """
+    文本列的字典编码, 由 Optimizer 替换条件聚合的条件区域与分组聚合的分组列,
+    计算时取 Parser 按列缓存的编码, 条件只判断各类别, 分组只计算一次, 见 Parser._groups
+    """
+    def __init__(self, column):
+        self.source, self.attr = None, {'name': column.name}
+        self.df, self.custom_var_map = column.df, column.custom_var_map
+        self.column = column
+
+    def set_df(self, df):
+        self.df = df
+        self.column.set_df(df)
+
+    def set_custom_var_map(self, custom_var_map):
+        self.custom_var_map = custom_var_map
+        self.column.set_custom_var_map(custom_var_map)
+
+    def var_name(self):
+        return self.column.var_name()
+
+    def set_expr(self, *tokens):
+        self.attr['expr'] = 'GROUPS(%s)' % self.column.get_expr
+
+    def compile(self):
+        import pandas as pd
+
+        from ..functions import Groups
+        return Groups(*pd.factorize(np.asarray(self.column.compile(), object)))
@@ -32,6 +32,9 @@ class Operator(Token):
     }
     _n_args = collections.defaultdict(lambda: 2)
     _n_args.update({'u-': 1, 'u+': 1, '%': 1})
+    # 可交换的运算符, 规范化表达式时操作数排序; + 对两个字符串为拼接, 需至少一侧为数值
+    _commutative = {'*', '=', '<>'}
+    _numeric = {'-', '/', '^', '%', 'u-'}
 
     _re_process = None
     _replace = ' '
@@ -55,14 +58,30 @@ class Operator(Token):
         expr, name = [t.get_expr for t in tokens], self.name
         if name == '%':
             expr = '{}%'.format(*expr)
-        elif name in ('u-', 'u+'):
+        elif name == 'u+':
+            # 一元正号不改变取值, 与操作数为同一节点
+            expr = expr[0]
+        elif name == 'u-':
             expr = '{}{}'.format(name[1], *expr)
         elif name in ' ,:':
             expr = '(%s)' % ('%s ' % name.strip(' ')).join(expr)
         else:
+            if name in self._commutative or name == '+' and any(map(self._is_numeric, tokens)):
+                expr = sorted(expr)
             expr = '(%s)' % (' %s ' % name).join(expr)
         self.attr['expr'] = expr
 
+    def _is_numeric(self, token):
+        from .operand import Column, CustomColumn, Number
+        if isinstance(token, Number):
+            return True
+        elif isinstance(token, Operator):
+            return token.name in self._numeric
+        elif isinstance(token, (Column, CustomColumn)) and token.df is not None:
+            data_type = token.df.data_type(token.var_name())
+            return data_type.is_integer or data_type.is_float or data_type == bool
+        return False
+
     @property
     def get_n_args(self):
         return self._n_args[self.name]
@@ -82,7 +101,8 @@ class Operator(Token):
     def update_name(self, tokens, stack):
         if self.name in '-+':
             from .operand import Operand
-            t = tokens[max(tokens.index(self) - 1, 0)]
+            # 运算符刚加入 tokens 队尾, 取其前一个 token
+            t = tokens[max(len(tokens) - 2, 0)]
             b = isinstance(t, Parenthesis) and t.has_end
             b |= isinstance(t, Operator) and t.name == '%'
             if not (b or isinstance(t, Operand)):
@@ -105,7 +125,7 @@ class Operator(Token):
 
 
 class Separator(Operator):
-    _re = regex.compile(r'^(\s*,\s*)')
+    _re = regex.compile(r'\G(\s*,\s*)')
     _re_process = regex.compile(r'^\s*(?P<name>,)$')
 
     def ast(self, tokens, stack, builder):
@@ -120,7 +140,7 @@ class Separator(Operator):
 
 
 class OperatorToken(Operator):
-    _re = regex.compile(r'^(\s*([<>]=|<>|[\*\/\^&<>=])(?=\s*[\+\-])|\s*%+|[\+\-\*\/\^&<>=\s:]+)')
+    _re = regex.compile(r'\G(\s*([<>]=|<>|[\*\/\^&<>=])(?=\s*[\+\-])|\s*%+|[\+\-\*\/\^&<>=\s:]+)')
     _re_process = regex.compile(r'^\s*(?P<name>(?P<sum_minus>[\+\s\-]+)|[<>]?=|<>|[\*\/\^&\%:<>])$')
 
     def process(self, match, context=None):
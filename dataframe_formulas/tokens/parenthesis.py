@@ -7,7 +7,7 @@ from . import Token
 
 
 class Parenthesis(Token):
-    _re = regex.compile(r'^\s*(?>(?P<name>(?P<start>\())\s*|(?P<name>(?P<end>\))))')
+    _re = regex.compile(r'\G\s*(?>(?P<name>(?P<start>\())\s*|(?P<name>(?P<end>\))))')
 
     opens = {')': '('}
     # 参数个数
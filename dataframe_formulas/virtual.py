@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+import functools
+
+import numpy as np
+import pyarrow as pa
+import vaex
+from vaex.array_types import to_numpy
+
+from .exceptions import VirtualColumnError
+from .functions import int_power
+from .tokens.function import Function
+from .tokens.operand import (Column, ColumnAggregate, ColumnGroups, ColumnIsin,
+                             Constant, CustomColumn, Empty, Number, String)
+from .tokens.operator import Operator
+
+NUMERIC = ('bool', 'int', 'float')
+
+
+def _to_masked(a):
+    # arrow 数组可能含 null, 转换为掩码数组 (to_numpy 会丢弃 null)
+    if isinstance(a, (pa.Array, pa.ChunkedArray)):
+        return np.ma.array(to_numpy(a), mask=a.is_null().to_numpy(zero_copy_only=False))
+    return to_numpy(a)
+
+
+def _finite(func, *args):
+    # 非有限值统一返回 nan, 与 convert_nan 的取值保持一致, 缺失值掩码原样保留;
+    # 入参可能含缺失值时总是返回掩码数组, vaex 按首行的试算结果决定是否分配掩码
+    args = [_to_masked(a) for a in args]
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        res = func(*(np.ma.getdata(a) for a in args))
+    res = np.where(np.isfinite(res), res, np.nan)
+    if any(np.ma.isMaskedArray(a) for a in args):
+        res = np.ma.array(res, mask=functools.reduce(np.logical_or, [np.ma.getmaskarray(a) for a in args]))
+    return res
+
+
+@vaex.register_function(name='xl_divide')
+def xl_divide(x, y):
+    return _finite(np.true_divide, x, y)
+
+
+@vaex.register_function(name='xl_power')
+def xl_power(x, y):
+    return _finite(np.float_power, x, y)
+
+
+@vaex.register_function(name='xl_int_power')
+def xl_int_power(x, y):
+    # 与 int_power 一致, 超出 int64 的结果为浮点数、超出 uint64 的为 nan; 统一为浮点数, 虚拟列的类型不随数据变化
+    return _finite(lambda a, b: np.asarray(int_power(a, b), np.float64), x, y)
+
+
+@vaex.register_function(name='xl_log')
+def xl_log(x, base):
+    # 与 LOG 一致: 底数为 0 时为 nan
+    return _finite(lambda a, b: np.where(b == 0, np.nan, np.log(a) / np.log(b)), x, base)
+
+
+@vaex.register_function(name='xl_finite')
+def xl_finite(x):
+    return _finite(np.asarray, x)
+
+
+def _kind(data_type):
+    if data_type.is_string:
+        return 'str'
+    if data_type == bool:
+        return 'bool'
+    if data_type.is_integer:
+        return 'int'
+    if data_type.is_float:
+        return 'float'
+    raise VirtualColumnError("变量类型{}不支持虚拟列".format(data_type))
+
+
+def _promote(*kinds):
+    if 'float' in kinds:
+        return 'float'
+    return 'int'
+
+
+def _as_number(expr, kind):
+    # 布尔值参与算术运算时按 0/1 处理, 常量直接写为 1/0
+    if kind == 'bool':
+        if expr in ('True', 'False'):
+            return str(int(expr == 'True'))
+        return 'astype(%s, "int64")' % expr
+    return expr
+
+
+def _as_text(expr, kind):
+    if kind == 'str':
+        return expr
+    if kind == 'int':
+        if expr.lstrip('-').isdigit():
+            return repr(expr)
+        return 'astype(%s, "str")' % expr
+    # 浮点及布尔的字符串格式与 _str 不一致
+    raise VirtualColumnError("类型{}不支持转换为字符串虚拟列".format(kind))
+
+
+def _literal_int(token):
+    if isinstance(token, (Number, Constant)):
+        value = token.compile()
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    raise VirtualColumnError("方法参数需为整数常量")
+
+
+class VirtualCompiler(object):
+    """
+    将 AstBuilder 的 token 树编译为 vaex 表达式, 用于 df.add_virtual_column 惰性计算
+    无 vaex 对应实现的 token 抛出 VirtualColumnError, 由调用方回退到原计算流程
+    """
+    def __init__(self, builder, df):
+        self.builder = builder
+        self.df = df
+        # 表达式引用的数据集列
+        self.columns = set()
+
+    def compile(self):
+        expr, _ = self.visit(self.builder[-1])
+        if not self.columns:
+            raise VirtualColumnError("常量公式不支持虚拟列")
+        return expr
+
+    def visit(self, token):
+        if isinstance(token, Operator):
+            return self.visit_operator(token, *self.builder.inputs[token])
+        elif isinstance(token, Function):
+            return self.visit_function(token, *self.builder.inputs[token])
+        elif isinstance(token, (ColumnAggregate, ColumnGroups)):
+            raise VirtualColumnError("整列聚合不支持虚拟列")
+        elif isinstance(token, ColumnIsin):
+            column, _ = self.visit(token.column)
+            op, join = ('!=', ' & ') if token.negate else ('==', ' | ')
+            return '(%s)' % join.join('(%s %s %r)' % (column, op, v) for v in token.values), 'bool'
+        elif isinstance(token, (Column, CustomColumn)):
+            token.set_df(self.df)
+            name = token.var_name()
+            self.columns.add(name)
+            return self.df[name].expression, _kind(self.df.data_type(name))
+        elif isinstance(token, Empty):
+            return '0', 'int'
+        elif isinstance(token, (Number, Constant)) and not isinstance(token.compile(), str):
+            value = token.compile()
+            if isinstance(value, bool):
+                return repr(value), 'bool'
+            return repr(value), 'float' if isinstance(value, float) else 'int'
+        elif isinstance(token, (String, Constant)):
+            return repr(token.compile()), 'str'
+        raise VirtualColumnError("{}不支持虚拟列".format(token.name))
+
+    def visit_operator(self, token, *tokens):
+        name = token.name.upper()
+        args = [self.visit(t) for t in tokens]
+        kinds = tuple(k for _, k in args)
+        if name == 'U+':
+            return args[0]
+        elif name == 'U-' and kinds[0] in NUMERIC:
+            return '(-%s)' % _as_number(*args[0]), _promote(*kinds)
+        elif name == '%' and kinds[0] in NUMERIC:
+            return '(%s / 100.0)' % _as_number(*args[0]), 'float'
+        elif name == '&':
+            return 'str_cat(%s, %s)' % tuple(_as_text(*a) for a in args), 'str'
+        elif name == '+' and kinds == ('str', 'str'):
+            return 'str_cat(%s, %s)' % (args[0][0], args[1][0]), 'str'
+        elif name in ('=', '<>', '<', '>', '<=', '>='):
+            if kinds.count('str') == 1:
+                raise VirtualColumnError("运算符{}两侧类型不一致".format(token.name))
+            op = {'=': '==', '<>': '!='}.get(name, name)
+            return '(%s %s %s)' % (args[0][0], op, args[1][0]), 'bool'
+        elif 'str' in kinds:
+            pass
+        elif name in ('+', '-', '*'):
+            x, y = (_as_number(*a) for a in args)
+            return '(%s %s %s)' % (x, name, y), _promote(*kinds)
+        elif name == '/':
+            return 'xl_divide(%s, %s)' % tuple(_as_number(*a) for a in args), 'float'
+        elif name == '^':
+            x, y = (_as_number(*a) for a in args)
+            if kinds[0] in ('bool', 'int') and isinstance(tokens[1], (Number, Constant)) and tokens[1].compile() >= 0 \
+                    and kinds[1] in ('bool', 'int'):
+                # 整数乘方可能溢出, 不能直接用 ** (int64 回绕)
+                return 'xl_int_power(%s, %s)' % (x, y), 'float'
+            return 'xl_power(%s, %s)' % (x, y), 'float'
+        raise VirtualColumnError("运算符{}不支持虚拟列".format(token.name))
+
+    def visit_function(self, token, *tokens):
+        name = token.name.upper()
+        args = [self.visit(t) for t in tokens]
+        kinds = tuple(k for _, k in args)
+        exprs = [e for e, _ in args]
+        if name in ('TRUE', 'FALSE') and not args:
+            return repr(name == 'TRUE'), 'bool'
+        elif name == 'IF' and 1 <= len(args) <= 3:
+            args += [('1', 'int'), ('0', 'int')][len(args) - 1:]
+            (c, c_kind), x, y = args
+            if c_kind == 'str' or (x[1] == 'str') != (y[1] == 'str'):
+                raise VirtualColumnError("IF条件或分支类型不支持虚拟列")
+            kind = x[1] if x[1] == y[1] else _promote(x[1], y[1])
+            if kind != 'bool' and 'bool' in (x[1], y[1]):
+                x, y = (_as_number(*x), kind), (_as_number(*y), kind)
+            return 'where(%s, %s, %s)' % (c, x[0], y[0]), kind
+        elif name in ('AND', 'OR', 'NOT') and args and 'str' not in kinds:
+            exprs = [e if k == 'bool' else '(%s != 0)' % e for e, k in args]
+            if name == 'NOT':
+                return '(~%s)' % exprs[0], 'bool'
+            return '(%s)' % (' & ' if name == 'AND' else ' | ').join(exprs), 'bool'
+        elif 'str' not in kinds and name in ('ABS', 'EXP', 'LN', 'LOG10', 'LOG', 'INT'):
+            exprs = [_as_number(*a) for a in args]
+            if name == 'ABS':
+                return 'abs(%s)' % exprs[0], _promote(*kinds)
+            elif name == 'EXP':
+                return 'xl_finite(exp(%s))' % exprs[0], 'float'
+            elif name in ('LN', 'LOG10'):
+                return 'xl_finite(%s(%s))' % ({'LN': 'log'}.get(name, 'log10'), exprs[0]), 'float'
+            elif name == 'LOG':
+                if len(exprs) > 1:
+                    return 'xl_log(%s, %s)' % tuple(exprs), 'float'
+                return 'xl_divide(log(%s), %r)' % (exprs[0], float(np.log(10))), 'float'
+            elif name == 'INT':
+                return 'astype(%s, "int64")' % exprs[0], 'int'
+        elif name == 'CONCAT' and args:
+            return self._concat(args), 'str'
+        elif kinds[:1] == ('str', ):
+            s = exprs[0]
+            if name == 'LEN':
+                return 'str_len(%s)' % s, 'int'
+            elif name in ('UPPER', 'LOWER'):
+                return 'str_%s(%s)' % (name.lower(), s), 'str'
+            elif name == 'PROPER':
+                return 'str_capitalize(%s)' % s, 'str'
+            elif name == 'LEFT' and len(tokens) == 2 and _literal_int(tokens[1]) >= 0:
+                return 'str_slice(%s, 0, %d)' % (s, _literal_int(tokens[1])), 'str'
+            elif name == 'RIGHT' and len(tokens) == 2 and _literal_int(tokens[1]) > 0:
+                return 'str_slice(%s, %d)' % (s, -_literal_int(tokens[1])), 'str'
+            elif name == 'MID' and len(tokens) == 3:
+                i, n = _literal_int(tokens[1]) - 1, _literal_int(tokens[2])
+                if i >= 0 and n >= 0:
+                    return 'str_slice(%s, %d, %d)' % (s, i, i + n), 'str'
+        raise VirtualColumnError("方法{}不支持虚拟列".format(name))
+
+    @staticmethod
+    def _concat(args):
+        expr = _as_text(*args[0])
+        for a in args[1:]:
+            expr = 'str_cat(%s, %s)' % (expr, _as_text(*a))
+        return expr
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import vaex
+
+from dataframe_formulas import Parser
+
+
+def parser():
+    df = vaex.from_arrays(a=np.array([1, 2, 3, 4]), f=np.array([0.5, np.nan, 1.5, 2.0]))
+    return Parser(df=df, custom_var_map={})
+
+
+def test_sum_row_wise():
+    # 一个入参的 SUM 仍逐行计算
+    np.testing.assert_array_equal(parser().run("=SUM(a)"), [1, 2, 3, 4])
+
+
+def test_column_sum():
+    p = parser()
+    np.testing.assert_array_equal(p.run("=a / COLSUM(a)"), [0.1, 0.2, 0.3, 0.4])
+    np.testing.assert_array_equal(p.run("=COLSUM(f)"), [4.0] * 4)
+    np.testing.assert_array_equal(p.run("=COLSUM(a, f)"), [14.0] * 4)
+    np.testing.assert_array_equal(p.run("=a / COLSUM(a)", chunk_size=2), [0.1, 0.2, 0.3, 0.4])
+
+
+def test_column_aggregates():
+    p = parser()
+    np.testing.assert_array_equal(p.run("=a - AVG(a)"), [-1.5, -0.5, 0.5, 1.5])
+    np.testing.assert_array_equal(p.run("=MAX(f)"), [2.0] * 4)
+    np.testing.assert_array_equal(p.run("=COUNT(f)"), [3] * 4)
+
+
+def test_column_aggregates_skip_missing():
+    # 一个入参的 AVG、MIN、MAX 为整列聚合, 跳过 nan 与掩码的缺失值; 多个入参时逐行计算
+    df = vaex.from_arrays(f=np.array([0.5, np.nan, 1.5, 2.0]), m=np.ma.array([1.0, 5.0, 3.0, 9.0], mask=[0, 0, 0, 1]))
+    p = Parser(df=df, custom_var_map={})
+    for chunk_size in (None, 1):
+        np.testing.assert_allclose(p.run("=AVG(f)", chunk_size=chunk_size), [4 / 3] * 4)
+        np.testing.assert_array_equal(p.run("=MIN(f)", chunk_size=chunk_size), [0.5] * 4)
+        np.testing.assert_array_equal(p.run("=MAX(f)", chunk_size=chunk_size), [2.0] * 4)
+        np.testing.assert_array_equal(p.run("=AVG(m)", chunk_size=chunk_size), [3.0] * 4)
+        np.testing.assert_array_equal(p.run("=MIN(m)", chunk_size=chunk_size), [1.0] * 4)
+        np.testing.assert_array_equal(p.run("=MAX(m)", chunk_size=chunk_size), [5.0] * 4)
+    np.testing.assert_array_equal(p.run("=MIN(f, 0.2)"), [0.2, np.nan, 0.2, 0.2])
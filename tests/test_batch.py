@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import vaex
+
+from dataframe_formulas import Parser, udf
+
+FORMULAS = {
+    "x": "=a*b+1",
+    "y": "=IF(a>2, b/2, -a)",
+    "z": "=ROUND(a/3, 1)&\"%\"",
+    "w": "=AVG(a)-b",
+}
+
+calls = []
+
+
+@udf(name="TEST_BATCH_COUNT", vectorized=True, returns="float", nullable=False)
+def _count(values):
+    calls.append(len(values))
+    return values * 1.0
+
+
+def frame():
+    return vaex.from_arrays(a=np.arange(7.0), b=np.arange(7) % 3)
+
+
+@pytest.mark.parametrize("chunk_size", [2 ** 20, 3])
+def test_add_columns_equals_add_column(chunk_size):
+    infos, df = Parser(df=frame(), custom_var_map={}).add_columns(FORMULAS, chunk_size=chunk_size)
+    assert [i["formula"] for i in infos] == list(FORMULAS.values())
+    for name, formula in FORMULAS.items():
+        _, expected = Parser(df=frame(), custom_var_map={}).add_column(formula, column_name=name)
+        assert df[name].tolist() == expected[name].tolist()
+
+
+def test_common_subexpressions_computed_once():
+    # 交换律与数值写法不同的子表达式归并为同一节点, 跨公式只计算一次
+    del calls[:]
+    formulas = ["=TEST_BATCH_COUNT(a*b)+1", "=2*TEST_BATCH_COUNT(b*a)", "=TEST_BATCH_COUNT( b * a )>1.00"]
+    infos, df = Parser(df=frame(), custom_var_map={}).add_columns(formulas)
+    assert calls == [7]
+    product = frame().evaluate("a*b")
+    assert df[infos[0]["var"]].tolist() == (product + 1).tolist()
+    assert df[infos[1]["var"]].tolist() == (product * 2).tolist()
+    assert df[infos[2]["var"]].tolist() == (product > 1).tolist()
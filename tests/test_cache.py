@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import vaex
+
+from dataframe_formulas import ColumnCache, Parser
+
+
+def test_cache_row_order(tmp_path):
+    # 排序后的数据集与文件行不一致, 不使用未排序时的缓存
+    path = str(tmp_path / "data.hdf5")
+    vaex.from_arrays(x=np.random.default_rng(0).normal(0, 1, 1000)).export_hdf5(path)
+    cache = ColumnCache(str(tmp_path / "cache"))
+    Parser(df=vaex.open(path), custom_var_map={}, column_cache=cache).add_column("=x * 2", column_name="y")
+    parser = Parser(df=vaex.open(path).sort("x"), custom_var_map={}, column_cache=cache)
+    parser.add_column("=x * 2", column_name="y")
+    np.testing.assert_array_equal(parser.df["y"].values, parser.df["x"].values * 2)
+    parser = Parser(df=vaex.open(path), custom_var_map={}, column_cache=cache)
+    parser.add_column("=x * 2", column_name="y")
+    assert cache.hits == 1
+
+
+def test_cache_shared_derived(tmp_path):
+    # 引用同一个衍生变量的不同公式的缓存键不同
+    path = str(tmp_path / "data.hdf5")
+    vaex.from_arrays(appAge=np.arange(5)).export_hdf5(path)
+    custom_var_map = {"x": {"alias": "策略衍生_x", "var": "x", "format_formula": "=appAge+1"}}
+    for formula, factor in (("=策略衍生_x*2", 2), ("=策略衍生_x*3", 3), ("=策略衍生_x*3", 3)):
+        cache = ColumnCache(str(tmp_path / "cache"))
+        parser = Parser(df=vaex.open(path), custom_var_map=custom_var_map, column_cache=cache)
+        parser.add_column("=appAge+1", column_name="x")
+        info, df = parser.add_column(formula, column_name="y")
+        assert df["y"].tolist() == [(i + 1) * factor for i in range(5)]
+        assert info["format_formula"] == "=appAge+1*%d" % factor
+    assert cache.hits == 2
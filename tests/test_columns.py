@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+
+
+@pytest.mark.parametrize("dtype, kind, expected", [
+    (np.int32, "int", np.int64),
+    (np.int16, "int", np.int64),
+    (np.float32, "float", np.float64),
+])
+def test_column_widened_type(dtype, kind, expected):
+    # 非 64 位数值结果转换为 64 位, 类型与转换后的数组一致
+    parser = Parser(df=vaex.from_arrays(x=np.arange(5, dtype=dtype)), custom_var_map={})
+    info, df = parser.add_column("=x*1", column_name="y")
+    assert info["type"] == kind
+    assert df["y"].values.dtype == expected
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+from dataframe_formulas.fusion import FusedExpression
+from dataframe_formulas.plan import Plan
+
+
+@pytest.mark.parametrize("use_numexpr", [False, True])
+def test_fused_equals_unfused(monkeypatch, use_numexpr):
+    if use_numexpr:
+        pytest.importorskip("numexpr")
+    b = np.random.default_rng(0).normal(1, 2, 3 * FusedExpression.tile_size)
+    formulas = ["=b%+1", "=(b*0.3-b)/b^2", "=ABS(b-1)*2"]
+    monkeypatch.setattr(Plan, "fusion_class", None)
+    expected = [Parser(df=vaex.from_arrays(b=b), custom_var_map={}).run(f) for f in formulas]
+    monkeypatch.setattr(Plan, "fusion_class", FusedExpression)
+    monkeypatch.setattr(FusedExpression, "use_numexpr", use_numexpr)
+    for formula, exp in zip(formulas, expected):
+        res = Parser(df=vaex.from_arrays(b=b), custom_var_map={}).run(formula)
+        np.testing.assert_array_equal(res, exp)
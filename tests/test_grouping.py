@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+
+rng = np.random.default_rng(3)
+N = 300
+ORG = np.array(["a", "b", "c", "dd", None], dtype=object)[rng.integers(0, 5, N)]
+REG = np.array(["x", "y"], dtype=object)[rng.integers(0, 2, N)]
+AMT = rng.normal(10, 5, N)
+AMT[::11] = np.nan
+QTY = np.ma.array(rng.integers(0, 9, N), mask=rng.random(N) < 0.1)
+CODE = rng.integers(0, 4, N)
+CRIT = np.array([">10", "<5", "a*", "dd"], dtype=object)[rng.integers(0, 4, N)]
+
+
+@pytest.fixture(scope="module")
+def parser():
+    df = vaex.from_arrays(org=pa.array(list(ORG)), reg=pa.array(list(REG)), amt=AMT, qty=QTY, code=CODE,
+                          crit=pa.array(list(CRIT)))
+    return Parser(df=df, custom_var_map={})
+
+
+def frame():
+    pdf = pd.DataFrame({"org": ORG, "reg": REG, "amt": AMT, "qty": np.ma.filled(QTY, 0).astype(float), "code": CODE})
+    pdf.loc[np.ma.getmaskarray(QTY), "qty"] = np.nan
+    return pdf
+
+
+def as_float(res):
+    return np.ma.filled(np.ma.asarray(res).astype(float), np.nan) if np.ndim(res) else np.full(N, float(res))
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ("=GROUPSUM(amt, org)", lambda p: p.groupby("org")["amt"].transform("sum")),
+    ("=GROUPAVG(amt, org)", lambda p: p.groupby("org")["amt"].transform("mean")),
+    ("=GROUPMIN(qty, org)", lambda p: p.groupby("org")["qty"].transform("min")),
+    ("=GROUPMAX(amt, org)", lambda p: p.groupby("org")["amt"].transform("max")),
+    ("=GROUPCOUNT(amt, org)", lambda p: p.groupby("org")["amt"].transform("count")),
+    ("=GROUPSUM(qty, org, reg)", lambda p: p.groupby(["org", "reg"])["qty"].transform("sum")),
+    ("=GROUPSUM(amt, code)", lambda p: p.groupby("code")["amt"].transform("sum")),
+    ("=amt/GROUPSUM(amt, org)", lambda p: p["amt"] / p.groupby("org")["amt"].transform("sum")),
+    ("=COUNTIF(org, \"a\")", lambda p: (p["org"] == "a").sum()),
+    ("=COUNTIF(amt, \">10\")", lambda p: (p["amt"] > 10).sum()),
+    ("=SUMIF(org, \"<>b\", amt)", lambda p: p.loc[p["org"] != "b", "amt"].sum()),
+    ("=AVERAGEIF(amt, \">=10\")", lambda p: p.loc[p["amt"] >= 10, "amt"].mean()),
+    ("=SUMIF(org, \"?\", qty)", lambda p: p.loc[p["org"].str.len() == 1, "qty"].sum()),
+    ("=COUNTIF(org, \"d*\")", lambda p: p["org"].str.startswith("d").fillna(False).sum()),
+])
+def test_against_pandas(parser, formula, expected):
+    ref = np.broadcast_to(np.asarray(expected(frame()), float), (N, ))
+    np.testing.assert_allclose(as_float(parser.run(formula)), ref, rtol=1e-12)
+
+
+def test_criteria_column(parser):
+    # 条件为列时逐行等于以该行条件为常量的结果
+    res = as_float(parser.run("=COUNTIF(org, crit)"))
+    for crit in set(CRIT):
+        expected = as_float(parser.run("=COUNTIF(org, \"{}\")".format(crit)))
+        np.testing.assert_array_equal(res[CRIT == crit], expected[CRIT == crit])
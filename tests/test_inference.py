@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+
+FORMULAS = [
+    "=i+1", "=i*2-j", "=i/2", "=i%", "=-i", "=+i", "=f*2", "=i+f", "=b+1",
+    "=i^2", "=i^0", "=i^-1", "=f^2", "=2^f", "=b^2",
+    "=POWER(i, 2)", "=POWER(i, 0)", "=POWER(i, -1)", "=POWER(f, 2)",
+    "=FLOOR(i, 0)", "=FLOOR(i, 2)", "=FLOOR(i, -2)", "=FLOOR(i, 0.5)",
+    "=CEILING(i, 0)", "=CEILING(i, 2)", "=CEILING(i, -2)", "=CEILING.MATH(i, 2)",
+    "=IF(i>2, 1, 2)", "=IF(i>2, 1, 2.5)", "=IF(i>2, s, \"x\")",
+    "=IFS(i>3, 1, i>1, 2)", "=IFS(i>3, 1, TRUE, 2)", "=IFS(i>3, 1.5, i>1, 2)", "=IFS(i>3, \"a\", TRUE, \"b\")",
+    "=ROUND(f, 1)", "=ROUND(i, -1)", "=EVEN(i)", "=ABS(f)", "=LN(i+1)", "=EXP(f)",
+    "=SUM(i, 1)", "=SUM(i>1, i>2)", "=AVG(i)", "=MIN(i, j)", "=MAX(f)", "=MEDIAN(i)", "=COUNT(f)",
+    "=COLSUM(i)", "=COLSUM(f)", "=i / COLSUM(i)",
+    "=COUNTIF(s, \"a\")", "=SUMIF(s, \"a\", i)", "=AVERAGEIF(s, \"a\", i)",
+    "=GROUPSUM(i, s)", "=GROUPAVG(i, s)", "=GROUPMAX(f, s)", "=GROUPCOUNT(i, s)",
+    "=i>2", "=AND(i>1, f>0)", "=NOT(b)", "=ISNULL(f)", "=ISNAN(f)",
+    "=s&\"x\"", "=i&\"x\"", "=LEN(s)", "=UPPER(s)",
+]
+
+
+def run_kind(res):
+    # 结果数组的实际类型, object 数组按元素推断
+    data = np.ma.getdata(res)
+    if data.dtype == object:
+        kind = pd.api.types.infer_dtype(data, skipna=False)
+        return {'integer': 'int', 'floating': 'float', 'mixed-integer-float': 'float', 'integer-na': 'float',
+                'string': 'str', 'boolean': 'bool'}.get(kind, kind)
+    return {'b': 'bool', 'i': 'int', 'f': 'float', 'U': 'str'}.get(data.dtype.kind)
+
+
+@pytest.fixture(scope="module")
+def parser():
+    df = vaex.from_arrays(i=np.array([0, 1, 2, 3, 4, 5]), j=np.array([3, 2, 1, 0, 1, 2]),
+                          f=np.array([0.5, np.nan, -1.5, 2.0, 3.25, 0.0]),
+                          b=np.array([True, False, True, True, False, False]),
+                          s=np.array(["a", "b", "a", "c", "b", "a"], dtype=object))
+    return Parser(df=df, custom_var_map={})
+
+
+@pytest.mark.parametrize("formula", FORMULAS)
+def test_inferred_kind(parser, formula):
+    # 推断的类型与实际计算结果的类型一致
+    assert parser.infer_type(formula).kind == run_kind(parser.run(formula))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pyarrow as pa
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+from dataframe_formulas.builder import AstBuilder
+
+VALUES = ["a", "b", None, "c", "a", "中文"]
+
+
+def frame():
+    return vaex.from_arrays(s=pa.array(VALUES), o=np.array(VALUES, dtype=object))
+
+
+@pytest.mark.parametrize("column", ["s", "o"])
+@pytest.mark.parametrize("formula, node", [
+    ('={}="a"', 'ISIN({}, "a")'),
+    ('={}<>"a"', 'NOT(ISIN({}, "a"))'),
+    ('=OR({0}="a", {0}="中文")', 'ISIN({}, "a", "中文")'),
+    ('=AND({0}<>"a", {0}<>"b")', 'NOT(ISIN({}, "a", "b"))'),
+    ('=IF({}="x", 1, 2)', 'ISIN({}, "x")'),
+])
+def test_isin_equals_comparison(monkeypatch, column, formula, node):
+    formula, node = formula.format(column), node.format(column)
+    parser = Parser(df=frame(), custom_var_map={})
+    assert node in parser.ast(formula)[1].dsp.nodes
+    res = parser.run(formula)
+    monkeypatch.setattr(AstBuilder, "optimizer_class", None)
+    expected = Parser(df=frame(), custom_var_map={}).run(formula)
+    assert res.dtype == expected.dtype
+    assert res.tolist() == expected.tolist()
+
+
+def test_encoding_dropped_with_column():
+    parser = Parser(df=frame(), custom_var_map={})
+    assert parser.run('=s="a"').tolist() == [True, False, False, False, True, False]
+    df = parser.df.copy()
+    df["s"] = pa.array(["b"] * len(VALUES))
+    parser.set_df(df)
+    assert parser.run('=s="a"').tolist() == [False] * len(VALUES)
+    parser.df["s"] = pa.array(["a"] * len(VALUES))
+    assert parser.run('=s="a"').tolist() == [True] * len(VALUES)
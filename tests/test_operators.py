@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import vaex
+
+from dataframe_formulas import Parser
+
+
+def test_power_overflow():
+    # 整数乘方超出 int64 时不回绕, 超出 uint64 的结果为 nan
+    parser = Parser(df=vaex.from_arrays(i=np.array([10, 20, 2, -3])), custom_var_map={})
+    np.testing.assert_array_equal(parser.run("=i^2"), [100, 400, 4, 9])
+    np.testing.assert_array_equal(parser.run("=i^19"), [1e19, np.nan, 2.0 ** 19, -3.0 ** 19])
+    np.testing.assert_array_equal(parser.run("=i^20"), [np.nan, np.nan, 2.0 ** 20, 3.0 ** 20])
+
+
+def test_power_function_overflow():
+    parser = Parser(df=vaex.from_arrays(i=np.array([10, 20, 2, -3])), custom_var_map={})
+    np.testing.assert_array_equal(parser.run("=POWER(i, 2)"), [100, 400, 4, 9])
+    np.testing.assert_array_equal(parser.run("=POWER(i, 20)"), parser.run("=i^20"))
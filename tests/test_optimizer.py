@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import vaex
+
+from dataframe_formulas import Parser, udf
+from dataframe_formulas.builder import AstBuilder
+
+
+@udf(name="TEST_IMPURE", returns="float", nullable=False, pure=False)
+def _impure(value):
+    return value + 0.5
+
+
+def parser():
+    return Parser(df=vaex.from_arrays(a=np.arange(5.0), n=np.arange(5)), custom_var_map={})
+
+
+def nodes(formula):
+    return set(parser().ast(formula)[1].dsp.nodes)
+
+
+@pytest.mark.parametrize("formula, present, absent", [
+    ("=a+(2*3-1)", {"5", "(5 + a)"}, {"*", "-"}),
+    ("=IF(1>2, a, a*2)", {"(2 * a)"}, {"IF"}),
+    ("=IF(TRUE, a, a/2)", {"a"}, {"IF"}),
+    ("=a*1+0", {"a"}, {"*", "+"}),
+    ("=a&\"\"", {"&"}, set()),
+    ("=IF(TRUE, a, \"x\")", {"IF"}, set()),
+    ("=TEST_IMPURE(1)+a", {"TEST_IMPURE"}, set()),
+])
+def test_folding(formula, present, absent):
+    found = nodes(formula)
+    assert present <= found
+    assert not absent & found
+
+
+@pytest.mark.parametrize("formula", [
+    "=a+(2*3-1)", "=IF(1>2, a, a*2)", "=IF(TRUE, n, n/2)", "=a*1+0", "=n/1", "=n^1-0", "=a&\"\"", "=LEN(\"abc\")*a",
+])
+def test_folding_keeps_result(monkeypatch, formula):
+    expected = parser().run(formula)
+    monkeypatch.setattr(AstBuilder, "optimizer_class", None)
+    res = parser().run(formula)
+    assert res.dtype == expected.dtype
+    assert res.tolist() == expected.tolist()
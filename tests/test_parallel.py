@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+
+
+@pytest.fixture
+def df(tmp_path):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / "data.hdf5")
+    vaex.from_arrays(x=rng.normal(0, 1, 1000), y=rng.integers(0, 100, 1000)).export_hdf5(path)
+    df = vaex.open(path)
+    yield df
+    df.close()
+
+
+def run(df, formula):
+    parser = Parser(df=df, custom_var_map={})
+    parser.parallel_min_rows = 1
+    parallel = parser._parallel_source(parser.ast(formula)[1])
+    return parallel, parser.run(formula), parser.run(formula, workers=2)
+
+
+@pytest.mark.parametrize("transform", [
+    lambda df: df,
+    lambda df: df.sort("x"),
+    lambda df: df.shuffle(),
+    lambda df: df[100:900],
+])
+def test_parallel_rows(df, transform):
+    # 排序、打乱、切片后的数据集与文件行不一致, 串行计算; 结果与串行一致
+    frame = transform(df)
+    parallel, serial, res = run(frame, "=x * 2 + y")
+    assert (parallel is not None) == (frame is df)
+    np.testing.assert_array_equal(serial, res)
+
+
+def test_parallel_replaced_column(df):
+    df["x"] = np.arange(len(df), dtype=float)
+    parallel, serial, res = run(df, "=x * 2 + y")
+    assert parallel is None
+    np.testing.assert_array_equal(serial, res)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import gc
+import weakref
+
+import numpy as np
+import vaex
+
+from dataframe_formulas import Parser
+
+
+def frame():
+    return vaex.from_arrays(a=np.arange(5), b=np.arange(5) * 0.5)
+
+
+def test_parse_cache_hit():
+    # 规范化后相同的公式复用解析结果
+    parser = Parser(df=frame(), custom_var_map={})
+    tokens, builder = parser.ast("=a + b*2")
+    assert parser.ast("= a+b * 2") == (tokens, builder)
+    assert parser.cache_info()["hits"] == 1
+    assert parser.ast("='a + b'")[1] is not builder
+
+
+def test_parse_cache_invalidation():
+    # 引用列的类型变化后重新解析
+    parser = Parser(df=frame(), custom_var_map={})
+    _, builder = parser.ast("=a*2")
+    parser.df["a"] = np.arange(5) * 1.5
+    _, res = parser.ast("=a*2")
+    assert res is not builder
+    np.testing.assert_array_equal(parser.run("=a*2"), np.arange(5) * 3.0)
+
+
+def test_parse_cache_set_df():
+    parser = Parser(df=frame(), custom_var_map={})
+    parser.ast("=a*2")
+    parser.set_df(frame())
+    assert parser.cache_info()["currsize"] == 0
+
+
+def test_parse_cache_releases_frame():
+    # 解析器释放后数据集可被回收
+    df = frame()
+    ref = weakref.ref(df)
+    parser = Parser(df=df, custom_var_map={})
+    parser.add_column("=a+b", column_name="c")
+    del df, parser
+    gc.collect()
+    assert ref() is None
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ("=+a", [1.0, 2.0, 3.0]),
+    ("=(+a)*2", [2.0, 4.0, 6.0]),
+    ("=+a+a", [2.0, 4.0, 6.0]),
+    ("=+(+a)-1", [0.0, 1.0, 2.0]),
+])
+def test_unary_plus(formula, expected):
+    # 一元加号与操作数是同一个节点, 执行计划中的 bypass 指向列引用
+    parser = Parser(df=vaex.from_arrays(a=np.array([1.0, 2.0, 3.0])), custom_var_map={})
+    np.testing.assert_array_equal(parser.run(formula), expected)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+from dataframe_formulas.exceptions import FormulaError
+from dataframe_formulas.resolver import DependencyResolver
+
+
+def derived_parser():
+    # 衍生变量 策略衍生_x = appAge + 1
+    df = vaex.from_arrays(appAge=np.arange(5))
+    info, df = Parser(df=df, custom_var_map={}).add_column("=appAge+1", column_name="x")
+    return Parser(df=df, custom_var_map={"x": dict(info, alias="策略衍生_x")})
+
+
+def test_format_formula_with_derived():
+    # 展开衍生变量时解析其公式, 不覆盖当前公式的格式化公式
+    parser = derived_parser()
+    info, df = parser.add_column("=策略衍生_x*2", column_name="y")
+    assert info["format_formula"] == "=appAge+1*2"
+    assert df["y"].tolist() == [2, 4, 6, 8, 10]
+    info, _ = parser.add_column("=策略衍生_x*3", column_name="z")
+    assert info["format_formula"] == "=appAge+1*3"
+
+
+def fake_parse(calls):
+    # 公式写作 "列,列|衍生变量,衍生变量"
+    def parse(formula):
+        calls.append(formula)
+        columns, _, custom = formula.partition("|")
+        return [c for c in columns.split(",") if c], [c for c in custom.split(",") if c]
+    return parse
+
+
+def test_resolver_expansion():
+    calls = []
+    formulas = {"策略衍生_x": "a|", "策略衍生_y": "b|策略衍生_x", "策略衍生_z": "|策略衍生_x,策略衍生_y"}
+    resolver = DependencyResolver(formulas, fake_parse(calls))
+    assert resolver.expand(["c"], ["策略衍生_z"]) == ({"a", "b", "c"}, {"策略衍生_x", "策略衍生_y", "策略衍生_z"})
+    # 每个衍生变量只解析一次, 同一定义版本的新解析器复用结果
+    assert sorted(calls) == sorted(formulas.values())
+    DependencyResolver(dict(formulas), fake_parse(calls)).resolve("策略衍生_z")
+    assert len(calls) == 3
+
+
+def test_resolver_cycle():
+    formulas = {"策略衍生_p": "a|策略衍生_q", "策略衍生_q": "|策略衍生_r", "策略衍生_r": "|策略衍生_p"}
+    resolver = DependencyResolver(formulas, fake_parse([]))
+    with pytest.raises(FormulaError, match="策略衍生_p -> 策略衍生_q -> 策略衍生_r -> 策略衍生_p"):
+        resolver.resolve("策略衍生_p")
+    with pytest.raises(FormulaError, match="不存在"):
+        resolver.resolve("策略衍生_missing")
+
+
+def test_parser_cycle():
+    custom_var_map = {
+        "p": {"var": "p", "alias": "策略衍生_p", "format_formula": "=策略衍生_q+1"},
+        "q": {"var": "q", "alias": "策略衍生_q", "format_formula": "=策略衍生_p*2"},
+    }
+    df = vaex.from_arrays(appAge=np.arange(3), p=np.arange(3), q=np.arange(3))
+    parser = Parser(df=df, custom_var_map=custom_var_map)
+    with pytest.raises(FormulaError, match="循环引用"):
+        parser.resolver().resolve("策略衍生_p")
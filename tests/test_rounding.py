@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import functools
+import math
+
+import numpy as np
+import pytest
+
+from dataframe_formulas.functions import REGISTRY, Error, to_typed, wrap_ufunc
+from dataframe_formulas.functions import math as xmath
+
+# 逐元素 wrap_ufunc 的旧实现
+LEGACY = {
+    'ROUND': wrap_ufunc(xmath.xround),
+    'ROUNDDOWN': wrap_ufunc(functools.partial(xmath.xround, func=math.floor)),
+    'ROUNDUP': wrap_ufunc(functools.partial(xmath.xround, func=math.ceil)),
+    'CEILING': wrap_ufunc(xmath.xceiling),
+    'CEILING.MATH': wrap_ufunc(xmath.xceiling_math),
+    'FLOOR': wrap_ufunc(functools.partial(xmath.xceiling, ceil=math.floor, dfl=Error.errors['#DIV/0!'])),
+    'EVEN': wrap_ufunc(xmath.xeven),
+}
+
+
+def make_column(rng, rows):
+    # 含恰好为 .5 的值、-0.0 与 nan
+    column = rng.integers(-10**6, 10**6, rows) / 10.0**rng.integers(0, 5, rows)
+    column += rng.choice([0, 0.5, 0.05, 0.005, -0.005], rows)
+    column[::97], column[::89] = np.nan, -0.0
+    return column
+
+
+rng = np.random.default_rng(0)
+column = make_column(rng, 5000)
+digits = rng.integers(-2, 4, 5000)
+
+
+def same(old, new):
+    old, new = to_typed(old), to_typed(new)
+    if old.dtype != new.dtype:
+        return False
+    if old.dtype.kind != 'f':
+        return all(a == b or a != a and b != b for a, b in zip(old, new))
+    return np.array_equal(old, new, equal_nan=True) and np.array_equal(np.signbit(old), np.signbit(new))
+
+
+@pytest.mark.parametrize("name, args", [
+    ('ROUND', (column, 2)),
+    ('ROUND', (column, digits)),
+    ('ROUNDDOWN', (column, 1)),
+    ('ROUNDUP', (column, -1)),
+    ('CEILING', (column, 0.5)),
+    ('CEILING.MATH', (column, 2, 1)),
+    ('FLOOR', (column, 3)),
+    ('FLOOR', (column, 0)),
+    ('EVEN', (column, )),
+])
+def test_kernel_equals_legacy(name, args):
+    assert same(LEGACY[name](*args), REGISTRY[name](*args))
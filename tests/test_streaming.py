@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pyarrow as pa
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+
+
+def frame():
+    rng = np.random.default_rng(0)
+    n = 101
+    return vaex.from_arrays(
+        x=rng.random(n), y=rng.integers(0, 9, n), m=pa.array(rng.random(n), mask=rng.random(n) > .8),
+        s=np.array(["a", "bb", "ccc"], dtype=object)[rng.integers(0, 3, n)])
+
+
+@pytest.mark.parametrize("formula", [
+    "=IF(x>0.5, x*y, y/2)", "=m*2+y", "=y/(y-1)", "=LEN(s)&s", "=x-AVG(x)", "=MAX(y)*x", "=ROUND(x, 1)",
+])
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_chunked_equals_whole(formula, chunk_size):
+    parser = Parser(df=frame(), custom_var_map={})
+    expected, res = parser.run(formula), parser.run(formula, chunk_size=chunk_size)
+    assert type(res) is type(expected)
+    assert res.dtype == expected.dtype
+    assert np.ma.getmaskarray(res).tolist() == np.ma.getmaskarray(expected).tolist()
+    assert res.tolist() == expected.tolist() or np.array_equal(res, expected, equal_nan=True)
+
+
+def test_chunked_into_memmap(tmp_path):
+    parser = Parser(df=frame(), custom_var_map={})
+    expected = parser.run("=IF(x>0.5, x*y, y/2)")
+    out = np.lib.format.open_memmap(str(tmp_path / "out.npy"), mode="w+", dtype="f8", shape=expected.shape)
+    parser.run("=IF(x>0.5, x*y, y/2)", chunk_size=10, out=out)
+    out.flush()
+    assert np.array_equal(np.load(str(tmp_path / "out.npy")), expected)
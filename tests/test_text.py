@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from dataframe_formulas.functions import text, to_typed, wrap_func, wrap_ufunc
+
+# 逐元素 wrap_ufunc 的旧实现
+LEGACY = {
+    'LEN': wrap_ufunc(str.__len__, **text._kw1),
+    'UPPER': wrap_ufunc(str.upper, **text._kw1),
+    'LOWER': wrap_ufunc(str.lower, **text._kw1),
+    'PROPER': wrap_ufunc(str.capitalize, **text._kw1),
+    'MID': wrap_ufunc(text.xmid, **text._kw0),
+    'LEFT': wrap_ufunc(text.xleft, **text._kw0),
+    'RIGHT': wrap_ufunc(text.xright, **text._kw0),
+    'REPLACE': wrap_ufunc(text.xreplace, **text._kw0),
+    'SUBSTITUTE': wrap_ufunc(text.xsubstitute, **text._kw0),
+    'FIND': wrap_ufunc(text.xfind, **text._kw0),
+    'CONCAT': wrap_func(text.xconcat),
+}
+
+# 含中文、空串、缺失值、大小写特例与正则元字符
+column = np.array(["org_1_城市3", "", "straße", "a.b*c", "ǅx", "Hello World", "x_y_z", "İi", None] * 3, dtype=object)
+# 旧实现的 CONCAT 不支持缺失值
+strings = column[[v is not None for v in column]]
+
+
+@pytest.mark.parametrize("name, args", [
+    ('LEN', (column, )),
+    ('UPPER', (column, )),
+    ('LOWER', (column, )),
+    ('PROPER', (column, )),
+    ('MID', (column, 2, 3)),
+    ('MID', (column, 0, 3)),
+    ('LEFT', (column, 3)),
+    ('LEFT', (column, -1)),
+    ('RIGHT', (column, 2)),
+    ('REPLACE', (column, 1, 2, 'ZZ')),
+    ('SUBSTITUTE', (column, '_', '-')),
+    ('SUBSTITUTE', (column, '.', '$1')),
+    ('FIND', ('_', column)),
+    ('FIND', ('_', column, 3)),
+    ('CONCAT', (strings, '-', strings)),
+])
+def test_kernel_equals_legacy(name, args):
+    old, new = to_typed(LEGACY[name](*args)), to_typed(text.FUNCTIONS[name](*args))
+    assert old.dtype == new.dtype
+    assert [str(v) for v in old.tolist()] == [str(v) for v in new.tolist()]
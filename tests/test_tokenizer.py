@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+from dataframe_formulas.exceptions import FormulaError, TokenError
+from dataframe_formulas.tokens.parenthesis import Parenthesis
+
+
+def legacy_tokens(parser, expression):
+    # 逐个尝试 token 类并切片剩余字符串的旧实现
+    expr = parser._formula(expression).groupdict()['name']
+    builder = parser.ast_builder(df=parser.df, custom_var_map=parser.custom_var_map)
+    tokens, stack = [], []
+    Parenthesis('(').ast(tokens, stack, builder)
+    while expr:
+        for f in parser.filters:
+            try:
+                token = f(expr)
+                token.ast(tokens, stack, builder)
+                expr = expr[token.end_match:]
+                break
+            except TokenError:
+                pass
+        else:
+            raise FormulaError()
+    Parenthesis(')').ast(tokens, stack, builder)
+    return tokens[1:-1]
+
+
+@pytest.fixture(scope="module")
+def parser():
+    return Parser(df=vaex.from_arrays(a=np.arange(3), b=np.arange(3.0), s=np.array(["x", "y", "z"], dtype=object)),
+                  custom_var_map={})
+
+
+@pytest.mark.parametrize("formula", [
+    "=a+b*2",
+    "=-a--b+ +1",
+    "=a^2.5e-1%",
+    "=IF(a > 1, 'x''y', \"z\") & s",
+    "=ROUND(a / (b + 1), 2) <> 0",
+    "=a>=b",
+    "=TRUE+FALSE",
+    "=#DIV/0!",
+    "=MAX(1/0, 2)",
+    "=CONCAT(s, \"a,b\", LEN(s))",
+    "= ( a + b ) * ( a - b )",
+])
+def test_scanner_equals_legacy(parser, formula):
+    old, new = legacy_tokens(parser, formula), parser._parse(formula).tokens
+    assert [(type(t), t.name) for t in old] == [(type(t), t.name) for t in new]
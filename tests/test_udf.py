@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import vaex
+
+from dataframe_formulas import Parser, udf
+
+
+@udf(name="TEST_NZ", inputs=[None], nulls="pass")
+def _nz(value):
+    return -1 if value is None else value
+
+
+@udf(name="TEST_INC")
+def _inc(value):
+    return value + 1
+
+
+def masked_parser():
+    return Parser(df=vaex.from_arrays(a=np.ma.array([1, 2, 3], mask=[0, 1, 0])), custom_var_map={})
+
+
+def test_scalar_nulls_pass():
+    assert masked_parser().run("=TEST_NZ(a)").tolist() == [1, -1, 3]
+
+
+def test_scalar_nulls_propagate():
+    res = masked_parser().run("=TEST_INC(a)")
+    assert np.ma.getmaskarray(res).tolist() == [False, True, False]
+    assert res[[0, 2]].tolist() == [2, 4]
+
+
+@udf(name="Test_Twice", vectorized=True, inputs=["float"], returns="float", nullable=False)
+def _twice(values):
+    return values * 2
+
+
+def test_vectorized_and_fallback():
+    parser = Parser(df=vaex.from_arrays(f=np.array([1.5, 2.0]), s=np.array(["a", "b"], dtype=object)),
+                    custom_var_map={})
+    assert parser.run("=test_twice(f)").tolist() == [3.0, 4.0]
+    assert parser.run("=TEST_TWICE(s)").tolist() == ["aa", "bb"]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+
+CUSTOM_VAR_MAP = {"k": {"alias": "策略衍生_d1", "var": "d1", "format_formula": "=x*2+y"}}
+FORMULAS = [("d1", "=x*2+y"), ("d2", "=IF(策略衍生_d1>50, 1, 0)"), ("d3", "=d2+AVG(y)"), ("d4", "=UPPER(s)&x"),
+            ("d5", "=d3*2")]
+
+
+def frame(n, seed):
+    rng = np.random.default_rng(seed)
+    return vaex.from_arrays(x=rng.integers(0, 100, n), y=rng.random(n) * 10,
+                            s=np.array(["a", "b", None, "c"], dtype=object)[rng.integers(0, 4, n)])
+
+
+def build(df, virtual=False):
+    parser = Parser(df=df, custom_var_map=CUSTOM_VAR_MAP)
+    for name, formula in FORMULAS:
+        parser.add_column(formula, column_name=name, virtual=virtual and name == "d1")
+    return parser
+
+
+def assert_same(df, expected):
+    for name, _ in FORMULAS:
+        np.testing.assert_array_equal(df[name].to_numpy(), expected[name].to_numpy())
+
+
+@pytest.mark.parametrize("virtual", [False, True])
+def test_update_appended_rows(virtual):
+    base, new = frame(50, 0), frame(20, 1)
+    parser = build(base.copy(), virtual)
+    infos, df = parser.update(vaex.concat([parser.df, new]))
+    assert [i["var"] for i in infos] == ["d1", "d2", "d3", "d4", "d5"]
+    assert_same(df, build(vaex.concat([base, new])).df)
+
+
+@pytest.mark.parametrize("virtual", [False, True])
+def test_update_changed_columns(virtual):
+    base = frame(50, 0)
+    parser = build(base.copy(), virtual)
+    df = parser.df.copy()
+    df["s"] = np.array(["z"] * len(df), dtype=object)
+    infos, df = parser.update(df, changed_columns=["s"])
+    assert [i["var"] for i in infos] == ["d4"]
+    expected = base.copy()
+    expected["s"] = np.array(["z"] * len(expected), dtype=object)
+    assert_same(df, build(expected.copy()).df)
+
+    df = df.copy()
+    df["y"] = df["y"].to_numpy() + 1
+    infos, df = parser.update(df, changed_columns=["y"])
+    assert [i["var"] for i in infos] == ["d1", "d2", "d3", "d5"]
+    expected["y"] = expected["y"].to_numpy() + 1
+    assert_same(df, build(expected.copy()).df)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import vaex
+
+from dataframe_formulas import Parser
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ("=TRUE+appAge", [1, 2, 3]),
+    ("=appAge*FALSE-TRUE", [-1, -1, -1]),
+])
+def test_bool_literal(formula, expected):
+    parser = Parser(df=vaex.from_arrays(appAge=np.arange(3)), custom_var_map={})
+    info, df = parser.add_column(formula, column_name="v", virtual=True)
+    assert info["virtual"]
+    assert df["v"].tolist() == expected
+
+
+@pytest.mark.parametrize("formula", ["=appAge^2", "=appAge^19", "=appAge^20", "=LOG(appAge, 0)", "=LOG(f, appAge)"])
+def test_virtual_equals_materialized(formula):
+    df = vaex.from_arrays(appAge=np.array([10, 20, 30, 40, 2, -3, 0]), f=np.array([1.5, 2, 0.5, 4, 5, 6, 0]))
+    parser = Parser(df=df, custom_var_map={})
+    info, df = parser.add_column(formula, column_name="v", virtual=True)
+    assert info["virtual"]
+    info, df = parser.add_column(formula, column_name="m", virtual=False)
+    np.testing.assert_array_equal(df["v"].to_numpy().astype(float), df["m"].to_numpy().astype(float))